@@ -0,0 +1,134 @@
+"""Compare full and projected reads of the booking conflict query.
+
+Offline (no database needed) it encodes synthetic appointment documents and
+times decoding them as dicts, as projected dicts and as raw BSON::
+
+    python bench_hot_queries.py --docs 20000
+
+With ``--mongo-url`` it also runs the real conflict query against a salon-day
+and reports wall time, bytes returned and ``totalDocsExamined`` from explain,
+which is 0 when the covered index answers the query::
+
+    python bench_hot_queries.py --mongo-url mongodb://localhost:27017 --salon "Elegant Cuts"
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import bson
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from pymongo import MongoClient
+
+from modules.capacity import SLOT_PROJECTION, overlap_query
+
+RAW_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+
+def synthetic_appointments(count, seed=7):
+    rng = random.Random(seed)
+    day = datetime(2025, 1, 6, 9, 0)
+    docs = []
+    for i in range(count):
+        start = day + timedelta(minutes=15 * rng.randrange(40))
+        docs.append({
+            "_id": bson.ObjectId(),
+            "customer_name": f"Customer {i}",
+            "salon": "Elegant Cuts",
+            "salon_id": "65a000000000000000000001",
+            "service": "Haircut",
+            "service_id": "65a000000000000000000002",
+            "chair": rng.randrange(3),
+            "appointment_time": start,
+            "end_time": start + timedelta(minutes=30),
+            "status": "scheduled",
+            "idempotency_key": f"{rng.getrandbits(128):032x}",
+            "created_at": day,
+        })
+    return docs
+
+
+def time_decode(payloads, codec_options=None, rounds=5):
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for payload in payloads:
+            doc = bson.decode(payload, codec_options) if codec_options else bson.decode(payload)
+            doc["appointment_time"]
+            doc["end_time"]
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def offline(count):
+    docs = synthetic_appointments(count)
+    full = [bson.encode(doc) for doc in docs]
+    projected = [
+        bson.encode({field: doc[field] for field in SLOT_PROJECTION if SLOT_PROJECTION[field] and field in doc})
+        for doc in docs
+    ]
+    print(f"Offline decode of {count} appointments (best of 5)")
+    rows = [
+        ("full dict", full, None),
+        ("projected dict", projected, None),
+        ("projected raw", projected, RAW_OPTIONS),
+    ]
+    for label, payloads, options in rows:
+        seconds = time_decode(payloads, options)
+        size = sum(len(p) for p in payloads)
+        print(f"  {label:<15} {seconds * 1000:8.1f} ms  {size / 1024:9.1f} KiB")
+
+
+def live(mongo_url, salon_name, day):
+    client = MongoClient(mongo_url, serverSelectionTimeoutMS=5000)
+    db = client.salon_db
+    try:
+        salon = db.salons.find_one({"name": salon_name})
+        if salon is None:
+            print(f"Salon {salon_name!r} not found")
+            return
+        if day is None:
+            latest = db.appointments.find_one(
+                {"salon_id": str(salon["_id"])}, sort=[("appointment_time", -1)]
+            )
+            day = (latest["appointment_time"] if latest else datetime.now()).date()
+        day_start = datetime.combine(day, datetime.min.time())
+        query = overlap_query(salon["_id"], day_start, day_start + timedelta(days=1))
+
+        print(f"Conflict query for {salon_name} on {day}")
+        raw = db.appointments.with_options(codec_options=RAW_OPTIONS)
+        for label, projection in (("full", None), ("projected", SLOT_PROJECTION)):
+            started = time.perf_counter()
+            docs = list(db.appointments.find(query, projection))
+            elapsed = time.perf_counter() - started
+            size = sum(len(doc.raw) for doc in raw.find(query, projection))
+            plan = db.appointments.find(query, projection).explain()
+            examined = plan.get("executionStats", {}).get("totalDocsExamined")
+            print(f"  {label:<10} {len(docs):6d} docs  {elapsed * 1000:8.1f} ms  "
+                  f"{size / 1024:9.1f} KiB  docs examined: {examined}")
+
+        started = time.perf_counter()
+        exists = db.appointments.find_one(query, {"appointment_time": 1, "_id": 0}) is not None
+        print(f"  exists     {exists!s:>6}       {(time.perf_counter() - started) * 1000:8.1f} ms")
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark projected reads on the booking hot path")
+    parser.add_argument("--docs", type=int, default=20000, help="synthetic documents for the offline decode run")
+    parser.add_argument("--mongo-url", help="also run the conflict query against this server")
+    parser.add_argument("--salon", default="Elegant Cuts")
+    parser.add_argument("--day", type=lambda s: datetime.strptime(s, "%Y-%m-%d").date(),
+                        help="day to query (YYYY-MM-DD); defaults to the salon's latest booking")
+    args = parser.parse_args()
+
+    offline(args.docs)
+    if args.mongo_url:
+        live(args.mongo_url, args.salon, args.day)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""Find (and optionally cancel) appointments that overbook a salon.
+
+Each salon's scheduled appointments are streamed from a cursor sorted by
+start time and swept once, keeping only the bookings still in progress in a
+heap, so memory depends on how many bookings overlap rather than on how
+many there are. Salons are checked in parallel in a process pool::
+
+    python check_overbooking.py --workers 8 --report overbooking.json
+    python check_overbooking.py --salon "Elegant Cuts" --fix
+
+When a salon (or a capacity-limited service) has more overlapping bookings
+than chairs, the most recently created booking in the overlap is the
+conflict; ``--fix`` cancels those bookings. Occurrences of recurring series
+count towards the load but are never cancelled.
+"""
+import argparse
+import heapq
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from heapq import merge
+
+from pymongo import MongoClient
+
+from modules.capacity import salon_capacity, service_capacity
+from modules.recurrence import iter_occurrences, series_window_query
+from modules.timeutil import format_local, salon_zone
+
+APPOINTMENT_FIELDS = {"appointment_time": 1, "end_time": 1, "service_id": 1}
+
+_client = None
+
+
+class Sweep:
+    """Bookings in progress at the current start time, as a heap of end times"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.active = []
+        self._seq = itertools.count()
+
+    def add(self, start, end, booking_id):
+        """Add a booking; return the id of the booking to drop if capacity is exceeded"""
+        while self.active and self.active[0][0] <= start:
+            heapq.heappop(self.active)
+        heapq.heappush(self.active, (end, next(self._seq), booking_id))
+        if len(self.active) <= self.capacity:
+            return None
+        # Series occurrences (id None) can't be dropped; ObjectIds sort by creation
+        concrete = [item for item in self.active if item[2] is not None]
+        if not concrete:
+            return None
+        victim = max(concrete, key=lambda item: item[2])
+        self.active.remove(victim)
+        heapq.heapify(self.active)
+        return victim[2]
+
+    def discard(self, booking_id):
+        for i, item in enumerate(self.active):
+            if item[2] == booking_id:
+                self.active.pop(i)
+                heapq.heapify(self.active)
+                return
+
+
+def _init_worker(mongo_url):
+    global _client
+    _client = MongoClient(mongo_url, serverSelectionTimeoutMS=5000)
+
+
+def _appointment_query(db, salon, since):
+    salon_id = str(salon["_id"])
+    query = {"salon_id": salon_id, "status": "scheduled"}
+    # Bookings made before salon_id was stored only carry the salon name
+    if db.appointments.find_one({"salon": salon["name"], "salon_id": {"$exists": False}}, {"_id": 1}):
+        query = {
+            "$or": [{"salon_id": salon_id}, {"salon": salon["name"], "salon_id": {"$exists": False}}],
+            "status": "scheduled",
+        }
+    if since is not None:
+        query["end_time"] = {"$gt": since}
+    return query
+
+
+def _bookings(db, query, batch_size):
+    cursor = db.appointments.find(query, APPOINTMENT_FIELDS, batch_size=batch_size, allow_disk_use=True)
+    for doc in cursor.sort("appointment_time", 1):
+        yield doc["appointment_time"], doc["end_time"], doc.get("service_id"), doc["_id"]
+
+
+def _occurrences(db, salon, window_start, window_end):
+    series_list = db.appointment_series.find(
+        series_window_query(salon["_id"], window_start, window_end),
+        {"rrule": 1, "dtstart": 1, "duration": 1, "exdates": 1, "service_id": 1},
+    )
+    streams = [
+        ((start, end, series.get("service_id"), None) for start, end in iter_occurrences(series, window_start, window_end))
+        for series in series_list
+    ]
+    return merge(*streams, key=lambda occurrence: occurrence[0])
+
+
+def _cancel(db, ids):
+    if ids:
+        db.appointments.update_many(
+            {"_id": {"$in": ids}, "status": "scheduled"},
+            {"$set": {"status": "cancelled", "cancelled_reason": "overbooked", "cancelled_at": datetime.utcnow()}}
+        )
+
+
+def check_salon(salon, services, since, fix, batch_size, max_report):
+    """Sweep one salon; runs in a worker process"""
+    db = _client.salon_db
+    started = time.perf_counter()
+    query = _appointment_query(db, salon, since)
+
+    first = db.appointments.find_one(query, {"appointment_time": 1}, sort=[("appointment_time", 1)])
+    last = db.appointments.find_one(query, {"end_time": 1}, sort=[("appointment_time", -1)])
+    stream = _bookings(db, query, batch_size)
+    if first is not None:
+        # Series only matter where they can collide with concrete bookings
+        window_start = max(first["appointment_time"], since) if since else first["appointment_time"]
+        window_end = last["end_time"] + timedelta(minutes=1)
+        stream = merge(stream, _occurrences(db, salon, window_start, window_end), key=lambda item: item[0])
+
+    zone = salon_zone(salon)
+    salon_sweep = Sweep(salon_capacity(salon))
+    service_sweeps = {}
+    for service in services:
+        limit = service_capacity(salon, service)
+        if limit is not None:
+            service_sweeps[str(service["_id"])] = Sweep(limit)
+
+    scanned = 0
+    conflicts = 0
+    samples = []
+    pending_fix = []
+    for start, end, service_id, booking_id in stream:
+        if booking_id is not None:
+            scanned += 1
+        victims = set()
+        victim = salon_sweep.add(start, end, booking_id)
+        if victim is not None:
+            victims.add(victim)
+        service_sweep = service_sweeps.get(service_id)
+        if service_sweep is not None:
+            victim = service_sweep.add(start, end, booking_id)
+            if victim is not None:
+                victims.add(victim)
+                salon_sweep.discard(victim)
+        for victim in victims:
+            for sweep in service_sweeps.values():
+                sweep.discard(victim)
+            conflicts += 1
+            if len(samples) < max_report:
+                samples.append({"appointment_id": str(victim), "overlaps_at": format_local(start, zone)})
+            if fix:
+                pending_fix.append(victim)
+                if len(pending_fix) >= batch_size:
+                    _cancel(db, pending_fix)
+                    pending_fix = []
+    if fix:
+        _cancel(db, pending_fix)
+
+    return {
+        "salon": salon["name"],
+        "salon_id": str(salon["_id"]),
+        "capacity": salon_sweep.capacity,
+        "timezone": zone.key,
+        "scanned": scanned,
+        "conflicts": conflicts,
+        "cancelled": conflicts if fix else 0,
+        "seconds": round(time.perf_counter() - started, 3),
+        "samples": samples,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Check salons for overlapping bookings beyond their capacity")
+    parser.add_argument("--mongo-url", default=os.getenv("SALONOVA_MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--salon", action="append", help="Only check this salon (repeatable)")
+    parser.add_argument("--since", type=lambda s: datetime.strptime(s, "%Y-%m-%d"),
+                        help="Only check bookings ending after this day (YYYY-MM-DD, each salon's local time)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Salons checked in parallel")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Cursor batch and cancellation batch size")
+    parser.add_argument("--max-report", type=int, default=100, help="Conflicts listed per salon in the report")
+    parser.add_argument("--report", help="Write the per-salon results to this JSON file")
+    parser.add_argument("--fix", action="store_true", help="Cancel the conflicting bookings")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    client = MongoClient(args.mongo_url, serverSelectionTimeoutMS=5000)
+    db = client.salon_db
+    salon_filter = {"name": {"$in": args.salon}} if args.salon else {}
+    salons = list(db.salons.find(salon_filter, {"name": 1, "capacity": 1, "staff": 1, "timezone": 1}))
+    services = {}
+    for service in db.services.find({}, {"name": 1, "salon_id": 1, "capacity": 1}):
+        services.setdefault(service["salon_id"], []).append(service)
+    client.close()
+
+    results = []
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(args.mongo_url,)) as pool:
+        futures = [
+            pool.submit(check_salon, salon, services.get(str(salon["_id"]), []),
+                        args.since, args.fix, args.batch_size, args.max_report)
+            for salon in salons
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result["conflicts"]:
+                print(f"{result['salon']}: {result['conflicts']} overbooked of {result['scanned']} "
+                      f"(capacity {result['capacity']})")
+
+    scanned = sum(result["scanned"] for result in results)
+    conflicts = sum(result["conflicts"] for result in results)
+    action = "cancelled" if args.fix else "found"
+    print(f"Checked {scanned} appointments in {len(results)} salons in {time.perf_counter() - started:.1f}s; "
+          f"{conflicts} overbooked appointments {action}")
+    if args.fix and conflicts:
+        print("Analytics rollups still count the cancelled bookings; rebuild them with POST /api/admin/analytics/rebuild")
+
+    if args.report:
+        results.sort(key=lambda result: result["conflicts"], reverse=True)
+        with open(args.report, "w") as f:
+            json.dump({"scanned": scanned, "conflicts": conflicts, "fixed": args.fix, "salons": results}, f, indent=2)
+        print(f"Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
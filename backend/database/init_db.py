@@ -1,12 +1,12 @@
 import sqlite3
 import os
 
-def init_database():
+def init_database(db_path="backend/data/salonova.db", sample_data=True):
     # Ensure the data directory exists
-    os.makedirs("backend/data", exist_ok=True)
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
     
     # Connect to database
-    conn = sqlite3.connect("backend/data/salonova.db")
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
     # Create salons table
@@ -63,21 +63,22 @@ def init_database():
     END;
     ''')
 
-    # Insert some sample salons
-    cursor.execute('''
-    INSERT OR IGNORE INTO salons (name, address, phone, email) VALUES 
-    ('StyleSalon', '123 Main St', '555-0101', 'style@salon.com'),
-    ('BeautyHub', '456 Park Ave', '555-0102', 'beauty@hub.com'),
-    ('HairArt', '789 Oak Rd', '555-0103', 'hair@art.com')
-    ''')
+    if sample_data:
+        # Insert some sample salons
+        cursor.execute('''
+        INSERT OR IGNORE INTO salons (name, address, phone, email) VALUES 
+        ('StyleSalon', '123 Main St', '555-0101', 'style@salon.com'),
+        ('BeautyHub', '456 Park Ave', '555-0102', 'beauty@hub.com'),
+        ('HairArt', '789 Oak Rd', '555-0103', 'hair@art.com')
+        ''')
 
-    # Insert some sample services
-    cursor.execute('''
-    INSERT OR IGNORE INTO services (name, description, duration, price) VALUES 
-    ('Haircut', 'Basic haircut and styling', 30, 35.00),
-    ('Massage', 'Full body relaxation massage', 60, 75.00),
-    ('Manicure', 'Basic manicure with polish', 45, 25.00)
-    ''')
+        # Insert some sample services
+        cursor.execute('''
+        INSERT OR IGNORE INTO services (name, description, duration, price) VALUES 
+        ('Haircut', 'Basic haircut and styling', 30, 35.00),
+        ('Massage', 'Full body relaxation massage', 60, 75.00),
+        ('Manicure', 'Basic manicure with polish', 45, 25.00)
+        ''')
 
     # Create index for faster appointment lookups
     cursor.execute('''
@@ -1,8 +1,16 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from bson import ObjectId
+import argparse
 import asyncio
-from datetime import datetime, timedelta
-import pytz
+import hashlib
+import json
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, time
+
+from modules.analytics import appointment_collections, rebuild_rollups
+from modules.timeutil import DEFAULT_TIMEZONE, today_local
 
 async def init_db():
     # Connect to MongoDB
@@ -24,6 +32,7 @@ async def init_db():
                 "email": "elegant@cuts.com",
                 "opening_time": "09:00",  # 9 AM
                 "closing_time": "17:00",  # 5 PM
+                "location": {"type": "Point", "coordinates": [72.5714, 23.0225]},  # [lng, lat]
                 "services": []
             },
             {
@@ -33,6 +42,7 @@ async def init_db():
                 "email": "style@studio.com",
                 "opening_time": "10:00",  # 10 AM
                 "closing_time": "18:00",  # 6 PM
+                "location": {"type": "Point", "coordinates": [72.5293, 23.0338]},
                 "services": []
             }
         ]
@@ -85,6 +95,8 @@ async def init_db():
             )
 
         print("Database initialized with sample data!")
+        # Dashboards read the rollups, not the appointments
+        await rebuild_rollups(db)
         
         # Verify the data
         salons_count = await db.salons.count_documents({})
@@ -97,5 +109,298 @@ async def init_db():
     finally:
         client.close()
 
+# ---------------------------------------------------------------------------
+# Synthetic large-scale dataset
+#
+#   python backend/init_db.py --salons 500 --services-per-salon 6 --months 6
+#   python backend/init_db.py --salons 50 --target sqlite --output backend/data/synthetic.db
+#   python backend/init_db.py --salons 50 --target json --output /tmp/salonova-data
+#
+# Every salon draws from its own RNG seeded with (--seed, salon index), so a
+# run is reproducible no matter how the per-salon writers are scheduled.
+# ---------------------------------------------------------------------------
+
+SERVICE_CATALOG = [
+    ("Haircut", "Basic haircut and styling", 30, 30.00),
+    ("Color Treatment", "Hair coloring service", 90, 100.00),
+    ("Manicure", "Basic manicure service", 45, 35.00),
+    ("Pedicure", "Basic pedicure service", 60, 45.00),
+    ("Beard Trim", "Beard shaping and trim", 15, 15.00),
+    ("Blow Dry", "Wash and blow dry", 30, 25.00),
+    ("Facial", "Cleansing facial", 60, 55.00),
+    ("Keratin Treatment", "Smoothing keratin treatment", 120, 150.00),
+    ("Head Massage", "Relaxing head massage", 20, 20.00),
+    ("Bridal Makeup", "Full bridal makeup", 120, 250.00),
+]
+
+BUSINESS_HOURS = [("09:00", "17:00"), ("10:00", "18:00"), ("09:00", "20:00"), ("11:00", "21:00")]
+
+# Relative demand per hour of day: late morning and after-work peaks
+HOUR_WEIGHTS = {9: 1.0, 10: 2.0, 11: 3.0, 12: 3.5, 13: 2.5, 14: 2.0, 15: 2.0,
+                16: 2.5, 17: 3.5, 18: 4.0, 19: 3.0, 20: 1.5}
+# Monday..Sunday; weekends are busiest
+WEEKDAY_WEIGHTS = [0.7, 0.8, 0.9, 1.0, 1.2, 1.5, 1.3]
+
+CITIES = [("Mumbai", 19.07, 72.87), ("Delhi", 28.61, 77.21), ("Bengaluru", 12.97, 77.59),
+          ("Ahmedabad", 23.02, 72.57), ("Pune", 18.52, 73.86), ("Chennai", 13.08, 80.27)]
+FIRST_NAMES = ["Aarav", "Diya", "Vivaan", "Ananya", "Ishaan", "Saanvi", "Kabir", "Myra",
+               "Arjun", "Anika", "Reyansh", "Kiara", "Vihaan", "Aadhya", "Rohan", "Meera"]
+LAST_NAMES = ["Shah", "Patel", "Mehta", "Iyer", "Reddy", "Kapoor", "Nair", "Desai", "Joshi", "Rao"]
+
+
+def stable_object_id(seed, *parts):
+    """ObjectId derived from the seed, so re-runs produce the same ids"""
+    key = ":".join(str(p) for p in (seed,) + parts)
+    return ObjectId(hashlib.md5(key.encode()).digest()[:12])
+
+
+def clock_minutes(value):
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def generate_salon(seed, index, services_per_salon):
+    rng = random.Random(f"{seed}:salon:{index}")
+    city, lat, lng = rng.choice(CITIES)
+    opening_time, closing_time = rng.choice(BUSINESS_HOURS)
+    salon_id = stable_object_id(seed, "salon", index)
+    picked = rng.sample(SERVICE_CATALOG, min(services_per_salon, len(SERVICE_CATALOG)))
+    services = []
+    for s_index, (name, description, duration, price) in enumerate(picked):
+        services.append({
+            "_id": stable_object_id(seed, "service", index, s_index),
+            "name": name,
+            "description": description,
+            "duration": duration,
+            "price": round(price * rng.uniform(0.8, 1.4), 2),
+            "salon_id": str(salon_id)
+        })
+    salon = {
+        "_id": salon_id,
+        "name": f"Salonova {city} {index:05d}",
+        "address": f"{rng.randint(1, 999)} {rng.choice(['Main St', 'Park Ave', 'MG Road', 'Link Road'])}, {city}",
+        "phone": f"555-{index:06d}",
+        "email": f"salon{index}@salonova.example",
+        "opening_time": opening_time,
+        "closing_time": closing_time,
+        "capacity": rng.randint(1, 10),
+        "location": {"type": "Point", "coordinates": [
+            round(lng + rng.uniform(-0.2, 0.2), 6), round(lat + rng.uniform(-0.2, 0.2), 6)
+        ]},
+        "services": [str(service["_id"]) for service in services]
+    }
+    return salon, services
+
+
+def generate_appointments(seed, index, salon, services, start_day, days, density, today):
+    """Yield one salon's appointments day by day, never holding more than a day in memory.
+
+    ``density`` is the target share of chair-minutes booked on an average
+    day; demand is shaped by HOUR_WEIGHTS and WEEKDAY_WEIGHTS, and a booking
+    is only placed on a chair that is free for its whole duration.
+    """
+    rng = random.Random(f"{seed}:appointments:{index}")
+    opening = clock_minutes(salon["opening_time"])
+    closing = clock_minutes(salon["closing_time"])
+    hours = [h for h in range(opening // 60, (closing - 1) // 60 + 1)]
+    hour_weights = [HOUR_WEIGHTS.get(h, 0.5) for h in hours]
+    mean_duration = sum(s["duration"] for s in services) / len(services)
+    chair_minutes = salon["capacity"] * (closing - opening)
+
+    for offset in range(days):
+        day = start_day + timedelta(days=offset)
+        target = density * WEEKDAY_WEIGHTS[day.weekday()] * chair_minutes / mean_duration
+        bookings = max(0, int(rng.gauss(target, target ** 0.5 if target > 0 else 0)))
+        chairs = [[] for _ in range(salon["capacity"])]
+        day_start = datetime.combine(day, time.min)
+        for _ in range(bookings):
+            service = rng.choice(services)
+            hour = rng.choices(hours, weights=hour_weights)[0]
+            start = max(opening, hour * 60 + rng.choice([0, 15, 30, 45]))
+            end = start + service["duration"]
+            if end > closing:
+                continue
+            chair = next(
+                (c for c, taken in enumerate(chairs) if all(end <= s or start >= e for s, e in taken)),
+                None
+            )
+            if chair is None:
+                continue
+            chairs[chair].append((start, end))
+            if day < today:
+                status = "cancelled" if rng.random() < 0.05 else "completed"
+            else:
+                status = "cancelled" if rng.random() < 0.03 else "scheduled"
+            yield {
+                "customer_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                "salon": salon["name"],
+                "service": service["name"],
+                "salon_id": str(salon["_id"]),
+                "service_id": str(service["_id"]),
+                "chair": chair,
+                "appointment_time": day_start + timedelta(minutes=start),
+                "end_time": day_start + timedelta(minutes=end),
+                "status": status,
+                "timezone": DEFAULT_TIMEZONE
+            }
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def dataset_window(months):
+    """K months of history and bookings, ending a month from today (salon-local)"""
+    today = today_local().date()
+    end_day = today + timedelta(days=30)
+    days = max(1, months * 30)
+    return end_day - timedelta(days=days), days, today
+
+
+async def generate_mongo(args):
+    client = AsyncIOMotorClient(args.mongo_url)
+    db = client.salon_db
+    start_day, days, today = dataset_window(args.months)
+    semaphore = asyncio.Semaphore(args.writers)
+    totals = {"appointments": 0}
+
+    async def write_salon(index):
+        async with semaphore:
+            salon, services = generate_salon(args.seed, index, args.services_per_salon)
+            await db.salons.insert_one(salon)
+            await db.services.insert_many(services)
+            for batch in batched(
+                generate_appointments(args.seed, index, salon, services, start_day, days, args.density, today),
+                args.batch_size
+            ):
+                await db.appointments.insert_many(batch, ordered=False)
+                totals["appointments"] += len(batch)
+
+    try:
+        await db.salons.delete_many({})
+        await db.services.delete_many({})
+        await db.appointments.delete_many({})
+        # Archived bookings of the old data would otherwise count in the rebuilt rollups
+        for name in (await appointment_collections(db))[1:]:
+            await db.drop_collection(name)
+        await asyncio.gather(*(write_salon(i) for i in range(args.salons)))
+        print(f"Generated {args.salons} salons and {totals['appointments']} appointments in MongoDB")
+        counted = await rebuild_rollups(db)
+        print(f"Rebuilt analytics rollups from {counted} bookings")
+    finally:
+        client.close()
+
+
+def generate_sqlite(args):
+    import sqlite3
+    from database.init_db import init_database
+
+    path = args.output or "backend/data/synthetic.db"
+    if os.path.exists(path):
+        os.remove(path)
+    init_database(path, sample_data=False)
+    start_day, days, today = dataset_window(args.months)
+    # The SQLite schema has its own status vocabulary
+    statuses = {"scheduled": "confirmed", "completed": "completed", "cancelled": "cancelled"}
+
+    conn = sqlite3.connect(path)
+    total = 0
+    try:
+        # SQLite has a single writer, so salons are written one after another
+        for index in range(args.salons):
+            salon, services = generate_salon(args.seed, index, args.services_per_salon)
+            cursor = conn.execute(
+                "INSERT INTO salons (name, address, phone, email) VALUES (?, ?, ?, ?)",
+                (salon["name"], salon["address"], salon["phone"], salon["email"])
+            )
+            salon_rowid = cursor.lastrowid
+            service_rowids = {}
+            for service in services:
+                cursor = conn.execute(
+                    "INSERT INTO services (name, description, duration, price) VALUES (?, ?, ?, ?)",
+                    (service["name"], service["description"], service["duration"], service["price"])
+                )
+                service_rowids[str(service["_id"])] = cursor.lastrowid
+            for batch in batched(
+                generate_appointments(args.seed, index, salon, services, start_day, days, args.density, today),
+                args.batch_size
+            ):
+                conn.executemany(
+                    "INSERT INTO appointments (salon_id, service_id, customer_name, customer_email, "
+                    "appointment_date, start_time, end_time, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(
+                        salon_rowid,
+                        service_rowids[appt["service_id"]],
+                        appt["customer_name"],
+                        appt["customer_name"].lower().replace(" ", ".") + "@example.com",
+                        appt["appointment_time"].date().isoformat(),
+                        appt["appointment_time"].strftime("%H:%M"),
+                        appt["end_time"].strftime("%H:%M"),
+                        statuses[appt["status"]]
+                    ) for appt in batch]
+                )
+                total += len(batch)
+            conn.commit()
+    finally:
+        conn.close()
+    print(f"Generated {args.salons} salons and {total} appointments in {path}")
+
+
+def generate_json(args):
+    output = args.output or "backend/data/synthetic"
+    os.makedirs(os.path.join(output, "appointments"), exist_ok=True)
+    start_day, days, today = dataset_window(args.months)
+
+    def write_salon(index):
+        salon, services = generate_salon(args.seed, index, args.services_per_salon)
+        count = 0
+        path = os.path.join(output, "appointments", f"{salon['_id']}.jsonl")
+        with open(path, "w") as f:
+            for appt in generate_appointments(args.seed, index, salon, services, start_day, days, args.density, today):
+                f.write(json.dumps(appt, default=str) + "\n")
+                count += 1
+        return salon, services, count
+
+    with ThreadPoolExecutor(max_workers=args.writers) as pool:
+        results = list(pool.map(write_salon, range(args.salons)))
+
+    with open(os.path.join(output, "salons.json"), "w") as f:
+        json.dump([salon for salon, _, _ in results], f, default=str)
+    with open(os.path.join(output, "services.json"), "w") as f:
+        json.dump([service for _, services, _ in results for service in services], f, default=str)
+    total = sum(count for _, _, count in results)
+    print(f"Generated {args.salons} salons and {total} appointments in {output}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Seed sample data or generate a large synthetic dataset")
+    parser.add_argument("--salons", type=int, help="Number of salons to generate (omit for the small sample data)")
+    parser.add_argument("--services-per-salon", type=int, default=4)
+    parser.add_argument("--months", type=int, default=3, help="Months of appointments, ending a month from today")
+    parser.add_argument("--density", type=float, default=0.6, help="Average share of chair time that is booked")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--target", choices=["mongo", "sqlite", "json"], default="mongo")
+    parser.add_argument("--output", help="SQLite file or JSON directory")
+    parser.add_argument("--mongo-url", default=os.getenv("SALONOVA_MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--writers", type=int, default=8, help="Salons written in parallel")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    asyncio.run(init_db()) 
\ No newline at end of file
+    args = parse_args()
+    if args.salons is None:
+        asyncio.run(init_db())
+    elif args.target == "mongo":
+        asyncio.run(generate_mongo(args))
+    elif args.target == "sqlite":
+        generate_sqlite(args)
+    else:
+        generate_json(args)
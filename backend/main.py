@@ -1,15 +1,48 @@
-from fastapi import FastAPI, HTTPException
+# Timed from here so /api/startup-stats can show where a cold start goes
+from modules.startup import StartupTimer
+startup_timer = StartupTimer()
+
+from fastapi import FastAPI, HTTPException, Header, Request, Response, Depends
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
-import pytz
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from models import Salon, Service, Appointment, BookingRequest
-from passlib.context import CryptContext
 from pydantic import BaseModel
 from bson import ObjectId
+from typing import List, Optional
+from functools import lru_cache
+from modules.idempotency import IdempotencyCache, IdempotencyConflict, request_fingerprint
+from modules.catalog import Catalog
+from modules.availability_cache import AvailabilityCache
+from modules.singleflight import SingleFlight
+from modules.db_health import PoolMonitor, CollectionStats, warm_pool
+from modules.migrations import ensure_migrated, rebuild_requested_rollups
+from modules.archive import AppointmentArchiver
+from modules.capacity import (
+    load_slot_checker, find_next_fit, slot_is_free, salon_capacity, load_package_checker, find_next_package_fit
+)
+from modules.recurrence import parse_rule, validate_rule, series_until, iter_occurrences
+from dateutil.rrule import rrule
+from itertools import islice
+from modules.profiling import SamplingProfilerMiddleware, profiled_routes, top_functions
+import tempfile
+from modules.calendar_feed import ScheduleClock, feed_validators, is_not_modified, http_date, stream_calendar
+from modules.waitlist import Waitlist
+from modules.rate_limit import AdmissionController
+from modules.analytics import record_booking, rebuild_rollups, heatmap_grid
+from modules.geo import SalonLocator
+from modules.write_batcher import WriteBatcher
+from modules.timeutil import (
+    today_local, earliest_local_now, format_local, parse_local, parse_instant, minute_of_day, salon_zone, stored_zone, zone_label
+)
+from pymongo.errors import DuplicateKeyError, BulkWriteError
+from pymongo.write_concern import WriteConcern
+import asyncio
+
+startup_timer.mark("imports")
 
 # Setup paths
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -34,40 +67,188 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Admin endpoints and on-demand profiling require this token (X-Admin-Token,
+# X-Debug-Profile); without one configured they are refused
+ADMIN_TOKEN = os.getenv("SALONOVA_ADMIN_TOKEN")
+
+# Opt-in request profiling: a fraction of requests, or ones sending X-Debug-Profile
+PROFILE_SAMPLE_RATE = float(os.getenv("SALONOVA_PROFILE_RATE", "0"))
+PROFILE_DIR = os.getenv("SALONOVA_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "salonova-profiles"))
+app.add_middleware(
+    SamplingProfilerMiddleware,
+    sample_rate=PROFILE_SAMPLE_RATE,
+    header_token=ADMIN_TOKEN,
+    output_dir=PROFILE_DIR,
+    max_files_per_route=int(os.getenv("SALONOVA_PROFILE_MAX_FILES", "50")),
+)
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set SALONOVA_ADMIN_TOKEN")
+    if x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+# Admission control for DB-bound booking endpoints: token buckets per client
+# (X-Client-Id, else client IP) and per salon, refilled lazily, plus a cap on
+# requests in flight. A rate of 0 disables that bucket, a cap of 0 the cap.
+admission = AdmissionController(
+    client_rate=float(os.getenv("SALONOVA_CLIENT_RATE", "5")),
+    client_burst=int(os.getenv("SALONOVA_CLIENT_BURST", "20")),
+    salon_rate=float(os.getenv("SALONOVA_SALON_RATE", "30")),
+    salon_burst=int(os.getenv("SALONOVA_SALON_BURST", "60")),
+    max_concurrent=int(os.getenv("SALONOVA_MAX_CONCURRENT_BOOKINGS", "64")),
+)
+
+async def admit_request(request: Request, x_client_id: Optional[str] = Header(None)):
+    """Reject with 429 before the handler runs if the client, salon or server is over its limit"""
+    client_key = x_client_id or (request.client.host if request.client else "unknown")
+    salon_key = None
+    if request.method == "POST":
+        try:
+            # Starlette caches the body, so the handler still gets it
+            body = await request.json()
+            salon_key = body.get("salon") if isinstance(body, dict) else None
+        except ValueError:
+            pass
+    retry_after = admission.admit(client_key, salon_key)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests, please retry later",
+            headers={"Retry-After": admission.retry_after_header(retry_after)}
+        )
+    try:
+        yield
+    finally:
+        admission.release()
+
+# Password hashing; passlib and bcrypt load on the first signup or login
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # Mount static files
 app.mount("/static", StaticFiles(directory=FRONTEND_DIR), name="static")
 
 # MongoDB connection
-MONGO_URL = "mongodb://localhost:27017"
+MONGO_URL = os.getenv("SALONOVA_MONGO_URL", "mongodb://localhost:27017")
+# Each worker process opens its own pool lazily, after any fork
+MONGO_MAX_POOL_SIZE = int(os.getenv("SALONOVA_MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("SALONOVA_MONGO_MIN_POOL_SIZE", "5"))
+# "leader": one worker applies migrations under a lock, the rest wait for it.
+# "external": workers skip them; run `python backend/migrate.py` before deploying.
+MIGRATION_MODE = os.getenv("SALONOVA_MIGRATIONS", "leader")
 client = None
 db = None
+worker_ready = False
+rollup_rebuild_task = None
 in_memory_db = {
     "appointments": [],
     "salons": [],
     "services": []
 }
 
-# IST offset from UTC is +5:30
-IST_OFFSET = timedelta(hours=5, minutes=30)
-
-def convert_to_ist(dt):
-    """Convert any datetime to IST using UTC+5:30 formula"""
-    if dt.tzinfo is None:
-        # If no timezone info, assume UTC
-        dt = dt.replace(tzinfo=pytz.UTC)
-    # Convert to UTC first
-    utc_time = dt.astimezone(pytz.UTC)
-    # Add 5:30 hours to get IST
-    ist_time = utc_time + IST_OFFSET
-    return ist_time
-
-def get_current_ist_time():
-    """Get current time in IST using UTC+5:30 formula"""
-    current_utc = datetime.now(pytz.UTC)
-    return current_utc + IST_OFFSET
+# Idempotency-Key results for the booking endpoints. Mongo keeps them for
+# other workers and expires them through a TTL index on expires_at.
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("SALONOVA_IDEMPOTENCY_TTL_SECONDS", str(24 * 60 * 60)))
+idempotency_cache = IdempotencyCache(
+    max_entries=int(os.getenv("SALONOVA_IDEMPOTENCY_MAX_ENTRIES", "10000")),
+    ttl_seconds=IDEMPOTENCY_TTL_SECONDS,
+)
+
+# Salon/service lookups and check-availability answers served from memory
+catalog = Catalog(ttl_seconds=int(os.getenv("SALONOVA_CATALOG_TTL_SECONDS", "60")))
+availability_cache = AvailabilityCache(
+    max_entries=int(os.getenv("SALONOVA_AVAILABILITY_CACHE_SIZE", "5000")),
+    ttl_seconds=int(os.getenv("SALONOVA_AVAILABILITY_CACHE_TTL_SECONDS", "30")),
+)
+# Identical check-availability misses arriving together share one Mongo round
+availability_flights = SingleFlight()
+
+# Last booking change per salon, for calendar feed validators
+schedule_clock = ScheduleClock(revalidate_seconds=int(os.getenv("SALONOVA_CALENDAR_REVALIDATE_SECONDS", "15")))
+CALENDAR_MAX_DAYS = 90
+
+# Health probes only ping; collection counts are refreshed in the background
+HEALTH_PING_TIMEOUT_SECONDS = float(os.getenv("SALONOVA_HEALTH_PING_TIMEOUT_SECONDS", "2"))
+pool_monitor = PoolMonitor()
+collection_stats = CollectionStats(
+    ["users", "appointments", "salons", "services"],
+    interval_seconds=int(os.getenv("SALONOVA_STATS_REFRESH_SECONDS", "30")),
+)
+
+# Finished appointments are moved to monthly archive collections
+ARCHIVE_INTERVAL_SECONDS = int(os.getenv("SALONOVA_ARCHIVE_INTERVAL_SECONDS", "3600"))
+ARCHIVE_AFTER = timedelta(days=int(os.getenv("SALONOVA_ARCHIVE_AFTER_DAYS", "1")))
+archiver = AppointmentArchiver(batch_size=int(os.getenv("SALONOVA_ARCHIVE_BATCH_SIZE", "500")))
+
+# Customers waiting for a slot, offered cancelled intervals as they free up
+waitlist = Waitlist(ttl_seconds=int(os.getenv("SALONOVA_WAITLIST_TTL_SECONDS", "60")))
+WAITLIST_OFFER_TTL = timedelta(minutes=int(os.getenv("SALONOVA_WAITLIST_OFFER_MINUTES", "15")))
+WAITLIST_MAX_FLEXIBILITY_MINUTES = 12 * 60
+
+# Salon coordinates for nearby search: an in-memory grid per worker, or
+# SALONOVA_GEO_BACKEND=mongo to query the 2dsphere index instead
+salon_locator = SalonLocator(
+    ttl_seconds=int(os.getenv("SALONOVA_GEO_TTL_SECONDS", "300")),
+    backend=os.getenv("SALONOVA_GEO_BACKEND", "memory"),
+)
+GEO_MAX_RADIUS_KM = 50
+GEO_MAX_RESULTS = 20
+
+# Appointment reminders, off unless SALONOVA_REMINDER_SENDER is "file" or "smtp";
+# workers without them never import the scheduler
+def make_reminder_sender(kind):
+    if kind == "file":
+        from modules.reminders import FileSender
+        return FileSender(os.getenv(
+            "SALONOVA_REMINDER_FILE", os.path.join(tempfile.gettempdir(), "salonova-reminders.jsonl")
+        ))
+    if kind == "smtp":
+        from modules.reminders import SmtpSender
+        return SmtpSender(
+            os.getenv("SALONOVA_SMTP_HOST", "localhost"),
+            port=int(os.getenv("SALONOVA_SMTP_PORT", "25")),
+            from_addr=os.getenv("SALONOVA_SMTP_FROM", "reminders@salonova.local"),
+            username=os.getenv("SALONOVA_SMTP_USER"),
+            password=os.getenv("SALONOVA_SMTP_PASSWORD"),
+            starttls=os.getenv("SALONOVA_SMTP_STARTTLS", "false").lower() == "true",
+        )
+    return None
+
+def make_reminders(sender):
+    from modules.reminders import ReminderScheduler
+    return ReminderScheduler(
+        sender,
+        lead=timedelta(minutes=int(os.getenv("SALONOVA_REMINDER_LEAD_MINUTES", "120"))),
+        tick_seconds=int(os.getenv("SALONOVA_REMINDER_TICK_SECONDS", "30")),
+    )
+
+reminder_sender = make_reminder_sender(os.getenv("SALONOVA_REMINDER_SENDER", "off"))
+reminders = make_reminders(reminder_sender) if reminder_sender else None
+
+# Caches are snapshotted to SALONOVA_SNAPSHOT_PATH (if set) so restarts start warm
+def make_snapshots(path):
+    from modules.snapshot import SnapshotManager
+    return SnapshotManager(
+        path,
+        interval_seconds=int(os.getenv("SALONOVA_SNAPSHOT_INTERVAL_SECONDS", "300")),
+        max_age_seconds=int(os.getenv("SALONOVA_SNAPSHOT_MAX_AGE_SECONDS", "3600")),
+    )
+
+SNAPSHOT_PATH = os.getenv("SALONOVA_SNAPSHOT_PATH")
+snapshots = make_snapshots(SNAPSHOT_PATH) if SNAPSHOT_PATH else None
+
+# Appointment inserts arriving within a few ms share one journaled insert_many;
+# SALONOVA_BOOKING_BATCH_DELAY_MS=0 writes each booking on its own
+appointment_writes = WriteBatcher(
+    max_batch=int(os.getenv("SALONOVA_BOOKING_BATCH_SIZE", "64")),
+    max_delay_ms=float(os.getenv("SALONOVA_BOOKING_BATCH_DELAY_MS", "5")),
+    write_concern=WriteConcern(j=os.getenv("SALONOVA_BOOKING_JOURNAL", "true").lower() == "true"),
+)
+
+startup_timer.mark("configuration")
 
 def get_db():
     global client, db
@@ -75,7 +256,13 @@ def get_db():
         return db
     try:
         print("Attempting to connect to MongoDB...")
-        client = AsyncIOMotorClient(MONGO_URL, serverSelectionTimeoutMS=5000)
+        client = AsyncIOMotorClient(
+            MONGO_URL,
+            serverSelectionTimeoutMS=5000,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            event_listeners=[pool_monitor]
+        )
         db = client.salon_db
         print("Successfully connected to MongoDB")
         return db
@@ -97,14 +284,42 @@ class BookingRequest(BaseModel):
     salon: str
     service: str
     dateTime: str
+    email: Optional[str] = None  # Where appointment reminders are sent
 
 class NextSlotConfirmation(BaseModel):
     confirm: bool
     original_request: BookingRequest
     next_slot: str
 
+class PackageBookingRequest(BaseModel):
+    name: str
+    email: Optional[str] = None
+    salon: str
+    services: List[str]  # Booked back to back in this order
+    dateTime: str  # Start of the first service, UTC ISO like BookingRequest
+    earliestAvailable: bool = False  # Book the first window that fits instead of suggesting it
+
+class RecurringBookingRequest(BaseModel):
+    name: str
+    salon: str
+    service: str
+    dateTime: str  # First occurrence, UTC ISO like BookingRequest
+    rrule: str  # e.g. "FREQ=WEEKLY;INTERVAL=2;COUNT=10"
+
+class RescheduleRequest(BaseModel):
+    dateTime: str  # New start, UTC ISO like BookingRequest
+
+class WaitlistRequest(BaseModel):
+    name: str
+    email: Optional[str] = None
+    salon: str
+    service: str
+    dateTime: str  # Preferred start, UTC ISO like BookingRequest
+    flexibilityMinutes: int = 60  # Accept a start this far either side
+
 @app.on_event("startup")
 async def startup_db_client():
+    global worker_ready, rollup_rebuild_task
     try:
         db = get_db()
         if db is None:
@@ -128,49 +343,76 @@ async def startup_db_client():
                 "price": 30.00,
                 "salon_id": "1"
             }]
+            startup_timer.ready()
             return
 
-        # If MongoDB is available, create indexes and initialize data
-        await db.appointments.create_index([("salon_id", 1), ("appointment_time", 1)])
-        await db.appointments.create_index([("status", 1)])
-        print("Connected to MongoDB and created indexes!")
-        
-        if await db.salons.count_documents({}) == 0:
-            # Add sample salon
-            salon = {
-                "name": "Elegant Cuts",
-                "address": "123 Main St",
-                "phone": "555-0101",
-                "email": "elegant@cuts.com",
-                "opening_time": "09:00",
-                "closing_time": "17:00",
-                "services": []
-            }
-            result = await db.salons.insert_one(salon)
-            salon_id = str(result.inserted_id)
-            
-            # Add sample service
-            service = {
-                "name": "Haircut",
-                "description": "Basic haircut and styling",
-                "duration": 30,
-                "price": 30.00,
-                "salon_id": salon_id
-            }
-            service_result = await db.services.insert_one(service)
-            
-            # Update salon's services
-            await db.salons.update_one(
-                {"_id": result.inserted_id},
-                {"$push": {"services": str(service_result.inserted_id)}}
+        # Warm the caches from the last snapshot before anything queries Mongo
+        snapshot = None
+        if snapshots is not None:
+            with startup_timer.phase("snapshot restore"):
+                snapshot = snapshots.restore(catalog, salon_locator, reminders)
+
+        # If MongoDB is available, make sure indexes and sample data exist
+        if MIGRATION_MODE == "leader":
+            with startup_timer.phase("migrations"):
+                try:
+                    if await ensure_migrated(db):
+                        print("Connected to MongoDB and applied migrations!")
+                except Exception as e:
+                    # Serving against a half-migrated schema (or never becoming
+                    # ready) is worse than letting the supervisor restart us
+                    print(f"Error: migrations failed: {e}")
+                    raise SystemExit(1)
+        else:
+            print("Skipping migrations (SALONOVA_MIGRATIONS=external)")
+
+        # Open the minimum pool up front so the first requests don't pay for it
+        with startup_timer.phase("pool warmup"):
+            await warm_pool(db, MONGO_MIN_POOL_SIZE)
+        collection_stats.start(db)
+        if ARCHIVE_INTERVAL_SECONDS > 0:
+            # Stored times are naive and local to each salon; measuring from the
+            # earliest local time anywhere never archives a booking still to end
+            archiver.start(
+                db,
+                lambda: earliest_local_now() - ARCHIVE_AFTER,
+                ARCHIVE_INTERVAL_SECONDS
             )
-            print("Initialized database with sample data!")
+        if reminders is not None:
+            with startup_timer.phase("reminders"):
+                if snapshot is not None and reminders.loaded:
+                    caught_up = await reminders.catch_up(db)
+                    print(f"Caught up on {caught_up} bookings since the snapshot")
+                await reminders.start(db)
+        if snapshots is not None:
+            snapshots.start(db, catalog, salon_locator, reminders)
+        if MIGRATION_MODE == "leader":
+            # Rebuilds scan every booking; serve requests while one runs
+            rollup_rebuild_task = asyncio.create_task(rebuild_rollups_in_background(db))
+        worker_ready = True
+        startup_timer.ready()
     except Exception as e:
         print(f"Error in startup: {e}")
         print("Warning: Using in-memory storage as MongoDB is not available")
 
+
+async def rebuild_rollups_in_background(db):
+    try:
+        await rebuild_requested_rollups(db)
+    except Exception as e:
+        # The request stays in place; the next worker to start retries it
+        print(f"Warning: analytics rollup rebuild failed: {e}")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if rollup_rebuild_task is not None:
+        rollup_rebuild_task.cancel()
+    await collection_stats.stop()
+    await archiver.stop()
+    if reminders is not None:
+        await reminders.stop()
+    if snapshots is not None:
+        await snapshots.stop()
     client.close()
 
 @app.get("/")
@@ -210,7 +452,7 @@ async def signup(user: UserCreate):
             raise HTTPException(status_code=400, detail="Username already exists")
 
         # Hash the password
-        hashed_password = pwd_context.hash(user.password)
+        hashed_password = get_pwd_context().hash(user.password)
 
         # Create new user
         user_dict = {
@@ -235,69 +477,78 @@ async def login(user: UserLogin):
             raise HTTPException(status_code=401, detail="Invalid credentials")
 
         # Verify password
-        if not pwd_context.verify(user.password, db_user["password"]):
+        if not get_pwd_context().verify(user.password, db_user["password"]):
             raise HTTPException(status_code=401, detail="Invalid credentials")
 
         return {"message": "Login successful"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/check-availability")
+# How far ahead the next-slot search looks
+NEXT_SLOT_SEARCH_DAYS = 7
+
+def days_searched(start_day):
+    """Salon-days a check_slot_conflicts answer for start_day can depend on"""
+    return [start_day + timedelta(days=i) for i in range(NEXT_SLOT_SEARCH_DAYS)]
+
+async def check_slot_conflicts(salon, service, requested_time, end_time, hours):
+    """Return ``(response, days_used)``; response is None if a chair is free for the slot"""
+    # Count concurrent bookings against the salon's chairs - stored times are salon-local
+    free = await slot_is_free(db, salon, service, requested_time, end_time)
+    if free is None:
+        checker = await load_slot_checker(db, salon, service, requested_time.date())
+        free = checker.fits(checker.minutes(requested_time), checker.minutes(end_time))
+    if free:
+        return None, [requested_time.date()]
+
+    # Find next available slot
+    duration = int((end_time - requested_time).total_seconds() // 60)
+    next_slot, days_used = await find_next_fit(
+        db, salon, service, requested_time, duration, days=NEXT_SLOT_SEARCH_DAYS, hours=hours
+    )
+    return {
+        "available": False,
+        "requested_time": format_local(requested_time, hours.zone),
+        "message": "Time slot not available",
+        "nextAvailable": format_local(next_slot, hours.zone) if next_slot else None,
+        "suggestNext": True
+    }, days_used
+
+@app.post("/api/check-availability", dependencies=[Depends(admit_request)])
 async def check_availability(booking_request: BookingRequest):
     try:
         print("\n=== TIME DEBUGGING ===")
         print(f"1. Raw booking request time (UTC): {booking_request.dateTime}")
         
         # Find the salon
-        salon = await db.salons.find_one({"name": booking_request.salon})
+        salon = await catalog.get_salon(db, booking_request.salon)
         if not salon:
             raise HTTPException(status_code=404, detail="Salon not found")
 
         # Find the service
-        service = await db.services.find_one({
-            "name": booking_request.service,
-            "salon_id": str(salon["_id"])
-        })
+        service = await catalog.get_service(db, booking_request.service, salon["_id"])
         if not service:
             raise HTTPException(status_code=404, detail="Service not found")
 
-        # Parse the requested datetime and convert to IST
+        hours = catalog.business_hours(salon)
         try:
-            # Parse the UTC time first
-            date_str = booking_request.dateTime.replace('Z', '')
-            utc_time = datetime.fromisoformat(date_str)
-            print(f"2. Parsed UTC time: {utc_time.strftime('%Y-%m-%d %I:%M %p')}")
-            
-            # Convert to IST by adding 5:30 hours
-            ist_offset = timedelta(hours=5, minutes=30)
-            requested_time_ist = utc_time + ist_offset
-            requested_time_ist = requested_time_ist.replace(second=0, microsecond=0)
-            print(f"3. Converted to IST (+5:30): {requested_time_ist.strftime('%Y-%m-%d %I:%M %p')}")
-            
+            # Requested UTC time as salon-local wall-clock time
+            requested_time = hours.parse(booking_request.dateTime).replace(second=0, microsecond=0)
+            print(f"2. Salon-local time: {requested_time.strftime('%Y-%m-%d %I:%M %p')}")
+
             # Check if time is in the past
-            current_time = datetime.now().replace(second=0, microsecond=0)
-            ist_current_time = current_time + ist_offset
-            print(f"4. Current time (IST): {ist_current_time.strftime('%Y-%m-%d %I:%M %p')}")
+            current_time = hours.now().replace(second=0, microsecond=0)
+            print(f"3. Current salon-local time: {current_time.strftime('%Y-%m-%d %I:%M %p')}")
 
-            if requested_time_ist.date() < ist_current_time.date():
-                next_slot = ist_current_time + timedelta(days=1)
-                next_slot = next_slot.replace(hour=9, minute=0)  # Next day 9 AM
+            if requested_time < current_time:
+                next_slot = current_time + timedelta(hours=1)
+                if requested_time.date() < current_time.date() or minute_of_day(next_slot) > hours.closing:
+                    next_slot = hours.opening_on(current_time.date() + timedelta(days=1))
                 return {
                     "available": False,
-                    "requested_time": requested_time_ist.strftime("%Y-%m-%d %H:%M IST"),
+                    "requested_time": format_local(requested_time, hours.zone),
                     "message": "Cannot book appointments in the past",
-                    "nextAvailable": next_slot.strftime("%Y-%m-%d %H:%M IST"),
-                    "suggestNext": True
-                }
-            elif requested_time_ist.date() == ist_current_time.date() and requested_time_ist.time() < ist_current_time.time():
-                next_slot = ist_current_time + timedelta(hours=1)
-                if next_slot.time() > datetime.strptime(salon["closing_time"], "%H:%M").time():
-                    next_slot = (ist_current_time + timedelta(days=1)).replace(hour=9, minute=0)  # Next day 9 AM
-                return {
-                    "available": False,
-                    "requested_time": requested_time_ist.strftime("%Y-%m-%d %H:%M IST"),
-                    "message": "Cannot book appointments in the past",
-                    "nextAvailable": next_slot.strftime("%Y-%m-%d %H:%M IST"),
+                    "nextAvailable": format_local(next_slot, hours.zone),
                     "suggestNext": True
                 }
 
@@ -306,167 +557,219 @@ async def check_availability(booking_request: BookingRequest):
             raise HTTPException(status_code=400, detail=f"Invalid datetime format: {str(e)}")
 
         # Check if the requested time is within salon hours
-        salon_opening = datetime.strptime(salon["opening_time"], "%H:%M").time()
-        salon_closing = datetime.strptime(salon["closing_time"], "%H:%M").time()
-        requested_time_only = requested_time_ist.time()
-
-        print(f"5. Checking against salon hours:")
-        print(f"   - Salon hours: {salon_opening} - {salon_closing}")
-        print(f"   - Requested time (IST): {requested_time_only}")
-
-        if not (salon_opening <= requested_time_only <= salon_closing):
-            # Find next available slot starting from tomorrow if outside business hours
-            next_day = requested_time_ist.date() + timedelta(days=1)
-            next_slot = datetime.combine(next_day, salon_opening)
-            return {
-                "available": False,
-                "requested_time": requested_time_ist.strftime("%Y-%m-%d %H:%M IST"),
-                "message": f"Requested time {requested_time_only} is outside salon hours ({salon_opening} - {salon_closing})",
-                "nextAvailable": next_slot.strftime("%Y-%m-%d %H:%M IST"),
-                "suggestNext": True
-            }
-
-        # Calculate appointment end time
         service_duration = service.get("duration", 30)  # default 30 minutes if not specified
-        end_time_ist = requested_time_ist + timedelta(minutes=service_duration)
-        print(f"6. Appointment end time (IST): {end_time_ist.strftime('%Y-%m-%d %I:%M %p')}")
-
-        # Check if end time is within business hours
-        if end_time_ist.time() > salon_closing:
-            next_day = requested_time_ist.date() + timedelta(days=1)
-            next_slot = datetime.combine(next_day, salon_opening)
+        end_time = requested_time + timedelta(minutes=service_duration)
+        start_minute = minute_of_day(requested_time)
+        print(f"4. Salon hours {hours.opening}-{hours.closing} min, requested {start_minute}-{start_minute + service_duration} min")
+
+        if not hours.fits(start_minute, service_duration):
+            # Suggest the next opening if the slot is outside business hours
+            next_slot = hours.opening_on(requested_time.date() + timedelta(days=1))
+            if hours.opening <= start_minute <= hours.closing:
+                message = "Appointment would end after business hours"
+            else:
+                message = (
+                    f"Requested time {requested_time.time()} is outside salon hours "
+                    f"({salon['opening_time']} - {salon['closing_time']})"
+                )
             return {
                 "available": False,
-                "requested_time": requested_time_ist.strftime("%Y-%m-%d %H:%M IST"),
-                "message": "Appointment would end after business hours",
-                "nextAvailable": next_slot.strftime("%Y-%m-%d %H:%M IST"),
+                "requested_time": format_local(requested_time, hours.zone),
+                "message": message,
+                "nextAvailable": format_local(next_slot, hours.zone),
                 "suggestNext": True
             }
 
-        # Check for conflicting appointments - all times in database are in IST
-        existing_appointments = await db.appointments.find({
-            "salon_id": str(salon["_id"]),
-            "$or": [
-                {
-                    "appointment_time": {"$lt": end_time_ist},
-                    "end_time": {"$gt": requested_time_ist}
-                },
-                {
-                    "appointment_time": requested_time_ist,
-                    "status": "scheduled"
+        # Conflict checks are the Mongo-heavy part, so their answer is cached
+        # against the versions of every salon-day the search can touch
+        salon_id = str(salon["_id"])
+        cache_key = (
+            salon_id,
+            str(service["_id"]),
+            requested_time.date().isoformat(),
+            requested_time.strftime("%H:%M"),
+        )
+        cached = availability_cache.get(cache_key)
+        if cached is not None:
+            print("7. Served from availability cache")
+            return cached
+
+        async def compute_availability():
+            deps = availability_cache.snapshot(salon_id, days_searched(requested_time.date()))
+            result, days_used = await check_slot_conflicts(
+                salon, service, requested_time, end_time, hours
+            )
+            # Only the days the search actually read can make this answer stale
+            deps = availability_cache.narrow(deps, days_used)
+            if result is None:
+                print("7. Slot is available!")
+                result = {
+                    "available": True,
+                    "requested_time": format_local(requested_time, hours.zone),
+                    "salon_id": salon_id,
+                    "service_id": str(service["_id"]),
+                    "appointment_time": format_local(requested_time, hours.zone),
+                    "end_time": format_local(end_time, hours.zone)
                 }
-            ],
-            "status": "scheduled"
-        }).to_list(length=None)
-
-        if existing_appointments:
-            # Find next available slot
-            next_slot = requested_time_ist
-            found_slot = False
-            max_attempts = 14  # Check up to 14 slots ahead
-            attempts = 0
-
-            while not found_slot and attempts < max_attempts:
-                next_slot = next_slot + timedelta(minutes=30)
-                if next_slot.time() > salon_closing:
-                    # Move to next day's opening time
-                    next_day = next_slot.date() + timedelta(days=1)
-                    next_slot = datetime.combine(next_day, salon_opening)
-                    continue
-
-                if next_slot.time() < salon_opening:
-                    # Move to same day's opening time
-                    next_slot = datetime.combine(next_slot.date(), salon_opening)
-                    continue
-
-                # Check if this slot is available
-                slot_end = next_slot + timedelta(minutes=service_duration)
-                conflicts = await db.appointments.find_one({
-                    "salon_id": str(salon["_id"]),
-                    "$or": [
-                        {
-                            "appointment_time": {"$lt": slot_end},
-                            "end_time": {"$gt": next_slot}
-                        },
-                        {
-                            "appointment_time": next_slot,
-                            "status": "scheduled"
-                        }
-                    ],
-                    "status": "scheduled"
-                })
-
-                if not conflicts:
-                    found_slot = True
-                    break
-
-                attempts += 1
+            availability_cache.put(cache_key, salon_id, deps, result)
+            return result
 
-            return {
-                "available": False,
-                "requested_time": requested_time_ist.strftime("%Y-%m-%d %H:%M IST"),
-                "message": "Time slot not available",
-                "nextAvailable": next_slot.strftime("%Y-%m-%d %H:%M IST") if found_slot else None,
-                "suggestNext": True
-            }
-
-        print("7. Slot is available!")
-        return {
-            "available": True,
-            "requested_time": requested_time_ist.strftime("%Y-%m-%d %H:%M IST"),
-            "salon_id": str(salon["_id"]),
-            "service_id": str(service["_id"]),
-            "appointment_time": requested_time_ist.strftime("%Y-%m-%d %H:%M IST"),
-            "end_time": end_time_ist.strftime("%Y-%m-%d %H:%M IST")
-        }
+        # Same (salon, service, requested minute) as cache_key
+        return await availability_flights.do(cache_key, compute_availability)
 
     except Exception as e:
         print(f"Error in check_availability: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/book-appointment")
-async def book_appointment(booking_request: BookingRequest):
+async def check_booking_slot(salon, service, start_time, end_time, released=(), suggest_next=True):
+    """Return ``(chair, None)`` when a chair is free, else ``(None, next_available_slot)``
+
+    ``released`` bookings are treated as free, e.g. the one being rescheduled.
+    """
+    free = None if released else await slot_is_free(db, salon, service, start_time, end_time)
+    if free:
+        # Single-chair salon with nothing overlapping
+        return 0, None
+    if free is None:
+        checker = await load_slot_checker(db, salon, service, start_time.date(), released)
+        start, end = checker.minutes(start_time), checker.minutes(end_time)
+        if checker.fits(start, end):
+            return checker.chair(start, end), None
+    if not suggest_next:
+        return None, None
+    duration = int((end_time - start_time).total_seconds() // 60)
+    next_slot, _ = await find_next_fit(
+        db, salon, service, start_time, duration, days=NEXT_SLOT_SEARCH_DAYS, released=released,
+        hours=catalog.business_hours(salon)
+    )
+    return None, next_slot
+
+async def notify_schedule_change(salon_id, start_time=None, added=None, removed=None):
+    """Propagate a booking change for a salon-day (or the whole salon if start_time is None)
+
+    ``added``/``removed`` are the appointment documents (or lists of them)
+    booked or cancelled, which keeps the analytics rollups and the
+    reminder timers current.
+    """
+    if start_time is None:
+        availability_cache.bump_salon(salon_id)
+    else:
+        availability_cache.bump(salon_id, start_time.date())
+    await schedule_clock.touch(db, salon_id)
+    for appointments, sign in ((added, 1), (removed, -1)):
+        if isinstance(appointments, dict):
+            appointments = [appointments]
+        for appointment in appointments or ():
+            await record_analytics(appointment, sign)
+            if reminders is not None:
+                if sign > 0:
+                    reminders.schedule(appointment)
+                else:
+                    reminders.cancel(appointment)
+
+async def record_analytics(appointment, sign):
+    try:
+        service = await catalog.get_service(db, appointment["service"], appointment["salon_id"])
+        await record_booking(db, appointment, service.get("price", 0) if service else 0, sign)
+    except Exception as e:
+        # The booking itself has already succeeded; a rebuild repairs the rollups
+        print(f"Warning: analytics rollup update failed: {e}")
+
+async def offer_freed_slot(salon_id, start_time, end_time):
+    """Offer a freed interval to the salon-day's waitlist; returns the offered entry or None"""
+    salon = await catalog.get_salon_by_id(db, salon_id)
+    if not salon:
+        return None
+
+    async def has_room(entry, offer_start, offer_end):
+        service = await catalog.get_service(db, entry["service"], salon["_id"])
+        if not service:
+            return False
+        chair, _ = await check_booking_slot(salon, service, offer_start, offer_end, suggest_next=False)
+        return chair is not None
+
+    try:
+        entry = await waitlist.match(
+            db, salon_id, start_time, end_time,
+            now=catalog.business_hours(salon).now(),
+            offer_ttl=WAITLIST_OFFER_TTL,
+            has_room=has_room,
+        )
+    except Exception as e:
+        # The cancellation itself has already succeeded
+        print(f"Warning: waitlist matching failed: {e}")
+        return None
+    if entry is not None:
+        print(f"Offered {format_local(entry['offered_time'], salon_zone(salon))} to waitlist entry {entry['_id']}")
+    return entry
+
+async def run_idempotent(endpoint, idempotency_key, fingerprint, compute, response):
+    """Run a booking handler once per Idempotency-Key and replay its stored result"""
+    if not idempotency_key:
+        return await compute()
+    try:
+        result, replayed = await idempotency_cache.execute(
+            f"{endpoint}:{idempotency_key}",
+            fingerprint,
+            compute,
+            collection=db.idempotency_keys if db is not None else None,
+            # Errors are not final, so a retry after one should book again
+            cacheable=lambda r: r.get("status") in ("success", "slot_unavailable"),
+        )
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if replayed:
+        print(f"Replaying stored response for Idempotency-Key {idempotency_key}")
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+@app.post("/api/book-appointment", dependencies=[Depends(admit_request)])
+async def book_appointment(
+    booking_request: BookingRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+):
+    return await run_idempotent(
+        "book-appointment",
+        idempotency_key,
+        request_fingerprint(booking_request.model_dump()),
+        lambda: _book_appointment(booking_request),
+        response,
+    )
+
+async def _book_appointment(booking_request: BookingRequest):
     try:
         print("\n=== APPOINTMENT BOOKING DEBUG ===")
         print(f"1. Initial booking request time (UTC): {booking_request.dateTime}")
         
-        # Convert requested time to IST
-        ist_time = datetime.fromisoformat(booking_request.dateTime.replace('Z', '')) + timedelta(hours=5, minutes=30)
-        end_time = ist_time + timedelta(minutes=30)  # Assuming 30 minutes duration
+        salon = await catalog.get_salon(db, booking_request.salon)
+        service = await catalog.get_service(db, booking_request.service, salon["_id"]) if salon else None
+        if not salon or not service:
+            return {
+                "status": "error",
+                "message": "Salon or service not found"
+            }
+        # Requested UTC time as salon-local wall-clock time
+        hours = catalog.business_hours(salon)
+        requested_time = hours.parse(booking_request.dateTime)
+        end_time = requested_time + timedelta(minutes=service.get("duration", 30))
 
-        print(f"2. Checking slot {ist_time.strftime('%Y-%m-%d %H:%M IST')} - {end_time.strftime('%Y-%m-%d %H:%M IST')}")
+        print(f"2. Checking slot {format_local(requested_time, hours.zone)} - {format_local(end_time, hours.zone)}")
 
-        # Check for any overlapping appointments
-        existing_appointments = await db.appointments.find({
-            "salon": booking_request.salon,
-            "$or": [
-                # Case 1: New appointment starts during an existing appointment
-                {
-                    "appointment_time": {"$lte": ist_time},
-                    "end_time": {"$gt": ist_time}
-                },
-                # Case 2: New appointment ends during an existing appointment
-                {
-                    "appointment_time": {"$lt": end_time},
-                    "end_time": {"$gte": end_time}
-                },
-                # Case 3: New appointment completely contains an existing appointment
-                {
-                    "appointment_time": {"$gte": ist_time},
-                    "end_time": {"$lte": end_time}
+        # Check for a free chair over the whole slot
+        chair, next_slot = await check_booking_slot(salon, service, requested_time, end_time)
+
+        if chair is None:
+            print("3. No free chair for the requested slot")
+            if next_slot is None:
+                return {
+                    "status": "slot_unavailable",
+                    "message": "The requested slot is not available and there are no free slots in the coming week.",
+                    "next_available_slot": None
                 }
-            ],
-            "status": "scheduled"
-        }).to_list(length=None)
-
-        if existing_appointments:
-            print(f"3. Found conflicting appointments: {len(existing_appointments)}")
-            # Find the next available slot after all conflicting appointments
-            next_possible_time = max(appt["end_time"] for appt in existing_appointments)
-            next_slot = next_possible_time
-            
+
             # Format next slot time for display
-            next_slot_str = next_slot.strftime("%Y-%m-%d %H:%M IST")
+            next_slot_str = format_local(next_slot, hours.zone)
             
             return {
                 "status": "slot_unavailable",
@@ -479,34 +782,35 @@ async def book_appointment(booking_request: BookingRequest):
         # Create appointment document
         appointment_doc = {
             "customer_name": booking_request.name,
+            "customer_email": booking_request.email,
             "salon": booking_request.salon,
             "service": booking_request.service,
-            "appointment_time": ist_time,
+            "salon_id": str(salon["_id"]),
+            "service_id": str(service["_id"]),
+            "chair": chair,
+            "appointment_time": requested_time,
             "end_time": end_time,
             "status": "scheduled",
-            "timezone": "IST"
+            "timezone": hours.zone.key
         }
 
         print("4. Attempting to insert appointment")
         # Try to insert the appointment
         try:
-            # Use a unique index to prevent race conditions
-            await db.appointments.create_index([
-                ("salon", 1),
-                ("appointment_time", 1),
-                ("status", 1)
-            ], unique=True)
-
-            result = await db.appointments.insert_one(appointment_doc)
+            # Two concurrent requests for the same start see the same load and
+            # pick the same chair; the unique (salon_id, appointment_time, chair)
+            # index from migrations rejects the second one
+            result = await appointment_writes.insert_one(db.appointments, appointment_doc)
             
             if result.inserted_id:
                 print(f"5. Successfully booked appointment with ID: {result.inserted_id}")
+                await notify_schedule_change(str(salon["_id"]), requested_time, added=appointment_doc)
                 return {
                     "status": "success",
                     "message": "Appointment booked successfully",
                     "appointment_id": str(result.inserted_id),
-                    "appointment_time": ist_time.strftime("%Y-%m-%d %H:%M IST"),
-                    "end_time": end_time.strftime("%Y-%m-%d %H:%M IST")
+                    "appointment_time": format_local(requested_time, hours.zone),
+                    "end_time": format_local(end_time, hours.zone)
                 }
             else:
                 print("5. Failed to insert appointment")
@@ -518,11 +822,11 @@ async def book_appointment(booking_request: BookingRequest):
             print(f"5. Database error: {str(e)}")
             # Check if this was a duplicate key error
             if "duplicate key error" in str(e).lower():
-                next_slot = ist_time + timedelta(minutes=30)
+                next_slot = requested_time + timedelta(minutes=30)
                 return {
                     "status": "slot_unavailable",
-                    "message": f"This slot was just taken. Would you like to book the next available slot at {next_slot.strftime('%Y-%m-%d %H:%M IST')}?",
-                    "next_available_slot": next_slot.strftime("%Y-%m-%d %H:%M IST")
+                    "message": f"This slot was just taken. Would you like to book the next available slot at {format_local(next_slot, hours.zone)}?",
+                    "next_available_slot": format_local(next_slot, hours.zone)
                 }
             return {
                 "status": "error",
@@ -536,47 +840,53 @@ async def book_appointment(booking_request: BookingRequest):
             "message": f"Error processing request: {str(e)}"
         }
 
-@app.post("/api/confirm-next-slot")
-async def confirm_next_slot(booking_request: BookingRequest, next_slot: str):
+@app.post("/api/confirm-next-slot", dependencies=[Depends(admit_request)])
+async def confirm_next_slot(
+    booking_request: BookingRequest,
+    next_slot: str,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+):
+    return await run_idempotent(
+        "confirm-next-slot",
+        idempotency_key,
+        request_fingerprint(booking_request.model_dump(), next_slot),
+        lambda: _confirm_next_slot(booking_request, next_slot),
+        response,
+    )
+
+async def _confirm_next_slot(booking_request: BookingRequest, next_slot: str):
     try:
-        # Convert the next slot string to datetime
-        next_slot_time = datetime.strptime(next_slot, "%Y-%m-%d %H:%M IST")
-        end_time = next_slot_time + timedelta(minutes=30)  # Assuming 30 minutes duration
+        # The suggested slot is already salon-local time
+        next_slot_time = parse_local(next_slot)
 
-        print(f"1. Checking next slot {next_slot_time.strftime('%Y-%m-%d %H:%M IST')} - {end_time.strftime('%Y-%m-%d %H:%M IST')}")
+        salon = await catalog.get_salon(db, booking_request.salon)
+        service = await catalog.get_service(db, booking_request.service, salon["_id"]) if salon else None
+        if not salon or not service:
+            return {
+                "status": "error",
+                "message": "Salon or service not found"
+            }
+        hours = catalog.business_hours(salon)
+        end_time = next_slot_time + timedelta(minutes=service.get("duration", 30))
 
-        # Check for any overlapping appointments
-        existing_appointments = await db.appointments.find({
-            "salon": booking_request.salon,
-            "$or": [
-                # Case 1: New appointment starts during an existing appointment
-                {
-                    "appointment_time": {"$lte": next_slot_time},
-                    "end_time": {"$gt": next_slot_time}
-                },
-                # Case 2: New appointment ends during an existing appointment
-                {
-                    "appointment_time": {"$lt": end_time},
-                    "end_time": {"$gte": end_time}
-                },
-                # Case 3: New appointment completely contains an existing appointment
-                {
-                    "appointment_time": {"$gte": next_slot_time},
-                    "end_time": {"$lte": end_time}
+        print(f"1. Checking next slot {format_local(next_slot_time, hours.zone)} - {format_local(end_time, hours.zone)}")
+
+        # Check for a free chair over the whole slot
+        chair, next_available = await check_booking_slot(salon, service, next_slot_time, end_time)
+
+        if chair is None:
+            print("2. No free chair for the requested slot")
+            if next_available is None:
+                return {
+                    "status": "slot_unavailable",
+                    "message": "Sorry, that slot was just taken and there are no free slots in the coming week.",
+                    "next_available_slot": None
                 }
-            ],
-            "status": "scheduled"
-        }).to_list(length=None)
-
-        if existing_appointments:
-            print(f"2. Found conflicting appointments: {len(existing_appointments)}")
-            # Find the next available slot after all conflicting appointments
-            next_possible_time = max(appt["end_time"] for appt in existing_appointments)
-            next_available = next_possible_time
             return {
                 "status": "slot_unavailable",
-                "message": f"Sorry, that slot was just taken. Would you like to book the next available slot at {next_available.strftime('%Y-%m-%d %H:%M IST')}?",
-                "next_available_slot": next_available.strftime("%Y-%m-%d %H:%M IST")
+                "message": f"Sorry, that slot was just taken. Would you like to book the next available slot at {format_local(next_available, hours.zone)}?",
+                "next_available_slot": format_local(next_available, hours.zone)
             }
 
         print("2. No conflicting appointments found")
@@ -584,34 +894,35 @@ async def confirm_next_slot(booking_request: BookingRequest, next_slot: str):
         # Create appointment document
         appointment_doc = {
             "customer_name": booking_request.name,
+            "customer_email": booking_request.email,
             "salon": booking_request.salon,
             "service": booking_request.service,
+            "salon_id": str(salon["_id"]),
+            "service_id": str(service["_id"]),
+            "chair": chair,
             "appointment_time": next_slot_time,
             "end_time": end_time,
             "status": "scheduled",
-            "timezone": "IST"
+            "timezone": hours.zone.key
         }
 
         print("3. Attempting to insert appointment")
         # Try to insert the appointment
         try:
-            # Use a unique index to prevent race conditions
-            await db.appointments.create_index([
-                ("salon", 1),
-                ("appointment_time", 1),
-                ("status", 1)
-            ], unique=True)
-
-            result = await db.appointments.insert_one(appointment_doc)
+            # Two concurrent requests for the same start see the same load and
+            # pick the same chair; the unique (salon_id, appointment_time, chair)
+            # index from migrations rejects the second one
+            result = await appointment_writes.insert_one(db.appointments, appointment_doc)
             
             if result.inserted_id:
                 print(f"4. Successfully booked appointment with ID: {result.inserted_id}")
+                await notify_schedule_change(str(salon["_id"]), next_slot_time, added=appointment_doc)
                 return {
                     "status": "success",
                     "message": "Appointment booked successfully",
                     "appointment_id": str(result.inserted_id),
-                    "appointment_time": next_slot_time.strftime("%Y-%m-%d %H:%M IST"),
-                    "end_time": end_time.strftime("%Y-%m-%d %H:%M IST")
+                    "appointment_time": format_local(next_slot_time, hours.zone),
+                    "end_time": format_local(end_time, hours.zone)
                 }
             else:
                 print("4. Failed to insert appointment")
@@ -626,8 +937,8 @@ async def confirm_next_slot(booking_request: BookingRequest, next_slot: str):
                 next_available = next_slot_time + timedelta(minutes=30)
                 return {
                     "status": "slot_unavailable",
-                    "message": f"This slot was just taken. Would you like to book the next available slot at {next_available.strftime('%Y-%m-%d %H:%M IST')}?",
-                    "next_available_slot": next_available.strftime("%Y-%m-%d %H:%M IST")
+                    "message": f"This slot was just taken. Would you like to book the next available slot at {format_local(next_available, hours.zone)}?",
+                    "next_available_slot": format_local(next_available, hours.zone)
                 }
             return {
                 "status": "error",
@@ -641,6 +952,838 @@ async def confirm_next_slot(booking_request: BookingRequest, next_slot: str):
             "message": f"Error processing request: {str(e)}"
         }
 
+# Most services a single package may chain
+PACKAGE_MAX_SERVICES = 5
+
+@app.post("/api/book-package", dependencies=[Depends(admit_request)])
+async def book_package(
+    package_request: PackageBookingRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+):
+    return await run_idempotent(
+        "book-package",
+        idempotency_key,
+        request_fingerprint(package_request.model_dump()),
+        lambda: _book_package(package_request),
+        response,
+    )
+
+async def _book_package(package_request: PackageBookingRequest):
+    try:
+        if not 1 <= len(package_request.services) <= PACKAGE_MAX_SERVICES:
+            return {
+                "status": "error",
+                "message": f"A package needs between 1 and {PACKAGE_MAX_SERVICES} services"
+            }
+
+        salon = await catalog.get_salon(db, package_request.salon)
+        services = [
+            await catalog.get_service(db, name, salon["_id"]) for name in package_request.services
+        ] if salon else []
+        if not salon or not all(services):
+            return {
+                "status": "error",
+                "message": "Salon or service not found"
+            }
+        hours = catalog.business_hours(salon)
+        requested_time = hours.parse(package_request.dateTime)
+        current_time = hours.now().replace(second=0, microsecond=0)
+        in_past = requested_time < current_time
+
+        # One query gives the whole day's load for every leg
+        checker = await load_package_checker(db, salon, services, requested_time.date())
+        start = checker.minutes(requested_time)
+        if in_past or not (hours.fits(start, checker.duration) and checker.fits_package(start)):
+            next_slot, next_checker = await find_next_package_fit(
+                db, salon, services, max(requested_time, current_time), days=NEXT_SLOT_SEARCH_DAYS, hours=hours
+            )
+            if next_slot is None or not package_request.earliestAvailable:
+                next_slot_str = format_local(next_slot, hours.zone) if next_slot else None
+                return {
+                    "status": "slot_unavailable",
+                    "message": (
+                        "Cannot book appointments in the past." if in_past
+                        else "The requested package does not fit at that time."
+                    ) + (
+                        f" The earliest time it fits is {next_slot_str}." if next_slot_str
+                        else " There is no free window in the coming week."
+                    ),
+                    "next_available_slot": next_slot_str
+                }
+            checker, requested_time = next_checker, next_slot
+            start = checker.minutes(requested_time)
+
+        package_id = ObjectId()
+        legs = []
+        leg_start = requested_time
+        for service, chair in zip(services, checker.chairs(start)):
+            leg_end = leg_start + timedelta(minutes=service.get("duration", 30))
+            legs.append({
+                "customer_name": package_request.name,
+                "customer_email": package_request.email,
+                "salon": package_request.salon,
+                "service": service["name"],
+                "salon_id": str(salon["_id"]),
+                "service_id": str(service["_id"]),
+                "chair": chair,
+                "package_id": str(package_id),
+                "appointment_time": leg_start,
+                "end_time": leg_end,
+                "status": "scheduled",
+                "timezone": hours.zone.key
+            })
+            leg_start = leg_end
+
+        inserted = False
+        try:
+            # All legs in one round trip; ordered, so a clash stops the rest
+            result = await db.appointments.insert_many(legs, ordered=True)
+            inserted = True
+        except BulkWriteError as e:
+            # Another booking won one of the chairs
+            print(f"Package booking clashed, rolled back: {e.details.get('writeErrors', [{}])[0].get('errmsg')}")
+            return {
+                "status": "slot_unavailable",
+                "message": "This time was just taken. Please try again.",
+                "next_available_slot": None
+            }
+        finally:
+            if not inserted:
+                # Whatever stopped the insert, take back the legs that went in
+                await db.appointments.delete_many({"package_id": str(package_id)})
+
+        await notify_schedule_change(str(salon["_id"]), requested_time, added=legs)
+        return {
+            "status": "success",
+            "message": "Package booked successfully",
+            "package_id": str(package_id),
+            "appointment_time": format_local(legs[0]["appointment_time"], hours.zone),
+            "end_time": format_local(legs[-1]["end_time"], hours.zone),
+            "appointments": [
+                {
+                    "appointment_id": str(appointment_id),
+                    "service": leg["service"],
+                    "appointment_time": format_local(leg["appointment_time"], hours.zone),
+                    "end_time": format_local(leg["end_time"], hours.zone)
+                }
+                for appointment_id, leg in zip(result.inserted_ids, legs)
+            ]
+        }
+
+    except Exception as e:
+        print(f"Error in book_package: {str(e)}")
+        return {
+            "status": "error",
+            "message": f"Error processing request: {str(e)}"
+        }
+
+async def get_scheduled_appointment(appointment_id):
+    if not ObjectId.is_valid(appointment_id):
+        raise HTTPException(status_code=404, detail="Appointment not found")
+    appointment = await db.appointments.find_one({"_id": ObjectId(appointment_id)})
+    if not appointment:
+        raise HTTPException(status_code=404, detail="Appointment not found")
+    if appointment["status"] != "scheduled":
+        raise HTTPException(status_code=409, detail=f"Appointment is already {appointment['status']}")
+    return appointment
+
+@app.post("/api/appointments/{appointment_id}/cancel", dependencies=[Depends(admit_request)])
+async def cancel_appointment(appointment_id: str):
+    try:
+        appointment = await get_scheduled_appointment(appointment_id)
+        result = await db.appointments.update_one(
+            {"_id": appointment["_id"], "status": "scheduled"},
+            {"$set": {"status": "cancelled", "cancelled_at": datetime.utcnow()}}
+        )
+        if result.modified_count == 0:
+            raise HTTPException(status_code=409, detail="Appointment was changed by another request")
+
+        await notify_schedule_change(appointment["salon_id"], appointment["appointment_time"], removed=appointment)
+        offer = await offer_freed_slot(appointment["salon_id"], appointment["appointment_time"], appointment["end_time"])
+        return {
+            "status": "success",
+            "message": "Appointment cancelled",
+            "appointment_id": appointment_id,
+            "waitlist_offered": offer is not None
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error cancelling appointment: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/appointments/{appointment_id}/reschedule", dependencies=[Depends(admit_request)])
+async def reschedule_appointment(appointment_id: str, request: RescheduleRequest):
+    try:
+        appointment = await get_scheduled_appointment(appointment_id)
+        salon = await catalog.get_salon_by_id(db, appointment["salon_id"])
+        service = await catalog.get_service(db, appointment["service"], appointment["salon_id"]) if salon else None
+        if not salon or not service:
+            raise HTTPException(status_code=404, detail="Salon or service not found")
+
+        hours = catalog.business_hours(salon)
+        try:
+            new_time = hours.parse(request.dateTime)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid datetime format: {str(e)}")
+        new_end = new_time + timedelta(minutes=service.get("duration", 30))
+        old_time, old_end = appointment["appointment_time"], appointment["end_time"]
+
+        # Same rules as a new booking: not in the past, inside business hours
+        if new_time < hours.now().replace(second=0, microsecond=0):
+            raise HTTPException(status_code=400, detail="Cannot reschedule appointments into the past")
+        if not hours.contains(new_time, new_end):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Requested time is outside salon hours ({salon['opening_time']} - {salon['closing_time']})"
+            )
+
+        # The booking's own interval doesn't count against its new slot
+        chair, next_slot = await check_booking_slot(
+            salon, service, new_time, new_end,
+            released=[(old_time, old_end, appointment.get("service_id"), appointment.get("chair"))]
+        )
+        if chair is None:
+            return {
+                "status": "slot_unavailable",
+                "message": "The requested slot is not available.",
+                "next_available_slot": format_local(next_slot, hours.zone) if next_slot else None
+            }
+
+        try:
+            result = await db.appointments.update_one(
+                {"_id": appointment["_id"], "status": "scheduled", "appointment_time": old_time},
+                {
+                    "$set": {
+                        "appointment_time": new_time, "end_time": new_end, "chair": chair,
+                        "rescheduled_at": datetime.utcnow()
+                    },
+                    # The new time gets its own reminder
+                    "$unset": {"reminder_sent_at": "", "reminder_owner": ""}
+                }
+            )
+        except DuplicateKeyError:
+            return {
+                "status": "slot_unavailable",
+                "message": "This slot was just taken.",
+                "next_available_slot": None
+            }
+        if result.modified_count == 0:
+            raise HTTPException(status_code=409, detail="Appointment was changed by another request")
+
+        await notify_schedule_change(appointment["salon_id"], old_time, removed=appointment)
+        await notify_schedule_change(
+            appointment["salon_id"], new_time,
+            added=dict(appointment, appointment_time=new_time, end_time=new_end, chair=chair)
+        )
+        await offer_freed_slot(appointment["salon_id"], old_time, old_end)
+        return {
+            "status": "success",
+            "message": "Appointment rescheduled",
+            "appointment_id": appointment_id,
+            "appointment_time": format_local(new_time, hours.zone),
+            "end_time": format_local(new_end, hours.zone)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error rescheduling appointment: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def get_waitlist_entry_or_404(entry_id):
+    if not ObjectId.is_valid(entry_id):
+        raise HTTPException(status_code=404, detail="Waitlist entry not found")
+    entry = await db.waitlist.find_one({"_id": ObjectId(entry_id)})
+    if not entry:
+        raise HTTPException(status_code=404, detail="Waitlist entry not found")
+    return entry
+
+@app.post("/api/waitlist", dependencies=[Depends(admit_request)])
+async def join_waitlist(request: WaitlistRequest):
+    try:
+        salon = await catalog.get_salon(db, request.salon)
+        service = await catalog.get_service(db, request.service, salon["_id"]) if salon else None
+        if not salon or not service:
+            raise HTTPException(status_code=404, detail="Salon or service not found")
+
+        hours = catalog.business_hours(salon)
+        try:
+            preferred = hours.parse(request.dateTime)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid datetime format: {str(e)}")
+        now = hours.now().replace(second=0, microsecond=0)
+        if preferred < now:
+            raise HTTPException(status_code=400, detail="Cannot join the waitlist for a time in the past")
+        flexibility = timedelta(minutes=min(max(request.flexibilityMinutes, 0), WAITLIST_MAX_FLEXIBILITY_MINUTES))
+        duration = service.get("duration", 30)
+        # Keep the window inside the preferred day's business hours, and not before now
+        earliest = max(preferred - flexibility, hours.opening_on(preferred), now)
+        latest = min(preferred + flexibility, hours.closing_on(preferred) - timedelta(minutes=duration))
+        if latest < earliest:
+            raise HTTPException(status_code=400, detail="Requested window is outside business hours")
+
+        entry_id = await waitlist.join(db, {
+            "customer_name": request.name,
+            "customer_email": request.email,
+            "salon": request.salon,
+            "service": request.service,
+            "salon_id": str(salon["_id"]),
+            "service_id": str(service["_id"]),
+            "earliest": earliest,
+            "latest": latest,
+            "duration": duration,
+            "requested_at": datetime.utcnow(),
+            "timezone": hours.zone.key
+        })
+        return {
+            "status": "success",
+            "message": "Added to the waitlist",
+            "waitlist_id": str(entry_id),
+            "earliest": format_local(earliest, hours.zone),
+            "latest": format_local(latest, hours.zone)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error joining waitlist: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/waitlist/{entry_id}")
+async def get_waitlist_entry(entry_id: str):
+    try:
+        entry = await get_waitlist_entry_or_404(entry_id)
+        zone = stored_zone(entry)
+        offered = entry.get("offered_time")
+        expires = entry.get("offer_expires_at")
+        return {
+            "waitlist_id": entry_id,
+            "customer_name": entry["customer_name"],
+            "status": entry["status"],
+            "earliest": format_local(entry["earliest"], zone),
+            "latest": format_local(entry["latest"], zone),
+            "offered_time": format_local(offered, zone) if offered else None,
+            "offer_expires_at": format_local(expires, zone) if expires else None,
+            "timezone": zone_label(zone)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error retrieving waitlist entry: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/waitlist/{entry_id}/accept", dependencies=[Depends(admit_request)])
+async def accept_waitlist_offer(entry_id: str):
+    try:
+        entry = await get_waitlist_entry_or_404(entry_id)
+        if entry["status"] != "offered":
+            raise HTTPException(status_code=409, detail=f"Waitlist entry is {entry['status']}, not offered")
+        salon = await catalog.get_salon_by_id(db, entry["salon_id"])
+        service = await catalog.get_service(db, entry["service"], entry["salon_id"]) if salon else None
+        if not salon or not service:
+            raise HTTPException(status_code=404, detail="Salon or service not found")
+        hours = catalog.business_hours(salon)
+        if entry["offer_expires_at"] < hours.now():
+            await waitlist.requeue(db, entry)
+            return {"status": "expired", "message": "The offer has expired; you are back on the waitlist"}
+
+        # Offers don't hold the slot, so check it again
+        start_time = entry["offered_time"]
+        end_time = start_time + timedelta(minutes=entry["duration"])
+        chair, _ = await check_booking_slot(salon, service, start_time, end_time, suggest_next=False)
+        result = None
+        if chair is not None:
+            appointment_doc = {
+                "customer_name": entry["customer_name"],
+                "customer_email": entry.get("customer_email"),
+                "salon": entry["salon"],
+                "service": entry["service"],
+                "salon_id": entry["salon_id"],
+                "service_id": entry["service_id"],
+                "chair": chair,
+                "appointment_time": start_time,
+                "end_time": end_time,
+                "status": "scheduled",
+                "timezone": hours.zone.key
+            }
+            try:
+                result = await appointment_writes.insert_one(db.appointments, appointment_doc)
+            except DuplicateKeyError:
+                result = None
+        if result is None:
+            await waitlist.requeue(db, entry)
+            return {
+                "status": "slot_unavailable",
+                "message": "Sorry, that slot was just taken; you are back on the waitlist"
+            }
+
+        await db.waitlist.update_one(
+            {"_id": entry["_id"]},
+            {"$set": {"status": "booked", "appointment_id": str(result.inserted_id)}}
+        )
+        await notify_schedule_change(entry["salon_id"], start_time, added=appointment_doc)
+        return {
+            "status": "success",
+            "message": "Appointment booked successfully",
+            "appointment_id": str(result.inserted_id),
+            "appointment_time": format_local(start_time, hours.zone),
+            "end_time": format_local(end_time, hours.zone)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error accepting waitlist offer: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/waitlist/{entry_id}/decline")
+async def decline_waitlist_offer(entry_id: str):
+    try:
+        entry = await get_waitlist_entry_or_404(entry_id)
+        result = await db.waitlist.update_one(
+            {"_id": entry["_id"], "status": "offered"},
+            {"$set": {"status": "declined"}}
+        )
+        if result.modified_count == 0:
+            raise HTTPException(status_code=409, detail=f"Waitlist entry is {entry['status']}, not offered")
+        # Pass the freed interval on to the next customer in line
+        await offer_freed_slot(entry["salon_id"], entry["freed_from"], entry["freed_until"])
+        return {"status": "success", "message": "Offer declined"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error declining waitlist offer: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# New series are checked for conflicts over this many upcoming occurrences/days
+RECURRING_CHECK_OCCURRENCES = 12
+RECURRING_CHECK_DAYS = 90
+# Longest window the occurrences listing expands at once
+RECURRING_MAX_WINDOW_DAYS = 366
+
+async def get_series_or_404(series_id):
+    if not ObjectId.is_valid(series_id):
+        raise HTTPException(status_code=404, detail="Recurring series not found")
+    series = await db.appointment_series.find_one({"_id": ObjectId(series_id)})
+    if not series:
+        raise HTTPException(status_code=404, detail="Recurring series not found")
+    return series
+
+@app.post("/api/recurring-appointments", dependencies=[Depends(admit_request)])
+async def create_recurring_appointment(request: RecurringBookingRequest):
+    try:
+        salon = await catalog.get_salon(db, request.salon)
+        service = await catalog.get_service(db, request.service, salon["_id"]) if salon else None
+        if not salon or not service:
+            raise HTTPException(status_code=404, detail="Salon or service not found")
+
+        hours = catalog.business_hours(salon)
+        try:
+            first = hours.parse(request.dateTime).replace(second=0, microsecond=0)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid datetime format: {str(e)}")
+        # Expanding a series walks it from its first occurrence, so it can't start in the past
+        if first < hours.now().replace(second=0, microsecond=0):
+            raise HTTPException(status_code=400, detail="Cannot start a recurring series in the past")
+        try:
+            rule = parse_rule(request.rrule, first)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid recurrence rule: {str(e)}")
+        if not isinstance(rule, rrule):
+            raise HTTPException(status_code=400, detail="Only a single RRULE is supported")
+        try:
+            validate_rule(rule)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid recurrence rule: {str(e)}")
+        duration = service.get("duration", 30)
+
+        # Check the upcoming occurrences lazily - the rule is never expanded in full
+        horizon = first + timedelta(days=RECURRING_CHECK_DAYS)
+        conflicts = []
+        for start in islice(rule.xafter(first, inc=True), RECURRING_CHECK_OCCURRENCES):
+            if start > horizon:
+                break
+            end = start + timedelta(minutes=duration)
+            if not hours.contains(start, end):
+                conflicts.append(format_local(start, hours.zone))
+                continue
+            checker = await load_slot_checker(db, salon, service, start.date())
+            if not checker.fits(checker.minutes(start), checker.minutes(end)):
+                conflicts.append(format_local(start, hours.zone))
+
+        if conflicts:
+            return {
+                "status": "slot_unavailable",
+                "message": "Some occurrences of this series are not available",
+                "conflicts": conflicts
+            }
+
+        series_doc = {
+            "customer_name": request.name,
+            "salon": request.salon,
+            "service": request.service,
+            "salon_id": str(salon["_id"]),
+            "service_id": str(service["_id"]),
+            "rrule": request.rrule,
+            "dtstart": first,
+            "duration": duration,
+            "until": series_until(rule, first),
+            "exdates": [],
+            "status": "active",
+            "timezone": hours.zone.key
+        }
+        result = await db.appointment_series.insert_one(series_doc)
+        # A series touches an open-ended set of days
+        await notify_schedule_change(str(salon["_id"]))
+        return {
+            "status": "success",
+            "message": "Recurring appointment created",
+            "series_id": str(result.inserted_id),
+            "first_appointment_time": format_local(first, hours.zone),
+            "rrule": request.rrule
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error creating recurring appointment: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def parse_day_param(value, name):
+    """A ``YYYY-MM-DD`` query parameter as midnight; a malformed one is a 400"""
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name} {value!r}, expected YYYY-MM-DD")
+
+@app.get("/api/recurring-appointments/{series_id}/occurrences")
+async def get_recurring_occurrences(series_id: str, start: Optional[str] = None, days: int = 30):
+    try:
+        series = await get_series_or_404(series_id)
+        zone = stored_zone(series)
+        window_start = parse_day_param(start, "start") if start else today_local(zone)
+        window_end = window_start + timedelta(days=min(max(days, 1), RECURRING_MAX_WINDOW_DAYS))
+        return {
+            "series_id": series_id,
+            "customer_name": series["customer_name"],
+            "status": series["status"],
+            "occurrences": [
+                {
+                    "appointment_time": format_local(occ_start, zone),
+                    "end_time": format_local(occ_end, zone)
+                }
+                for occ_start, occ_end in iter_occurrences(series, window_start, window_end)
+            ],
+            "timezone": zone_label(zone)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error listing recurring occurrences: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/recurring-appointments/{series_id}/skip")
+async def skip_recurring_occurrence(series_id: str, occurrence: str):
+    try:
+        series = await get_series_or_404(series_id)
+        try:
+            occurrence_time = parse_local(occurrence)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid occurrence format: {str(e)}")
+        # Already-skipped occurrences still count, so skipping twice is harmless
+        window = iter_occurrences(dict(series, exdates=[]), occurrence_time, occurrence_time + timedelta(minutes=1))
+        if not any(start == occurrence_time for start, _ in window):
+            raise HTTPException(status_code=400, detail=f"{occurrence} is not an occurrence of this series")
+        await db.appointment_series.update_one(
+            {"_id": series["_id"]},
+            {"$addToSet": {"exdates": occurrence_time}}
+        )
+        await notify_schedule_change(series["salon_id"], occurrence_time)
+        return {"status": "success", "message": f"Skipped occurrence at {occurrence}"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error skipping recurring occurrence: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/api/recurring-appointments/{series_id}")
+async def cancel_recurring_appointment(series_id: str):
+    try:
+        series = await get_series_or_404(series_id)
+        await db.appointment_series.update_one(
+            {"_id": series["_id"]},
+            {"$set": {"status": "cancelled"}}
+        )
+        await notify_schedule_change(series["salon_id"])
+        return {"status": "success", "message": "Recurring appointment cancelled"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error cancelling recurring appointment: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def opening_before(salon, service_name, after, within):
+    """First free start (salon-local) for the service within ``within`` of the instant ``after``, or None"""
+    service = await catalog.get_service(db, service_name, salon["_id"])
+    if not service:
+        return None
+    hours = catalog.business_hours(salon)
+    after_time = after.astimezone(hours.zone).replace(tzinfo=None)
+    deadline = after_time + within
+    days = (deadline.date() - after_time.date()).days + 1
+    slot, _ = await find_next_fit(
+        db, salon, service, after_time, service.get("duration", 30), days=days, hours=hours
+    )
+    return slot if slot is not None and slot <= deadline else None
+
+@app.get("/api/salons/nearby", dependencies=[Depends(admit_request)])
+async def find_nearby_salons(
+    lat: float,
+    lng: float,
+    radius_km: float = 5,
+    service: Optional[str] = None,
+    after: Optional[str] = None,
+    within_hours: float = 4,
+    limit: int = 5,
+):
+    try:
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise HTTPException(status_code=400, detail="Invalid coordinates")
+        radius_km = min(max(radius_km, 0.1), GEO_MAX_RADIUS_KM)
+        limit = min(max(limit, 1), GEO_MAX_RESULTS)
+
+        # Distance pruning first: only salons inside the radius are considered
+        candidates = await salon_locator.nearby(db, lat, lng, radius_km)
+
+        def describe(distance, salon, slot=None):
+            result = {
+                "salon_id": str(salon["_id"]),
+                "name": salon["name"],
+                "address": salon.get("address"),
+                "distance_km": round(distance, 2)
+            }
+            if service is not None:
+                zone = salon_zone(salon)
+                result["next_available_slot"] = format_local(slot, zone)
+                result["timezone"] = zone_label(zone, slot)
+            return result
+
+        if service is None:
+            return {"salons": [describe(distance, salon) for distance, salon in candidates[:limit]]}
+
+        # Salons may be in different timezones, so the search starts from an instant
+        try:
+            after_instant = parse_instant(after) if after else datetime.now(timezone.utc)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid after {after!r}, expected an ISO datetime")
+        within = timedelta(hours=min(max(within_hours, 0), 24 * NEXT_SLOT_SEARCH_DAYS))
+
+        # Slot searches run nearest first, one batch at a time, until enough salons have an opening
+        results = []
+        searched = 0
+        for i in range(0, len(candidates), limit):
+            batch = candidates[i:i + limit]
+            searched += len(batch)
+            slots = await asyncio.gather(*[
+                opening_before(salon, service, after_instant, within) for _, salon in batch
+            ])
+            results.extend(
+                describe(distance, salon, slot)
+                for (distance, salon), slot in zip(batch, slots) if slot is not None
+            )
+            if len(results) >= limit:
+                break
+        return {"salons": results[:limit], "salons_searched": searched}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error searching nearby salons: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/salons/{salon_id}/calendar.ics")
+async def get_salon_calendar(salon_id: str, request: Request, days: int = 30):
+    try:
+        changed_at = await schedule_clock.last_modified(db, salon_id)
+        if changed_at is None:
+            raise HTTPException(status_code=404, detail="Salon not found")
+
+        salon = await catalog.get_salon_by_id(db, salon_id)
+        if not salon:
+            raise HTTPException(status_code=404, detail="Salon not found")
+
+        days = min(max(days, 1), CALENDAR_MAX_DAYS)
+        zone = salon_zone(salon)
+        window_start = today_local(zone)
+        window_end = window_start + timedelta(days=days)
+        etag, last_modified = feed_validators(salon_id, changed_at, window_start, days, zone)
+        headers = {
+            "ETag": etag,
+            "Last-Modified": http_date(last_modified),
+            "Cache-Control": "private, no-cache"
+        }
+        # Nothing changed since the client's copy: answer without querying appointments
+        if is_not_modified(request.headers, etag, last_modified):
+            return Response(status_code=304, headers=headers)
+
+        return StreamingResponse(
+            stream_calendar(db, salon, window_start, window_end, changed_at),
+            media_type="text/calendar; charset=utf-8",
+            headers=headers
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error building calendar feed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Longest range the daily analytics endpoint returns at once
+ANALYTICS_MAX_DAYS = 366
+
+async def get_salon_or_404(salon_id):
+    salon = await catalog.get_salon_by_id(db, salon_id)
+    if not salon:
+        raise HTTPException(status_code=404, detail="Salon not found")
+    return salon
+
+def open_minutes_per_day(salon):
+    return catalog.business_hours(salon).open_minutes * salon_capacity(salon)
+
+@app.get("/api/salons/{salon_id}/analytics/summary")
+async def get_salon_analytics_summary(salon_id: str):
+    try:
+        salon = await get_salon_or_404(salon_id)
+        summary = await db.salon_analytics.find_one({"_id": str(salon["_id"])}) or {}
+        return {
+            "salon_id": str(salon["_id"]),
+            "bookings": summary.get("bookings", 0),
+            "booked_minutes": summary.get("booked_minutes", 0),
+            "revenue": round(summary.get("revenue", 0), 2),
+            "services": summary.get("services", {}),
+            "heatmap": heatmap_grid(summary),
+            "timezone": zone_label(salon_zone(salon))
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error retrieving salon analytics: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/salons/{salon_id}/analytics/daily")
+async def get_salon_analytics_daily(salon_id: str, start: Optional[str] = None, days: int = 30):
+    try:
+        salon = await get_salon_or_404(salon_id)
+        window_start = (
+            parse_day_param(start, "start") if start
+            else today_local(salon_zone(salon))
+        )
+        window_end = window_start + timedelta(days=min(max(days, 1), ANALYTICS_MAX_DAYS))
+        rollups = await db.rollups_daily.find(
+            {"salon_id": str(salon["_id"]), "day": {"$gte": window_start, "$lt": window_end}}
+        ).sort("day", 1).to_list(length=None)
+        chair_minutes = open_minutes_per_day(salon)
+        return {
+            "salon_id": str(salon["_id"]),
+            "days": [
+                {
+                    "day": rollup["day"].strftime("%Y-%m-%d"),
+                    "bookings": rollup.get("bookings", 0),
+                    "booked_minutes": rollup.get("booked_minutes", 0),
+                    "revenue": round(rollup.get("revenue", 0), 2),
+                    "utilization": round(rollup.get("booked_minutes", 0) / chair_minutes, 4) if chair_minutes else None,
+                    "services": rollup.get("services", {})
+                }
+                for rollup in rollups
+            ],
+            "timezone": zone_label(salon_zone(salon))
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error retrieving daily analytics: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/salons/{salon_id}/analytics/hourly")
+async def get_salon_analytics_hourly(salon_id: str, day: str):
+    try:
+        salon = await get_salon_or_404(salon_id)
+        day_start = parse_day_param(day, "day")
+        rollups = await db.rollups_hourly.find(
+            {"salon_id": str(salon["_id"]), "hour": {"$gte": day_start, "$lt": day_start + timedelta(days=1)}}
+        ).sort("hour", 1).to_list(length=None)
+        capacity = salon_capacity(salon)
+        return {
+            "salon_id": str(salon["_id"]),
+            "day": day,
+            "hours": [
+                {
+                    "hour": rollup["hour_of_day"],
+                    "bookings": rollup.get("bookings", 0),
+                    "booked_minutes": rollup.get("booked_minutes", 0),
+                    "revenue": round(rollup.get("revenue", 0), 2),
+                    "utilization": round(rollup.get("booked_minutes", 0) / (60 * capacity), 4)
+                }
+                for rollup in rollups
+            ],
+            "timezone": zone_label(salon_zone(salon))
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error retrieving hourly analytics: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/admin/analytics/rebuild", dependencies=[Depends(require_admin)])
+async def rebuild_analytics(salon_id: Optional[str] = None):
+    try:
+        counted = await rebuild_rollups(db, salon_id)
+        return {"status": "success", "bookings_counted": counted}
+    except Exception as e:
+        print(f"Error rebuilding analytics: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/admin/profiles", dependencies=[Depends(require_admin)])
+async def get_profiles(route: Optional[str] = None, top: int = 20, sort: str = "tottime"):
+    try:
+        try:
+            summary = await asyncio.to_thread(top_functions, PROFILE_DIR, route, top, sort)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {
+            "sample_rate": PROFILE_SAMPLE_RATE,
+            "routes": profiled_routes(PROFILE_DIR),
+            **summary
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error aggregating profiles: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/cache-stats")
+async def get_cache_stats():
+    return {
+        "availability": availability_cache.stats(),
+        "coalescing": availability_flights.stats(),
+        "idempotency": idempotency_cache.stats(),
+        "waitlist": waitlist.stats(),
+        "geo": salon_locator.stats()
+    }
+
+@app.get("/api/health/live")
+async def liveness():
+    # The process is up and serving; no database round trip
+    return {"status": "alive"}
+
+@app.get("/api/health/ready")
+async def readiness(response: Response):
+    if db is None or not worker_ready:
+        response.status_code = 503
+        return {"status": "not_ready", "message": "Worker is still starting up"}
+    try:
+        await asyncio.wait_for(db.command("ping"), timeout=HEALTH_PING_TIMEOUT_SECONDS)
+    except Exception as e:
+        response.status_code = 503
+        return {"status": "not_ready", "message": str(e) or "Database ping timed out"}
+    return {"status": "ready"}
+
 @app.get("/api/check-db-connection")
 async def check_db_connection():
     try:
@@ -650,164 +1793,90 @@ async def check_db_connection():
             return {"status": "error", "message": "Could not connect to database"}
             
         # Try to ping the database
-        await db.command("ping")
+        await asyncio.wait_for(db.command("ping"), timeout=HEALTH_PING_TIMEOUT_SECONDS)
         
-        # Get collection statistics
-        stats = {
-            "users": await db.users.count_documents({}),
-            "appointments": await db.appointments.count_documents({}),
-            "salons": await db.salons.count_documents({}),
-            "services": await db.services.count_documents({})
-        }
+        # Collection statistics come from the background refresher
+        stats = collection_stats.snapshot()
         
         return {
             "status": "connected",
             "message": "Successfully connected to MongoDB",
-            "collections": stats
+            "collections": stats["collections"],
+            "stats_refreshed_at": stats["refreshed_at"],
+            "pool": pool_monitor.stats()
         }
     except Exception as e:
         print(f"Error checking database connection: {e}")
         return {"status": "error", "message": str(e)}
 
+@app.get("/api/db-stats")
+async def get_db_stats():
+    return {
+        **collection_stats.snapshot(),
+        "pool": pool_monitor.stats(),
+        "archive": archiver.stats(),
+        "admission": admission.stats(),
+        "reminders": reminders.stats() if reminders is not None else None,
+        "snapshot": snapshots.stats() if snapshots is not None else None,
+        "booking_writes": appointment_writes.stats()
+    }
+
+@app.get("/api/startup-stats")
+async def get_startup_stats():
+    return startup_timer.stats()
+
 async def find_next_available_slot(salon: dict, service: dict, after_time: datetime = None):
     try:
         print(f"\nDebug: Starting slot search")
         print(f"Debug: Salon hours: {salon['opening_time']} - {salon['closing_time']}")
         print(f"Debug: Service duration: {service['duration']} minutes")
         
-        # Initialize the search start time
+        # Initialize the search start time; stored appointment times are naive salon-local
+        hours = catalog.business_hours(salon)
         if not after_time:
-            after_time = datetime.now(pytz.UTC)
-        elif not after_time.tzinfo:
-            after_time = pytz.UTC.localize(after_time)
+            after_time = hours.now()
+        elif after_time.tzinfo:
+            after_time = after_time.astimezone(hours.zone)
+        after_time = after_time.replace(tzinfo=None, second=0, microsecond=0)
         
         print(f"Debug: Search start time: {after_time}")
 
-        # Get salon hours
-        opening_time = datetime.strptime(salon["opening_time"], "%H:%M").time()
-        closing_time = datetime.strptime(salon["closing_time"], "%H:%M").time()
-        
-        # Adjust start time to be within business hours
-        current_time = after_time.replace(second=0, microsecond=0)
-        if current_time.time() < opening_time:
-            # If before opening, set to today's opening time
-            current_time = current_time.replace(
-                hour=opening_time.hour,
-                minute=opening_time.minute
-            )
-        elif current_time.time() > closing_time:
-            # If after closing, set to next day's opening time
-            current_time = (current_time + timedelta(days=1)).replace(
-                hour=opening_time.hour,
-                minute=opening_time.minute,
-                second=0,
-                microsecond=0
-            )
-        
-        print(f"Debug: Adjusted start time: {current_time}")
+        # One query per day searched; each day's bookings become a load profile
+        slot, days_checked = await find_next_fit(db, salon, service, after_time, service["duration"], days=7, hours=hours)
+        if slot:
+            print(f"Debug: Found available slot at {slot}")
+            return slot
 
-        # Set end date for search (7 days from start)
-        end_date = after_time + timedelta(days=7)
-        print(f"Debug: Search end date: {end_date}")
-
-        # Get all appointments for the next 7 days
-        appointments = await db.appointments.find({
-            "salon_id": str(salon["_id"]),
-            "appointment_time": {
-                "$gte": current_time,
-                "$lte": end_date
-            },
-            "status": "scheduled"
-        }).sort("appointment_time", 1).to_list(length=None)
-        
-        print(f"Debug: Found {len(appointments)} existing appointments in date range")
-
-        # Service duration in minutes
-        service_duration = timedelta(minutes=service["duration"])
-
-        # Check each 15-minute slot for the next 7 days
-        slots_checked = 0
-        while current_time <= end_date:
-            slots_checked += 1
-            # Skip if outside business hours
-            if current_time.time() < opening_time:
-                # Move to today's opening time
-                current_time = current_time.replace(
-                    hour=opening_time.hour,
-                    minute=opening_time.minute
-                )
-                print(f"Debug: Adjusted to opening time: {current_time}")
-            elif current_time.time() > closing_time:
-                # Move to next day's opening time
-                current_time = (current_time + timedelta(days=1)).replace(
-                    hour=opening_time.hour,
-                    minute=opening_time.minute,
-                    second=0,
-                    microsecond=0
-                )
-                print(f"Debug: Moved to next day: {current_time}")
-                continue
-
-            # Calculate slot end time
-            slot_end = current_time + service_duration
-
-            # Skip if slot would end after closing time
-            if slot_end.time() > closing_time:
-                print(f"Debug: Slot would end after closing time: {slot_end.time()}")
-                # Move to next day's opening time
-                current_time = (current_time + timedelta(days=1)).replace(
-                    hour=opening_time.hour,
-                    minute=opening_time.minute,
-                    second=0,
-                    microsecond=0
-                )
-                continue
-
-            # Check for conflicts with existing appointments
-            has_conflict = False
-            for appt in appointments:
-                # Check if current slot overlaps with any appointment
-                if (current_time < appt["end_time"] and 
-                    slot_end > appt["appointment_time"]):
-                    has_conflict = True
-                    print(f"Debug: Conflict found at {current_time}")
-                    # Move time to the end of conflicting appointment
-                    current_time = appt["end_time"].replace(second=0, microsecond=0)
-                    break
-
-            if not has_conflict:
-                print(f"Debug: Found available slot at {current_time}")
-                return current_time
-
-            # Move to next 15-minute slot if no valid slot found
-            current_time += timedelta(minutes=15)
-
-        print(f"Debug: No available slots found after checking {slots_checked} slots")
+        print(f"Debug: No available slots found after checking {len(days_checked)} days")
         return None
 
     except Exception as e:
         print(f"Error finding next available slot: {str(e)}")
         return None
 
+# Fields the appointment endpoints return
+APPOINTMENT_SUMMARY_PROJECTION = {"customer_name": 1, "appointment_time": 1, "end_time": 1, "status": 1, "timezone": 1}
+
 @app.get("/api/appointments/{appointment_id}")
 async def get_appointment(appointment_id: str):
     try:
-        # Find the appointment
-        appointment = await db.appointments.find_one({"_id": ObjectId(appointment_id)})
+        # Find the appointment, falling back to the monthly archives
+        appointment = await archiver.find_appointment(db, ObjectId(appointment_id), APPOINTMENT_SUMMARY_PROJECTION)
         if not appointment:
             raise HTTPException(status_code=404, detail="Appointment not found")
 
-        # Times are already in IST in the database
+        # Times are stored in the salon's local time
         appointment_time = appointment["appointment_time"]
         end_time = appointment["end_time"]
+        zone = stored_zone(appointment)
 
         return {
             "appointment_id": str(appointment["_id"]),
             "customer_name": appointment["customer_name"],
-            "appointment_time": appointment_time.strftime("%Y-%m-%d %H:%M IST"),
-            "end_time": end_time.strftime("%Y-%m-%d %H:%M IST"),
+            "appointment_time": format_local(appointment_time, zone),
+            "end_time": format_local(end_time, zone),
             "status": appointment["status"],
-            "timezone": "IST"
+            "timezone": zone_label(zone, appointment_time)
         }
     except Exception as e:
         print(f"Error retrieving appointment: {str(e)}")
@@ -816,22 +1885,23 @@ async def get_appointment(appointment_id: str):
 @app.get("/api/appointments")
 async def get_all_appointments():
     try:
-        # Get all appointments
-        appointments = await db.appointments.find({}).to_list(length=None)
+        # Get all appointments, reading only the fields the response uses
+        appointments = await db.appointments.find({}, APPOINTMENT_SUMMARY_PROJECTION).to_list(length=None)
         
-        # Times are already in IST in the database
+        # Times are stored in each salon's local time
         formatted_appointments = []
         for appt in appointments:
             appointment_time = appt["appointment_time"]
             end_time = appt["end_time"]
+            zone = stored_zone(appt)
 
             formatted_appointments.append({
                 "appointment_id": str(appt["_id"]),
                 "customer_name": appt["customer_name"],
-                "appointment_time": appointment_time.strftime("%Y-%m-%d %H:%M IST"),
-                "end_time": end_time.strftime("%Y-%m-%d %H:%M IST"),
+                "appointment_time": format_local(appointment_time, zone),
+                "end_time": format_local(end_time, zone),
                 "status": appt["status"],
-                "timezone": "IST"
+                "timezone": zone_label(zone, appointment_time)
             })
 
         return formatted_appointments
@@ -839,6 +1909,8 @@ async def get_all_appointments():
         print(f"Error retrieving appointments: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+startup_timer.mark("routes")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="127.0.0.1", port=8080)
@@ -0,0 +1,26 @@
+from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
+import os
+
+from modules.migrations import ensure_migrated, rebuild_requested_rollups, LATEST_VERSION
+
+MONGO_URL = os.getenv("SALONOVA_MONGO_URL", "mongodb://localhost:27017")
+
+async def migrate():
+    # Connect to MongoDB
+    client = AsyncIOMotorClient(MONGO_URL, serverSelectionTimeoutMS=5000)
+    db = client.salon_db
+
+    try:
+        ran = await ensure_migrated(db)
+        if ran:
+            print(f"Database migrated to version {LATEST_VERSION}")
+        else:
+            print(f"Database already at version {LATEST_VERSION}")
+        # Workers in external mode don't run rebuilds, so do it here
+        await rebuild_requested_rollups(db)
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
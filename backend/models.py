@@ -19,6 +19,14 @@ class PyObjectId(ObjectId):
         field_schema.update(type="string")
         return field_schema
 
+class StaffMember(BaseModel):
+    name: str
+    services: List[str] = []  # Service names or IDs this stylist performs
+
+class GeoPoint(BaseModel):
+    type: str = "Point"
+    coordinates: List[float]  # [longitude, latitude], GeoJSON order
+
 class Salon(BaseModel):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
     name: str
@@ -28,6 +36,10 @@ class Salon(BaseModel):
     opening_time: str
     closing_time: str
     services: List[str]  # List of service IDs
+    capacity: Optional[int] = None  # Chairs; defaults to len(staff), else 1
+    staff: List[StaffMember] = []
+    location: Optional[GeoPoint] = None
+    timezone: Optional[str] = None  # IANA name, e.g. "Europe/London"; defaults to Asia/Kolkata
 
     model_config = ConfigDict(
         populate_by_name=True,
@@ -42,6 +54,7 @@ class Service(BaseModel):
     duration: int  # Duration in minutes
     price: float
     salon_id: str  # Reference to salon
+    capacity: Optional[int] = None  # Max overlapping bookings of this service
 
     model_config = ConfigDict(
         populate_by_name=True,
@@ -54,8 +67,10 @@ class Appointment(BaseModel):
     salon_id: str
     service_id: str
     customer_name: str
+    customer_email: Optional[str] = None
     appointment_time: datetime
     end_time: datetime
+    chair: Optional[int] = None  # Which of the salon's chairs the booking holds
     status: str = "scheduled"  # scheduled, completed, cancelled
 
     model_config = ConfigDict(
@@ -68,4 +83,5 @@ class BookingRequest(BaseModel):
     name: str
     service: str
     salon: str
-    dateTime: str 
\ No newline at end of file
+    dateTime: str
+    email: Optional[str] = None 
\ No newline at end of file
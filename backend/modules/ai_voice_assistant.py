@@ -1,15 +1,25 @@
-import speech_recognition as sr
-import pyttsx3
+from functools import lru_cache
 
-recognizer = sr.Recognizer()
-engine = pyttsx3.init()
+# speech_recognition and pyttsx3 are slow to import and pyttsx3.init() opens an
+# audio driver, so both wait until the assistant is first used
+@lru_cache(maxsize=None)
+def get_recognizer():
+    import speech_recognition as sr
+    return sr, sr.Recognizer()
+
+@lru_cache(maxsize=None)
+def get_engine():
+    import pyttsx3
+    return pyttsx3.init()
 
 def speak(text):
     print("🤖 Speaking:", text)
+    engine = get_engine()
     engine.say(text)
     engine.runAndWait()
 
 def capture_and_process_appointment():
+    sr, recognizer = get_recognizer()
     speak("Hello! How can I help you with booking an appointment today?")
     speak("Hello! How are you?")
 
@@ -0,0 +1,194 @@
+import asyncio
+from datetime import datetime, timedelta
+
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+ROLLUP_COLLECTIONS = ["rollups_hourly", "rollups_daily", "salon_analytics"]
+
+
+def rollup_increments(salon_id, hour, service_id, minutes, bookings, revenue):
+    """The three rollup updates one (salon, hour, service) bucket contributes.
+
+    Returns ``{collection: (_id, fields_set_on_insert, increments)}``.
+    """
+    salon_id = str(salon_id)
+    service_id = str(service_id or "unknown")
+    day = hour.replace(hour=0)
+    weekday = WEEKDAYS[hour.weekday()]
+    totals = {"booked_minutes": minutes, "bookings": bookings, "revenue": revenue}
+    return {
+        "rollups_hourly": (
+            f"{salon_id}:{hour:%Y-%m-%dT%H}",
+            {"salon_id": salon_id, "hour": hour, "weekday": weekday, "hour_of_day": hour.hour},
+            totals,
+        ),
+        "rollups_daily": (
+            f"{salon_id}:{day:%Y-%m-%d}",
+            {"salon_id": salon_id, "day": day, "weekday": weekday},
+            {
+                **totals,
+                f"services.{service_id}.bookings": bookings,
+                f"services.{service_id}.booked_minutes": minutes,
+                f"services.{service_id}.revenue": revenue,
+            },
+        ),
+        "salon_analytics": (
+            salon_id,
+            {},
+            {
+                **totals,
+                f"heatmap.{weekday}.{hour.hour:02d}.bookings": bookings,
+                f"heatmap.{weekday}.{hour.hour:02d}.booked_minutes": minutes,
+                f"services.{service_id}.bookings": bookings,
+                f"services.{service_id}.booked_minutes": minutes,
+                f"services.{service_id}.revenue": revenue,
+            },
+        ),
+    }
+
+
+def hour_spans(start, end):
+    """``(hour, minutes)`` for every clock hour [start, end) covers; at least the start hour"""
+    hour = start.replace(minute=0, second=0, microsecond=0)
+    while True:
+        next_hour = hour + timedelta(hours=1)
+        yield hour, max(int((min(end, next_hour) - max(start, hour)).total_seconds() // 60), 0)
+        if next_hour >= end:
+            return
+        hour = next_hour
+
+
+def booking_increments(salon_id, service_id, start, end, bookings, revenue):
+    """Rollup updates for ``bookings`` appointments of one service over [start, end).
+
+    Booked minutes are split over the hours the appointments cover, so no
+    hour holds more than 60 minutes per chair; bookings and revenue count
+    towards the hour they start in. Returns ``{(collection, _id):
+    (fields_set_on_insert, increments)}``. Used by both the incremental
+    path and the rebuild, so both produce the same documents.
+    """
+    merged = {}
+    for i, (hour, minutes) in enumerate(hour_spans(start, end)):
+        starts_here = i == 0
+        increments = rollup_increments(
+            salon_id, hour, service_id,
+            minutes * bookings,
+            bookings if starts_here else 0,
+            revenue if starts_here else 0,
+        )
+        for name, (doc_id, on_insert, inc) in increments.items():
+            _, total = merged.setdefault((name, doc_id), (on_insert, {}))
+            for path, amount in inc.items():
+                total[path] = total.get(path, 0) + amount
+    return merged
+
+
+async def record_booking(db, appointment, price, sign=1):
+    """Add (sign=1) or remove (sign=-1) one appointment from the rollups"""
+    increments = booking_increments(
+        appointment["salon_id"],
+        appointment.get("service_id"),
+        appointment["appointment_time"],
+        appointment["end_time"],
+        sign,
+        round(price * sign, 2),
+    )
+    await asyncio.gather(*[
+        db[name].update_one(
+            {"_id": doc_id},
+            {"$inc": inc, "$setOnInsert": on_insert} if on_insert else {"$inc": inc},
+            upsert=True,
+        )
+        for (name, doc_id), (on_insert, inc) in increments.items()
+    ])
+
+
+def _apply(doc, inc):
+    for path, amount in inc.items():
+        *parents, leaf = path.split(".")
+        target = doc
+        for key in parents:
+            target = target.setdefault(key, {})
+        target[leaf] = target.get(leaf, 0) + amount
+
+
+async def appointment_collections(db):
+    """The hot appointments collection and every monthly archive"""
+    from modules.archive import ARCHIVE_PREFIX
+    archives = await db.list_collection_names(filter={"name": {"$regex": f"^{ARCHIVE_PREFIX}"}})
+    return ["appointments"] + sorted(archives)
+
+
+async def rebuild_salon(db, salon_id, prices, collections):
+    """Recompute one salon's rollups from its appointments with an aggregation.
+
+    ``prices`` maps service_id to price. Bookings made while the rebuild
+    runs may be counted twice or missed, so rebuild when traffic is low.
+    """
+    salon_id = str(salon_id)
+    pipeline = [
+        {"$match": {"salon_id": salon_id, "status": {"$in": ["scheduled", "completed"]}}},
+        # Bookings with the same times and service share a row; their minutes are split by hour below
+        {"$group": {
+            "_id": {
+                "start": {"$dateToString": {"format": "%Y-%m-%dT%H:%M", "date": "$appointment_time"}},
+                "end": {"$dateToString": {"format": "%Y-%m-%dT%H:%M", "date": "$end_time"}},
+                "service_id": "$service_id",
+            },
+            "bookings": {"$sum": 1},
+        }},
+    ]
+    docs = {name: {} for name in ROLLUP_COLLECTIONS}
+    for collection in collections:
+        async for row in db[collection].aggregate(pipeline):
+            service_id = row["_id"].get("service_id")
+            increments = booking_increments(
+                salon_id, service_id,
+                datetime.strptime(row["_id"]["start"], "%Y-%m-%dT%H:%M"),
+                datetime.strptime(row["_id"]["end"], "%Y-%m-%dT%H:%M"),
+                row["bookings"],
+                round(prices.get(str(service_id), 0) * row["bookings"], 2),
+            )
+            for (name, doc_id), (on_insert, inc) in increments.items():
+                doc = docs[name].setdefault(doc_id, {"_id": doc_id, **on_insert})
+                _apply(doc, inc)
+
+    for name in ROLLUP_COLLECTIONS:
+        await db[name].delete_many({"_id": salon_id} if name == "salon_analytics" else {"salon_id": salon_id})
+        if docs[name]:
+            await db[name].insert_many(list(docs[name].values()))
+    return sum(doc["bookings"] for doc in docs["rollups_daily"].values())
+
+
+async def rebuild_rollups(db, salon_id=None):
+    """Rebuild the rollups of one salon, or of every salon; returns bookings counted"""
+    salon_filter = {} if salon_id is None else {"salon_id": str(salon_id)}
+    prices = {}
+    async for service in db.services.find(salon_filter, {"salon_id": 1, "price": 1}):
+        prices.setdefault(service["salon_id"], {})[str(service["_id"])] = service.get("price", 0)
+
+    if salon_id is None:
+        salon_ids = [str(salon["_id"]) async for salon in db.salons.find({}, {"_id": 1})]
+    else:
+        salon_ids = [str(salon_id)]
+    collections = await appointment_collections(db)
+    counted = 0
+    for sid in salon_ids:
+        counted += await rebuild_salon(db, sid, prices.get(sid, {}), collections)
+    return counted
+
+
+def heatmap_grid(summary):
+    """Weekday x hour grid of bookings and booked minutes from a salon's summary"""
+    heatmap = (summary or {}).get("heatmap", {})
+    grid = []
+    for weekday in WEEKDAYS:
+        row = []
+        for hour in range(24):
+            cell = heatmap.get(weekday, {}).get(f"{hour:02d}", {})
+            row.append({
+                "hour": hour,
+                "bookings": cell.get("bookings", 0),
+                "booked_minutes": cell.get("booked_minutes", 0),
+            })
+        grid.append({"weekday": weekday, "hours": row})
+    return grid
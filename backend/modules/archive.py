@@ -0,0 +1,134 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from pymongo.errors import BulkWriteError
+
+from modules.migrations import acquire_lock, release_lock, default_owner
+
+ARCHIVE_PREFIX = "appointments_archive_"
+LOCK_ID = "archiver"
+
+
+def archive_collection_name(appointment_time):
+    """Monthly archive collection an appointment belongs to, e.g. appointments_archive_2025_03"""
+    return f"{ARCHIVE_PREFIX}{appointment_time:%Y_%m}"
+
+
+class AppointmentArchiver:
+    """Moves finished appointments out of the hot ``appointments`` collection.
+
+    Appointments whose ``end_time`` is older than the cutoff are copied in
+    batches into monthly archive collections (by ``appointment_time``) and then
+    deleted from ``appointments``, so overlap queries and the
+    ``(salon_id, appointment_time)`` index only cover recent and future slots.
+    Copies are idempotent, so a pass interrupted between insert and delete is
+    simply repeated. One worker at a time runs a pass, guarded by a lock
+    document.
+    """
+
+    def __init__(self, batch_size=500, names_ttl_seconds=300):
+        self.batch_size = batch_size
+        self.names_ttl_seconds = names_ttl_seconds
+        self.archived_total = 0
+        self.last_run_at = None
+        self.last_error = None
+        self._names = None
+        self._names_expire_at = 0
+        self._task = None
+
+    async def archive_collections(self, db):
+        """Archive collection names, newest month first"""
+        if self._names is None or self._names_expire_at < time.monotonic():
+            names = await db.list_collection_names(filter={"name": {"$regex": f"^{ARCHIVE_PREFIX}"}})
+            self._names = sorted(names, reverse=True)
+            self._names_expire_at = time.monotonic() + self.names_ttl_seconds
+        return self._names
+
+    async def archive_batch(self, db, cutoff):
+        docs = await db.appointments.find(
+            {"end_time": {"$lt": cutoff}}
+        ).sort("end_time", 1).limit(self.batch_size).to_list(length=None)
+        if not docs:
+            return 0
+
+        by_month = {}
+        for doc in docs:
+            by_month.setdefault(archive_collection_name(doc["appointment_time"]), []).append(doc)
+        for name, group in by_month.items():
+            try:
+                await db[name].insert_many(group, ordered=False)
+            except BulkWriteError as e:
+                # Already copied by an earlier, interrupted pass
+                if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                    raise
+        self._names = None
+
+        await db.appointments.delete_many({
+            "_id": {"$in": [doc["_id"] for doc in docs]},
+            "end_time": {"$lt": cutoff}
+        })
+        return len(docs)
+
+    async def run_once(self, db, cutoff, owner=None):
+        owner = owner or default_owner()
+        if not await acquire_lock(db, owner, lock_id=LOCK_ID):
+            return 0
+        moved = 0
+        try:
+            while True:
+                count = await self.archive_batch(db, cutoff)
+                moved += count
+                if count < self.batch_size:
+                    break
+                # Keep the lock alive and let request handlers run between batches
+                await acquire_lock(db, owner, lock_id=LOCK_ID)
+                await asyncio.sleep(0)
+        finally:
+            await release_lock(db, owner, lock_id=LOCK_ID)
+        self.archived_total += moved
+        self.last_run_at = datetime.now(timezone.utc)
+        if moved:
+            print(f"Archived {moved} past appointments")
+        return moved
+
+    async def _run(self, db, cutoff_fn, interval_seconds):
+        while True:
+            try:
+                await self.run_once(db, cutoff_fn())
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Warning: appointment archival failed: {e}")
+            await asyncio.sleep(interval_seconds)
+
+    def start(self, db, cutoff_fn, interval_seconds):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(db, cutoff_fn, interval_seconds))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def find_appointment(self, db, appointment_id, projection=None):
+        """Look an appointment up in the hot collection, then in the archives"""
+        appointment = await db.appointments.find_one({"_id": appointment_id}, projection)
+        if appointment is not None:
+            return appointment
+        for name in await self.archive_collections(db):
+            appointment = await db[name].find_one({"_id": appointment_id}, projection)
+            if appointment is not None:
+                return appointment
+        return None
+
+    def stats(self):
+        return {
+            "archived_total": self.archived_total,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_error": self.last_error,
+        }
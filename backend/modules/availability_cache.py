@@ -0,0 +1,108 @@
+import time
+from collections import OrderedDict
+
+from modules.timeutil import earliest_local_now
+
+
+# Pseudo-day whose version every entry of a salon depends on
+SALON_WIDE = "*"
+
+
+class AvailabilityCache:
+    """LRU of check-availability responses with per salon-day versions.
+
+    Entries are keyed by ``(salon_id, service_id, date, time)`` and remember
+    the version of every salon-day their answer depended on. Bookings,
+    cancellations and holds call :meth:`bump`, which makes every dependent
+    entry stale without having to find it. Versions are per process, so
+    ``ttl_seconds`` bounds how long another worker's booking can go unseen.
+    Versions of days that are over in every timezone are dropped once a day.
+    """
+
+    def __init__(self, max_entries=5000, ttl_seconds=30):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._today = None
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def version(self, salon_id, day):
+        return self._versions.get((str(salon_id), str(day)), 0)
+
+    def snapshot(self, salon_id, days):
+        """Versions of ``days`` for ``salon_id``; take this before querying Mongo"""
+        days = [SALON_WIDE] + [str(day) for day in days]
+        return tuple((day, self.version(salon_id, day)) for day in days)
+
+    def narrow(self, deps, days):
+        """Keep only the salon-wide version and the ``days`` an answer actually read"""
+        keep = {SALON_WIDE} | {str(day) for day in days}
+        return tuple(dep for dep in deps if dep[0] in keep)
+
+    def _prune_past_days(self):
+        today = earliest_local_now().date().isoformat()
+        if today == self._today:
+            return
+        self._today = today
+        # Day keys are ISO dates, so they compare as strings
+        past = {key for key in self._versions if key[1] != SALON_WIDE and key[1] < today}
+        for key in past:
+            del self._versions[key]
+        # A dropped version reads as 0 again, which could make an old entry look fresh
+        for key in [key for key, entry in self._entries.items()
+                    if any((entry[1], day) in past for day, _ in entry[2])]:
+            del self._entries[key]
+
+    def bump(self, salon_id, day):
+        self._prune_past_days()
+        key = (str(salon_id), str(day))
+        self._versions[key] = self._versions.get(key, 0) + 1
+
+    def bump_salon(self, salon_id):
+        """Invalidate every day of a salon, e.g. when a recurring series changes"""
+        self.bump(salon_id, SALON_WIDE)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, salon_id, deps, response = entry
+        if expires_at < time.monotonic() or any(
+            self.version(salon_id, day) != version for day, version in deps
+        ):
+            del self._entries[key]
+            self.stale += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return response
+
+    def put(self, key, salon_id, deps, response):
+        # A bump that landed while the answer was computed makes it stale already
+        if any(self.version(salon_id, day) != version for day, version in deps):
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, str(salon_id), deps, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "tracked_salon_days": len(self._versions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,157 @@
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from bson import ObjectId
+
+from modules.recurrence import iter_occurrences, series_window_query
+from modules.timeutil import salon_zone, to_utc
+
+# Stored appointment times are naive salon-local time; the feed publishes them in UTC
+
+
+class ScheduleClock:
+    """When each salon's bookings last changed, kept in memory.
+
+    Every booking change calls :meth:`touch`, which records the time locally
+    and in ``salons.schedule_updated_at`` for other workers. Calendar polls
+    read the local value and only go back to Mongo every
+    ``revalidate_seconds``, so an unchanged feed is answered with a 304
+    without any database query.
+    """
+
+    def __init__(self, revalidate_seconds=15):
+        self.revalidate_seconds = revalidate_seconds
+        self._changed = {}
+
+    async def touch(self, db, salon_id):
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        self._changed[str(salon_id)] = (time.monotonic() + self.revalidate_seconds, now)
+        await db.salons.update_one(
+            {"_id": ObjectId(str(salon_id))},
+            {"$max": {"schedule_updated_at": now}}
+        )
+
+    async def last_modified(self, db, salon_id):
+        """Last booking change for the salon (UTC), or None if the salon does not exist"""
+        entry = self._changed.get(str(salon_id))
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        if not ObjectId.is_valid(str(salon_id)):
+            return None
+        salon = await db.salons.find_one(
+            {"_id": ObjectId(str(salon_id))},
+            {"schedule_updated_at": 1}
+        )
+        if salon is None:
+            return None
+        changed = salon.get("schedule_updated_at") or salon["_id"].generation_time
+        changed = changed.replace(tzinfo=timezone.utc, microsecond=0)
+        self._changed[str(salon_id)] = (time.monotonic() + self.revalidate_seconds, changed)
+        return changed
+
+
+def feed_validators(salon_id, changed_at, window_start, days, zone=None):
+    """ETag and Last-Modified for a feed window; both move when the window rolls over"""
+    window_start_utc = to_utc(window_start, zone)
+    last_modified = max(changed_at, window_start_utc)
+    etag = f'W/"{salon_id}-{int(changed_at.timestamp())}-{window_start:%Y%m%d}-{days}"'
+    return etag, last_modified
+
+
+def is_not_modified(headers, etag, last_modified):
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def http_date(dt):
+    return format_datetime(dt, usegmt=True)
+
+
+def _ics_time(local_time, zone):
+    return to_utc(local_time, zone).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _escape(text):
+    return (str(text).replace("\\", "\\\\").replace(";", "\\;")
+            .replace(",", "\\,").replace("\n", "\\n"))
+
+
+def _fold(line):
+    """Fold content lines at 75 octets as RFC 5545 requires"""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts = []
+    while len(encoded) > 75:
+        cut = 75 if not parts else 74
+        # Don't split a multi-byte character
+        while cut > 0 and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode("utf-8"))
+        encoded = encoded[cut:]
+    parts.append(encoded.decode("utf-8"))
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _event(uid, start, end, summary, status, stamp, zone):
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{uid}",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART:{_ics_time(start, zone)}",
+        f"DTEND:{_ics_time(end, zone)}",
+        f"SUMMARY:{_escape(summary)}",
+        f"STATUS:{status}",
+        "END:VEVENT",
+    ]
+    return "".join(_fold(line) for line in lines)
+
+
+async def stream_calendar(db, salon, window_start, window_end, changed_at):
+    """Yield an iCalendar document for a salon's bookings in the window, chunk by chunk.
+
+    Appointments are read from a cursor rather than loaded as a list, and
+    recurring series are expanded only for the window.
+    """
+    stamp = changed_at.strftime("%Y%m%dT%H%M%SZ")
+    zone = salon_zone(salon)
+    yield "".join(_fold(line) for line in [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//Salonova//Talk2Book//EN",
+        "CALSCALE:GREGORIAN",
+        f"X-WR-CALNAME:{_escape(salon['name'])}",
+    ])
+
+    cursor = db.appointments.find(
+        {
+            "salon_id": str(salon["_id"]),
+            "status": "scheduled",
+            "appointment_time": {"$gte": window_start, "$lt": window_end},
+        },
+        {"appointment_time": 1, "end_time": 1, "customer_name": 1, "service": 1},
+    ).sort("appointment_time", 1)
+    async for appt in cursor:
+        summary = f"{appt.get('service', 'Appointment')} - {appt.get('customer_name', '')}"
+        yield _event(f"{appt['_id']}@salonova", appt["appointment_time"], appt["end_time"], summary, "CONFIRMED", stamp, zone)
+
+    series_cursor = db.appointment_series.find(
+        series_window_query(salon["_id"], window_start, window_end),
+        {"rrule": 1, "dtstart": 1, "duration": 1, "exdates": 1, "customer_name": 1, "service": 1},
+    )
+    async for series in series_cursor:
+        summary = f"{series.get('service', 'Appointment')} - {series.get('customer_name', '')}"
+        for start, end in iter_occurrences(series, window_start, window_end):
+            uid = f"{series['_id']}-{start:%Y%m%dT%H%M}@salonova"
+            yield _event(uid, start, end, summary, "CONFIRMED", stamp, zone)
+
+    yield "END:VCALENDAR\r\n"
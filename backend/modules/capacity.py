@@ -0,0 +1,330 @@
+import os
+from bisect import bisect_left, bisect_right
+from datetime import datetime, time, timedelta
+
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+from modules.recurrence import load_occurrences
+from modules.timeutil import BusinessHours
+
+# Conflict reads only need these fields, all of which are in the
+# (salon_id, status, appointment_time, end_time, service_id, chair) index created
+# by migrations, so Mongo answers them from the index without fetching documents
+SLOT_PROJECTION = {"appointment_time": 1, "end_time": 1, "service_id": 1, "chair": 1, "_id": 0}
+
+# Decode conflict results lazily as raw BSON instead of building dicts
+RAW_BSON = os.getenv("SALONOVA_RAW_BSON", "0") == "1"
+RAW_CODEC_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+
+def appointments_reader(db):
+    if RAW_BSON:
+        return db.appointments.with_options(codec_options=RAW_CODEC_OPTIONS)
+    return db.appointments
+
+
+def overlap_query(salon_id, start, end):
+    return {
+        "salon_id": str(salon_id),
+        "status": "scheduled",
+        "appointment_time": {"$lt": end},
+        "end_time": {"$gt": start},
+    }
+
+
+def salon_capacity(salon):
+    """Chairs a salon can run at once: explicit capacity, else staff roster size, else 1"""
+    if salon.get("capacity"):
+        return int(salon["capacity"])
+    if salon.get("staff"):
+        return len(salon["staff"])
+    return 1
+
+
+def service_capacity(salon, service):
+    """How many bookings of one service may overlap, or None if only the salon limit applies"""
+    if service.get("capacity"):
+        return int(service["capacity"])
+    staff = salon.get("staff")
+    if staff:
+        keys = {service.get("name"), str(service.get("_id"))}
+        return sum(1 for member in staff if keys & set(member.get("services", [])))
+    return None
+
+
+class LoadProfile:
+    """Concurrent bookings over one day as a step function of minute offsets.
+
+    Built once from the day's intervals with a sweep over start/end events
+    (prefix sums of +1/-1; O(n log n) for the sort), so "how many bookings
+    overlap [start, end)?" is a bisect plus a scan of the segments inside the
+    window instead of a query per candidate slot. A check only asks about a
+    handful of windows, so nothing is precomputed for range queries.
+    ``held`` lists the ``(start, end, chair)`` of bookings that were given a
+    chair, so a new booking can be put on one nobody overlapping it is using.
+    """
+
+    def __init__(self, intervals, held=()):
+        deltas = {}
+        for start, end in intervals:
+            if end <= start:
+                continue
+            deltas[start] = deltas.get(start, 0) + 1
+            deltas[end] = deltas.get(end, 0) - 1
+        self.bounds = sorted(deltas)
+        # loads[i] is the number of bookings during [bounds[i], bounds[i + 1])
+        self.loads = []
+        current = 0
+        for bound in self.bounds:
+            current += deltas[bound]
+            self.loads.append(current)
+        self.held = [(start, end, chair) for start, end, chair in held if end > start]
+
+    def free_chair(self, start, end):
+        """Lowest chair id no booking overlapping [start, end) holds"""
+        taken = {chair for held_start, held_end, chair in self.held if held_start < end and held_end > start}
+        chair = 0
+        while chair in taken:
+            chair += 1
+        return chair
+
+    def max_load(self, start, end):
+        """Highest number of concurrent bookings anywhere in [start, end)"""
+        lo = max(bisect_right(self.bounds, start) - 1, 0)
+        hi = bisect_left(self.bounds, end) - 1
+        if hi < lo:
+            return 0
+        return max(self.loads[lo:hi + 1])
+
+    def next_bound(self, after):
+        """First minute after ``after`` where the load changes, or None"""
+        i = bisect_right(self.bounds, after)
+        return self.bounds[i] if i < len(self.bounds) else None
+
+
+class SlotChecker:
+    """Answers "is there a free chair?" for one salon, service and day"""
+
+    def __init__(self, day, salon_load, salon_limit, service_load=None, service_limit=None):
+        self.day = day
+        self.day_start = datetime.combine(day, time.min)
+        self.salon_load = salon_load
+        self.salon_limit = salon_limit
+        self.service_load = service_load
+        self.service_limit = service_limit
+
+    def minutes(self, dt):
+        return int((dt - self.day_start).total_seconds() // 60)
+
+    def at(self, minute):
+        return self.day_start + timedelta(minutes=minute)
+
+    def fits(self, start, end):
+        if self.salon_load.max_load(start, end) >= self.salon_limit:
+            return False
+        if self.service_limit is not None and self.service_load.max_load(start, end) >= self.service_limit:
+            return False
+        return True
+
+    def chair(self, start, end):
+        """Index of the chair a booking of [start, end) would take (0-based)"""
+        return self.salon_load.free_chair(start, end)
+
+    def first_fit(self, earliest, duration, latest_start):
+        """Earliest start >= earliest with room for ``duration`` minutes, or None"""
+        start = earliest
+        while start <= latest_start:
+            if self.fits(start, start + duration):
+                return start
+            # Loads only change at interval bounds, so jump straight to the next one
+            candidates = [self.salon_load.next_bound(start)]
+            if self.service_limit is not None:
+                candidates.append(self.service_load.next_bound(start))
+            candidates = [c for c in candidates if c is not None]
+            if not candidates:
+                return None
+            start = min(candidates)
+        return None
+
+
+class PackageChecker(SlotChecker):
+    """Answers "do these services fit back to back from ``start``?" for one salon-day.
+
+    The customer holds a chair for the whole package, so the salon limit is
+    checked over the combined window and each service's own limit over its
+    leg. ``legs`` is a list of ``(offset, duration, service_load, service_limit)``.
+    """
+
+    def __init__(self, day, salon_load, salon_limit, legs):
+        super().__init__(day, salon_load, salon_limit)
+        self.legs = legs
+        self.duration = sum(leg[1] for leg in legs)
+
+    def fits_package(self, start):
+        if self.salon_load.max_load(start, start + self.duration) >= self.salon_limit:
+            return False
+        for offset, duration, load, limit in self.legs:
+            if limit is not None and load.max_load(start + offset, start + offset + duration) >= limit:
+                return False
+        return True
+
+    def chairs(self, start):
+        """Chair index for each leg starting at ``start``; the customer keeps one chair throughout"""
+        return [self.salon_load.free_chair(start, start + self.duration)] * len(self.legs)
+
+    def first_package_fit(self, earliest, latest_start):
+        start = earliest
+        while start <= latest_start:
+            if self.fits_package(start):
+                return start
+            candidates = [self.salon_load.next_bound(start)]
+            for offset, _, load, limit in self.legs:
+                if limit is not None:
+                    bound = load.next_bound(start + offset)
+                    candidates.append(bound - offset if bound is not None else None)
+            candidates = [c for c in candidates if c is not None and c > start]
+            if not candidates:
+                return None
+            start = min(candidates)
+        return None
+
+
+async def has_overlap(db, salon_id, start, end):
+    """Whether any scheduled booking overlaps [start, end), without decoding any of them"""
+    doc = await db.appointments.find_one(
+        overlap_query(salon_id, start, end),
+        {"appointment_time": 1, "_id": 0}
+    )
+    return doc is not None
+
+
+async def load_day_intervals(db, salon, day, released=()):
+    """One salon-day of scheduled bookings as minute intervals, from a single query.
+
+    Returns ``(salon_intervals, intervals_by_service_id, held_chairs)``.
+    Only the covered fields are read. Occurrences of recurring series are
+    expanded for this day only and hold no particular chair. ``released``
+    lists ``(start, end, service_id, chair)`` bookings to leave out, e.g.
+    the one being rescheduled.
+    """
+    day_start = datetime.combine(day, time.min)
+    day_end = day_start + timedelta(days=1)
+    docs = await appointments_reader(db).find(
+        overlap_query(salon["_id"], day_start, day_end),
+        SLOT_PROJECTION,
+    ).to_list(length=None)
+
+    def interval(start, end):
+        return (
+            int((start - day_start).total_seconds() // 60),
+            int((end - day_start).total_seconds() // 60),
+        )
+
+    salon_intervals = []
+    by_service = {}
+    held = []
+    for doc in docs:
+        booked = interval(doc["appointment_time"], doc["end_time"])
+        salon_intervals.append(booked)
+        by_service.setdefault(doc.get("service_id"), []).append(booked)
+        if doc.get("chair") is not None:
+            held.append((*booked, doc["chair"]))
+
+    for start, end, service_id, chair in released:
+        if start.date() != day:
+            continue
+        booked = interval(start, end)
+        if booked in salon_intervals:
+            salon_intervals.remove(booked)
+            if booked in by_service.get(service_id, []):
+                by_service[service_id].remove(booked)
+            if chair is not None and (*booked, chair) in held:
+                held.remove((*booked, chair))
+
+    for start, end, service_id in await load_occurrences(db, salon["_id"], day_start, day_end):
+        booked = interval(start, end)
+        salon_intervals.append(booked)
+        by_service.setdefault(service_id, []).append(booked)
+
+    return salon_intervals, by_service, held
+
+
+async def load_slot_checker(db, salon, service, day, released=()):
+    """Fetch one salon-day of scheduled bookings and build its SlotChecker"""
+    salon_intervals, by_service, held = await load_day_intervals(db, salon, day, released)
+    return SlotChecker(
+        day,
+        LoadProfile(salon_intervals, held),
+        salon_capacity(salon),
+        LoadProfile(by_service.get(str(service["_id"]), [])),
+        service_capacity(salon, service),
+    )
+
+
+async def load_package_checker(db, salon, services, day):
+    """PackageChecker for ``services`` booked back to back, from one salon-day query"""
+    salon_intervals, by_service, held = await load_day_intervals(db, salon, day)
+    legs = []
+    offset = 0
+    for service in services:
+        duration = service.get("duration", 30)
+        legs.append((
+            offset,
+            duration,
+            LoadProfile(by_service.get(str(service["_id"]), [])),
+            service_capacity(salon, service),
+        ))
+        offset += duration
+    return PackageChecker(day, LoadProfile(salon_intervals, held), salon_capacity(salon), legs)
+
+
+async def slot_is_free(db, salon, service, start, end):
+    """Cheap pre-check for single-chair salons; None means a full load profile is needed.
+
+    A one-chair salon is free exactly when nothing overlaps, which a
+    ``limit(1)`` existence query answers without pulling the day's bookings.
+    """
+    if salon_capacity(salon) != 1 or service_capacity(salon, service) is not None:
+        return None
+    if await has_overlap(db, salon["_id"], start, end):
+        return False
+    for _ in await load_occurrences(db, salon["_id"], start, end):
+        return False
+    return True
+
+
+async def find_next_package_fit(db, salon, services, after, days=7, hours=None):
+    """Earliest start at or after ``after`` where ``services`` fit back to back.
+
+    Returns ``(slot, checker)`` for the day found, or ``(None, None)``.
+    """
+    hours = hours or BusinessHours(salon)
+    opening, closing = hours.opening, hours.closing
+    for offset in range(days):
+        day = after.date() + timedelta(days=offset)
+        checker = await load_package_checker(db, salon, services, day)
+        earliest = opening if offset else max(opening, checker.minutes(after))
+        start = checker.first_package_fit(earliest, closing - checker.duration)
+        if start is not None:
+            return checker.at(start), checker
+    return None, None
+
+
+async def find_next_fit(db, salon, service, after, duration, days=7, released=(), hours=None):
+    """Earliest start at or after ``after`` within business hours, searching ``days`` days.
+
+    Returns ``(slot, days_loaded)``; ``slot`` is None when nothing fits.
+    """
+    hours = hours or BusinessHours(salon)
+    opening, closing = hours.opening, hours.closing
+    days_loaded = []
+    for offset in range(days):
+        day = after.date() + timedelta(days=offset)
+        days_loaded.append(day)
+        checker = await load_slot_checker(db, salon, service, day, released)
+        earliest = opening if offset else max(opening, checker.minutes(after))
+        start = checker.first_fit(earliest, duration, closing - duration)
+        if start is not None:
+            return checker.at(start), days_loaded
+    return None, days_loaded
@@ -0,0 +1,86 @@
+import time
+
+from bson import ObjectId
+
+from modules.timeutil import BusinessHours
+
+
+class Catalog:
+    """Short-lived in-process cache of salon and service documents.
+
+    Salons and services change rarely compared to how often every booking
+    request looks them up by name, so lookups are served from memory for
+    ``ttl_seconds`` before going back to Mongo. Misses are not cached, so a
+    newly added salon shows up on the next request. Each cached salon keeps
+    its precomputed :class:`BusinessHours`.
+    """
+
+    def __init__(self, ttl_seconds=60):
+        self.ttl_seconds = ttl_seconds
+        self._salons_by_name = {}
+        self._salons_by_id = {}
+        self._services = {}
+
+    def _fresh(self, entry):
+        return entry is not None and entry[0] > time.monotonic()
+
+    def _remember_salon(self, salon):
+        entry = (time.monotonic() + self.ttl_seconds, salon, BusinessHours(salon))
+        self._salons_by_name[salon["name"]] = entry
+        self._salons_by_id[str(salon["_id"])] = entry
+
+    async def get_salon(self, db, name):
+        entry = self._salons_by_name.get(name)
+        if self._fresh(entry):
+            return entry[1]
+        salon = await db.salons.find_one({"name": name})
+        if salon is not None:
+            self._remember_salon(salon)
+        return salon
+
+    async def get_salon_by_id(self, db, salon_id):
+        entry = self._salons_by_id.get(str(salon_id))
+        if self._fresh(entry):
+            return entry[1]
+        if not ObjectId.is_valid(str(salon_id)):
+            return None
+        salon = await db.salons.find_one({"_id": ObjectId(str(salon_id))})
+        if salon is not None:
+            self._remember_salon(salon)
+        return salon
+
+    async def get_service(self, db, name, salon_id):
+        key = (str(salon_id), name)
+        entry = self._services.get(key)
+        if self._fresh(entry):
+            return entry[1]
+        service = await db.services.find_one({"name": name, "salon_id": str(salon_id)})
+        if service is not None:
+            self._services[key] = (time.monotonic() + self.ttl_seconds, service)
+        return service
+
+    def business_hours(self, salon):
+        """Opening window and timezone of a salon document"""
+        entry = self._salons_by_id.get(str(salon["_id"]))
+        if entry is not None and entry[1] is salon:
+            return entry[2]
+        return BusinessHours(salon)
+
+    def export(self):
+        """The fresh cached ``(salons, services)``, for a snapshot"""
+        salons = [entry[1] for entry in self._salons_by_id.values() if self._fresh(entry)]
+        services = [entry[1] for entry in self._services.values() if self._fresh(entry)]
+        return salons, services
+
+    def restore(self, salons, services):
+        """Seed the cache from a snapshot; entries expire after the usual TTL"""
+        for salon in salons:
+            self._remember_salon(salon)
+        for service in services:
+            key = (str(service["salon_id"]), service["name"])
+            self._services[key] = (time.monotonic() + self.ttl_seconds, service)
+
+    def invalidate(self):
+        self._salons_by_name.clear()
+        self._salons_by_id.clear()
+        self._services.clear()
@@ -0,0 +1,136 @@
+import asyncio
+import threading
+from datetime import datetime, timezone
+
+from pymongo import monitoring
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Connection pool counters fed by pymongo's CMAP events.
+
+    Motor drives pymongo from worker threads, so counters are guarded by a
+    lock. ``available`` is idle connections already open; ``wait_queue`` is
+    checkouts that have started but not yet got a connection.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.pools_cleared = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pools_cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self.waiting += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.waiting -= 1
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.waiting -= 1
+            self.in_use += 1
+            self.checkouts += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "open": self.open,
+                "in_use": self.in_use,
+                "available": max(self.open - self.in_use, 0),
+                "wait_queue": self.waiting,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "pools_cleared": self.pools_cleared,
+            }
+
+
+class CollectionStats:
+    """Document counts refreshed in the background and served from memory.
+
+    Uses ``estimated_document_count`` (collection metadata) rather than
+    ``count_documents({})``, which scans the whole collection.
+    """
+
+    def __init__(self, collections, interval_seconds=30):
+        self.collections = list(collections)
+        self.interval_seconds = interval_seconds
+        self.counts = {}
+        self.refreshed_at = None
+        self.last_error = None
+        self._task = None
+
+    async def refresh(self, db):
+        counts = {}
+        for name in self.collections:
+            counts[name] = await db[name].estimated_document_count()
+        self.counts = counts
+        self.refreshed_at = datetime.now(timezone.utc)
+        self.last_error = None
+
+    async def _run(self, db):
+        while True:
+            try:
+                await self.refresh(db)
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Warning: could not refresh collection stats: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self, db):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self):
+        return {
+            "collections": self.counts,
+            "refreshed_at": self.refreshed_at.isoformat() if self.refreshed_at else None,
+            "last_error": self.last_error,
+        }
+
+
+async def warm_pool(db, connections):
+    """Open ``connections`` pooled sockets by pinging concurrently"""
+    await asyncio.gather(*[db.command("ping") for _ in range(max(connections, 1))])
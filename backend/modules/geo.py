@@ -0,0 +1,121 @@
+import math
+import time
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def salon_coordinates(salon):
+    """``(lat, lng)`` from a salon's GeoJSON location, or None"""
+    location = salon.get("location") or {}
+    coordinates = location.get("coordinates")
+    if location.get("type") != "Point" or not coordinates or len(coordinates) != 2:
+        return None
+    lng, lat = coordinates
+    return lat, lng
+
+
+class GridIndex:
+    """Salons bucketed into ``cell_degrees`` x ``cell_degrees`` cells.
+
+    A radius query only looks at the cells overlapping the circle's bounding
+    box and measures exact distances for the salons in them, so it costs
+    O(salons nearby) rather than O(all salons).
+    """
+
+    def __init__(self, salons, cell_degrees=0.05):
+        self.cell_degrees = cell_degrees
+        self.cells = {}
+        self.size = 0
+        for salon in salons:
+            coordinates = salon_coordinates(salon)
+            if coordinates is None:
+                continue
+            self.cells.setdefault(self._cell(*coordinates), []).append((coordinates, salon))
+            self.size += 1
+
+    def _cell(self, lat, lng):
+        return math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees)
+
+    def within(self, lat, lng, radius_km):
+        """``(distance_km, salon)`` pairs within the radius, nearest first"""
+        lat_delta = radius_km / KM_PER_DEGREE_LAT
+        # Longitude degrees shrink towards the poles
+        lng_delta = radius_km / max(KM_PER_DEGREE_LAT * math.cos(math.radians(lat)), 1e-6)
+        lat_lo, lng_lo = self._cell(max(lat - lat_delta, -90), max(lng - lng_delta, -180))
+        lat_hi, lng_hi = self._cell(min(lat + lat_delta, 90), min(lng + lng_delta, 180))
+
+        found = []
+        for cell_lat in range(lat_lo, lat_hi + 1):
+            for cell_lng in range(lng_lo, lng_hi + 1):
+                for (salon_lat, salon_lng), salon in self.cells.get((cell_lat, cell_lng), ()):
+                    distance = haversine_km(lat, lng, salon_lat, salon_lng)
+                    if distance <= radius_km:
+                        found.append((distance, salon))
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+
+class SalonLocator:
+    """In-memory grid of salon locations, reloaded from Mongo every ``ttl_seconds``.
+
+    Salons without a ``location`` are left out. With ``backend="mongo"`` each
+    query goes to the ``2dsphere`` index through ``$geoNear`` instead, which
+    suits deployments where every worker holding all salons is too much.
+    """
+
+    def __init__(self, ttl_seconds=300, cell_degrees=0.05, backend="memory"):
+        self.ttl_seconds = ttl_seconds
+        self.cell_degrees = cell_degrees
+        self.backend = backend
+        self._index = None
+        self._expires_at = 0
+
+    async def _grid(self, db):
+        if self._index is None or self._expires_at < time.monotonic():
+            salons = await db.salons.find({"location": {"$exists": True}}).to_list(length=None)
+            self._index = GridIndex(salons, self.cell_degrees)
+            self._expires_at = time.monotonic() + self.ttl_seconds
+        return self._index
+
+    async def nearby(self, db, lat, lng, radius_km):
+        """``(distance_km, salon)`` pairs within ``radius_km``, nearest first"""
+        if self.backend == "mongo":
+            cursor = db.salons.aggregate([
+                {"$geoNear": {
+                    "near": {"type": "Point", "coordinates": [lng, lat]},
+                    "distanceField": "distance_m",
+                    "maxDistance": radius_km * 1000,
+                    "spherical": True,
+                }},
+            ])
+            return [(salon.pop("distance_m") / 1000, salon) async for salon in cursor]
+        return (await self._grid(db)).within(lat, lng, radius_km)
+
+    def export(self):
+        """Salons in the in-memory grid, for a snapshot"""
+        if self._index is None:
+            return []
+        return [salon for cell in self._index.cells.values() for _, salon in cell]
+
+    def restore(self, salons):
+        if self.backend == "memory" and salons:
+            self._index = GridIndex(salons, self.cell_degrees)
+            self._expires_at = time.monotonic() + self.ttl_seconds
+
+    def invalidate(self):
+        self._index = None
+
+    def stats(self):
+        return {
+            "backend": self.backend,
+            "salons": self._index.size if self._index else 0,
+            "cells": len(self._index.cells) if self._index else 0,
+        }
@@ -0,0 +1,144 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+
+class IdempotencyConflict(Exception):
+    """Raised when an Idempotency-Key is reused with a different request body"""
+
+
+def request_fingerprint(*parts):
+    """Stable hash of the request payload an idempotency key was first used with"""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class IdempotencyCache:
+    """Bounded LRU of booking results keyed by Idempotency-Key.
+
+    The in-memory LRU answers retries that land on the same worker. When a
+    Mongo collection is supplied, results are also written there (with a TTL
+    index on ``expires_at``) so a retry routed to another worker still replays
+    the original response instead of booking again.
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=24 * 60 * 60):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _get_local(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry["expires_at"] < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put_local(self, key, fingerprint, response):
+        self._entries[key] = {
+            "fingerprint": fingerprint,
+            "response": response,
+            "expires_at": time.monotonic() + self.ttl_seconds,
+        }
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _get_shared(self, collection, key):
+        if collection is None:
+            return None
+        doc = await collection.find_one({"_id": key}, {"fingerprint": 1, "response": 1})
+        if doc is None:
+            return None
+        # Promote into the local LRU so the next retry skips Mongo as well
+        self._put_local(key, doc["fingerprint"], doc["response"])
+        return doc
+
+    async def _put_shared(self, collection, key, fingerprint, response):
+        if collection is None:
+            return
+        try:
+            now = datetime.now(timezone.utc)
+            await collection.update_one(
+                {"_id": key},
+                {"$setOnInsert": {
+                    "fingerprint": fingerprint,
+                    "response": response,
+                    "created_at": now,
+                    "expires_at": now + timedelta(seconds=self.ttl_seconds),
+                }},
+                upsert=True,
+            )
+        except Exception as e:
+            # The local entry still protects retries on this worker
+            print(f"Warning: could not persist idempotency key {key}: {e}")
+
+    async def execute(self, key, fingerprint, compute, collection=None, cacheable=None):
+        """Return ``(response, replayed)`` for ``key``, running ``compute`` at most once.
+
+        Concurrent requests with the same key wait for the first one instead of
+        racing it. Only responses accepted by ``cacheable`` are stored, so a
+        retry after a transient error runs the booking again.
+        """
+        while True:
+            entry = self._get_local(key)
+            pending = self._in_flight.get(key) if entry is None else None
+            if pending is None:
+                break
+            entry = await asyncio.shield(pending)
+            if entry is not None:
+                break
+            # The leader's response was not stored; look again so only one waiter takes over
+
+        future = None
+        if entry is None:
+            # Claimed before the next await, so later requests wait behind this one
+            future = asyncio.get_running_loop().create_future()
+            self._in_flight[key] = future
+        try:
+            if entry is None:
+                entry = await self._get_shared(collection, key)
+                if entry is not None:
+                    future.set_result(entry)
+
+            if entry is not None:
+                if entry["fingerprint"] != fingerprint:
+                    raise IdempotencyConflict(f"Idempotency-Key {key!r} was already used with a different request")
+                self.hits += 1
+                return entry["response"], True
+
+            self.misses += 1
+            response = await compute()
+            if cacheable is None or cacheable(response):
+                self._put_local(key, fingerprint, response)
+                await self._put_shared(collection, key, fingerprint, response)
+                future.set_result({"fingerprint": fingerprint, "response": response})
+            else:
+                future.set_result(None)
+            return response, False
+        except BaseException:
+            if future is not None and not future.done():
+                future.set_result(None)
+            raise
+        finally:
+            # Only this request's own claim; a waiter may already have taken over the key
+            if future is not None and self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "in_flight": len(self._in_flight),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,305 @@
+import asyncio
+import os
+import socket
+from contextlib import asynccontextmanager, suppress
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+from modules.analytics import rebuild_rollups
+
+# Index creation and seeding used to run in every process on startup. They are
+# now numbered steps applied once per database: either by one worker that wins
+# the lock document (leader mode) or by `python backend/migrate.py` run as a
+# separate deploy step.
+
+LOCK_ID = "migrations"
+# Full rollup rebuilds scan every booking, so steps only ask for one and it
+# runs outside the startup lock (see rebuild_requested_rollups)
+ROLLUP_LOCK_ID = "rollups"
+LOCK_TTL_SECONDS = 120
+# Production databases can start empty instead of with the demo salon
+SEED_SAMPLE_DATA = os.getenv("SALONOVA_SEED_SAMPLE_DATA", "true").lower() == "true"
+
+
+async def create_appointment_indexes(db):
+    await db.appointments.create_index([("salon_id", 1), ("appointment_time", 1)])
+    await db.appointments.create_index([("status", 1)])
+    # Guarded bookings against double inserts; replaced by migration 5
+    await db.appointments.create_index([
+        ("salon", 1),
+        ("appointment_time", 1),
+        ("status", 1)
+    ], unique=True)
+
+
+async def create_idempotency_ttl_index(db):
+    # Each key document carries its own expiry time
+    await db.idempotency_keys.create_index([("expires_at", 1)], expireAfterSeconds=0)
+
+
+async def create_archival_index(db):
+    # The archiver scans finished appointments oldest first
+    await db.appointments.create_index([("end_time", 1)])
+
+
+async def create_chair_indexes(db):
+    # One unique booking per start time per salon stops capacity > 1, so
+    # concurrent bookings are told apart by the chair they were given
+    existing = await db.appointments.index_information()
+    if "salon_1_appointment_time_1_status_1" in existing:
+        await db.appointments.drop_index("salon_1_appointment_time_1_status_1")
+    await db.appointments.create_index([("salon", 1), ("appointment_time", 1)])
+    await db.appointments.create_index(
+        [("salon_id", 1), ("appointment_time", 1), ("chair", 1)],
+        unique=True,
+        partialFilterExpression={"status": "scheduled", "chair": {"$exists": True}},
+    )
+
+
+async def create_series_index(db):
+    # Conflict checks fetch a salon's active series that overlap the window
+    await db.appointment_series.create_index([("salon_id", 1), ("status", 1), ("dtstart", 1)])
+
+
+async def backfill_appointment_ids(db):
+    # Bookings made before salon_id/service_id were stored only name their
+    # salon and service; give them ids so hot queries can filter on salon_id alone
+    async for salon in db.salons.find({}, {"name": 1}):
+        await db.appointments.update_many(
+            {"salon": salon["name"], "salon_id": {"$exists": False}},
+            {"$set": {"salon_id": str(salon["_id"])}}
+        )
+    async for service in db.services.find({}, {"name": 1, "salon_id": 1}):
+        await db.appointments.update_many(
+            {"salon_id": service["salon_id"], "service": service["name"], "service_id": {"$exists": False}},
+            {"$set": {"service_id": str(service["_id"])}}
+        )
+
+
+async def create_covered_conflict_index(db):
+    # Holds every field conflict checks filter on or read, so they are covered
+    await db.appointments.create_index(
+        [("salon_id", 1), ("status", 1), ("appointment_time", 1), ("end_time", 1), ("service_id", 1)]
+    )
+
+
+async def create_waitlist_indexes(db):
+    # Workers load one salon-day of waiting entries at a time
+    await db.waitlist.create_index([("salon_id", 1), ("day", 1), ("status", 1)])
+    await db.waitlist.create_index([("expires_at", 1)], expireAfterSeconds=0)
+
+
+async def create_rollup_indexes(db):
+    # Dashboards read a salon's rollups by time range; existing bookings are rolled up once
+    await db.rollups_hourly.create_index([("salon_id", 1), ("hour", 1)])
+    await db.rollups_daily.create_index([("salon_id", 1), ("day", 1)])
+    await request_rollup_rebuild(db)
+
+
+async def request_rollup_rebuild(db):
+    await db.migrations.update_one(
+        {"_id": ROLLUP_LOCK_ID},
+        {"$set": {"requested_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+
+
+async def create_salon_location_index(db):
+    # Rejects malformed GeoJSON and serves $geoNear for SALONOVA_GEO_BACKEND=mongo
+    await db.salons.create_index([("location", "2dsphere")])
+
+
+async def add_chair_to_conflict_index(db):
+    # Conflict checks also read each booking's chair to hand out a free one
+    await db.appointments.create_index(
+        [("salon_id", 1), ("status", 1), ("appointment_time", 1), ("end_time", 1), ("service_id", 1), ("chair", 1)]
+    )
+    existing = await db.appointments.index_information()
+    old = "salon_id_1_status_1_appointment_time_1_end_time_1_service_id_1"
+    if old in existing:
+        await db.appointments.drop_index(old)
+
+
+async def create_rescheduled_index(db):
+    # Snapshot catch-up finds bookings moved since the snapshot was taken
+    await db.appointments.create_index([("rescheduled_at", 1)], sparse=True)
+
+
+async def seed_sample_data(db):
+    if not SEED_SAMPLE_DATA or await db.salons.count_documents({}) > 0:
+        return
+    # Add sample salon
+    salon = {
+        "name": "Elegant Cuts",
+        "address": "123 Main St",
+        "phone": "555-0101",
+        "email": "elegant@cuts.com",
+        "opening_time": "09:00",
+        "closing_time": "17:00",
+        "location": {"type": "Point", "coordinates": [72.5714, 23.0225]},
+        "services": []
+    }
+    result = await db.salons.insert_one(salon)
+
+    # Add sample service
+    service = {
+        "name": "Haircut",
+        "description": "Basic haircut and styling",
+        "duration": 30,
+        "price": 30.00,
+        "salon_id": str(result.inserted_id)
+    }
+    service_result = await db.services.insert_one(service)
+
+    # Update salon's services
+    await db.salons.update_one(
+        {"_id": result.inserted_id},
+        {"$push": {"services": str(service_result.inserted_id)}}
+    )
+    print("Initialized database with sample data!")
+
+
+MIGRATIONS = [
+    (1, "appointment indexes", create_appointment_indexes),
+    (2, "idempotency key TTL index", create_idempotency_ttl_index),
+    (3, "sample data", seed_sample_data),
+    (4, "appointment end_time index", create_archival_index),
+    (5, "per-chair booking indexes", create_chair_indexes),
+    (6, "recurring series index", create_series_index),
+    (7, "backfill salon_id/service_id on old bookings", backfill_appointment_ids),
+    (8, "covered conflict-check index", create_covered_conflict_index),
+    (9, "waitlist indexes", create_waitlist_indexes),
+    (10, "analytics rollups", create_rollup_indexes),
+    (11, "salon location index", create_salon_location_index),
+    (12, "rescheduled_at index", create_rescheduled_index),
+    (13, "chair in the covered conflict-check index", add_chair_to_conflict_index),
+    (14, "schedule a rollup rebuild with booked minutes split by hour", request_rollup_rebuild),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def default_owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def current_version(db):
+    doc = await db.migrations.find_one({"_id": "schema"})
+    return doc["version"] if doc else 0
+
+
+async def acquire_lock(db, owner, lock_id=LOCK_ID, ttl_seconds=LOCK_TTL_SECONDS):
+    """Take (or extend) a lock document unless another live owner holds it"""
+    now = datetime.now(timezone.utc)
+    try:
+        await db.locks.find_one_and_update(
+            {"_id": lock_id, "$or": [{"expires_at": {"$lt": now}}, {"owner": owner}]},
+            {"$set": {"owner": owner, "acquired_at": now, "expires_at": now + timedelta(seconds=ttl_seconds)}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        # The lock document exists and is held by someone else
+        return False
+
+
+async def release_lock(db, owner, lock_id=LOCK_ID):
+    await db.locks.delete_one({"_id": lock_id, "owner": owner})
+
+
+@asynccontextmanager
+async def lock_heartbeat(db, owner, lock_id=LOCK_ID, ttl_seconds=LOCK_TTL_SECONDS):
+    """Renew a held lock in the background until the block exits.
+
+    Renewing only between steps let a step longer than the TTL lose the lock
+    to a waiting worker, which then ran the same step concurrently.
+    """
+    async def renew():
+        while True:
+            await asyncio.sleep(ttl_seconds / 3)
+            try:
+                if not await acquire_lock(db, owner, lock_id, ttl_seconds):
+                    print(f"Warning: lost lock {lock_id} to another worker")
+            except Exception as e:
+                print(f"Warning: could not renew lock {lock_id}: {e}")
+
+    task = asyncio.create_task(renew())
+    try:
+        yield
+    finally:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+
+
+async def apply_pending(db, owner):
+    version = await current_version(db)
+    for step_version, name, step in MIGRATIONS:
+        if step_version <= version:
+            continue
+        print(f"Applying migration {step_version}: {name}")
+        await step(db)
+        await db.migrations.update_one(
+            {"_id": "schema"},
+            {"$set": {"version": step_version, "applied_by": owner, "applied_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+    return version
+
+
+async def ensure_migrated(db, owner=None, wait_timeout=None, poll_interval=0.5):
+    """Bring the database to LATEST_VERSION exactly once across all workers.
+
+    The worker that gets the lock applies pending steps while a heartbeat
+    keeps the lock alive; the others poll for as long as a live owner holds
+    it. If the leader dies its lock expires and a waiting worker takes over.
+    ``wait_timeout`` optionally caps the wait. Returns True if this process
+    ran them.
+    """
+    owner = owner or default_owner()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait_timeout if wait_timeout is not None else None
+    waiting = False
+    while True:
+        if await current_version(db) >= LATEST_VERSION:
+            return False
+        if await acquire_lock(db, owner):
+            try:
+                async with lock_heartbeat(db, owner):
+                    await apply_pending(db, owner)
+                return True
+            finally:
+                await release_lock(db, owner)
+        if not waiting:
+            holder = await db.locks.find_one({"_id": LOCK_ID})
+            print(f"Waiting for {holder['owner'] if holder else 'another worker'} to finish migrations")
+            waiting = True
+        if deadline is not None and loop.time() > deadline:
+            raise TimeoutError("Timed out waiting for another worker to finish migrations")
+        await asyncio.sleep(poll_interval)
+
+
+async def rebuild_requested_rollups(db, owner=None):
+    """Run the rollup rebuild a migration asked for, once across all workers.
+
+    Returns the number of bookings counted, or None if no rebuild was pending
+    or another worker is already running it.
+    """
+    owner = owner or default_owner()
+    if await db.migrations.find_one({"_id": ROLLUP_LOCK_ID}) is None:
+        return None
+    if not await acquire_lock(db, owner, lock_id=ROLLUP_LOCK_ID):
+        return None
+    try:
+        async with lock_heartbeat(db, owner, lock_id=ROLLUP_LOCK_ID):
+            # Another worker may have finished it before we got the lock
+            request = await db.migrations.find_one({"_id": ROLLUP_LOCK_ID})
+            if request is None:
+                return None
+            counted = await rebuild_rollups(db)
+            # A request made while we were rebuilding stays for the next run
+            await db.migrations.delete_one({"_id": ROLLUP_LOCK_ID, "requested_at": request["requested_at"]})
+    finally:
+        await release_lock(db, owner, lock_id=ROLLUP_LOCK_ID)
+    print(f"Rebuilt analytics rollups from {counted} bookings")
+    return counted
@@ -0,0 +1,122 @@
+import asyncio
+import cProfile
+import os
+import pstats
+import random
+import re
+import time
+
+
+def _route_slug(path):
+    return re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_") or "root"
+
+
+class SamplingProfilerMiddleware:
+    """ASGI middleware that runs cProfile on a sample of requests.
+
+    A request is profiled when it wins the ``sample_rate`` draw or carries
+    the debug header with ``header_token`` as its value; without a token
+    the header is ignored. Profiles are written per route under ``output_dir`` and
+    only the newest ``max_files_per_route`` are kept. With the rate at 0
+    and no header, a request costs one header scan.
+
+    cProfile follows the thread, not the coroutine, so a profile also
+    includes whatever other requests ran on the event loop while this one
+    was awaiting. Only one request is profiled at a time.
+    """
+
+    def __init__(self, app, sample_rate=0.0, header="x-debug-profile", header_token=None,
+                 output_dir="profiles", max_files_per_route=50):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.header = header.lower().encode("latin-1")
+        self.header_token = header_token
+        self.output_dir = output_dir
+        self.max_files_per_route = max_files_per_route
+        self._active = False
+
+    def _wants_profile(self, scope):
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return True
+        for name, value in scope.get("headers", ()):
+            if name == self.header:
+                return self.header_token is not None and value.decode("latin-1") == self.header_token
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._active or not self._wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        self._active = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.disable()
+            self._active = False
+            # The router stores the matched route, so /api/appointments/123 and
+            # /api/appointments/456 share one profile directory
+            route = scope.get("route")
+            path = getattr(route, "path", None) or scope.get("path", "")
+            await asyncio.to_thread(self._save, f"{scope.get('method', 'GET')}_{_route_slug(path)}", profiler)
+
+    def _save(self, route_slug, profiler):
+        try:
+            directory = os.path.join(self.output_dir, route_slug)
+            os.makedirs(directory, exist_ok=True)
+            profiler.dump_stats(os.path.join(directory, f"{time.time_ns()}.prof"))
+            files = sorted(os.listdir(directory))
+            for name in files[:-self.max_files_per_route]:
+                os.remove(os.path.join(directory, name))
+        except OSError as e:
+            print(f"Warning: could not save request profile: {e}")
+
+
+def profiled_routes(output_dir):
+    if not os.path.isdir(output_dir):
+        return {}
+    return {
+        route: len(os.listdir(os.path.join(output_dir, route)))
+        for route in sorted(os.listdir(output_dir))
+        if os.path.isdir(os.path.join(output_dir, route))
+    }
+
+
+def top_functions(output_dir, route=None, limit=20, sort="tottime"):
+    """Aggregate saved profiles (optionally for one route) into the top-N hot functions.
+
+    ``route`` must be one of :func:`profiled_routes`; anything else raises ValueError.
+    """
+    known = profiled_routes(output_dir)
+    if route and route not in known:
+        raise ValueError(f"No profiles for route {route!r}")
+    routes = [route] if route else list(known)
+    files = []
+    for name in routes:
+        directory = os.path.join(output_dir, name)
+        if os.path.isdir(directory):
+            files.extend(os.path.join(directory, f) for f in os.listdir(directory))
+    if not files:
+        return {"profiles": 0, "functions": []}
+
+    stats = pstats.Stats(files[0])
+    for path in files[1:]:
+        stats.add(path)
+
+    index = {"tottime": 2, "cumtime": 3, "calls": 1}.get(sort, 2)
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][index], reverse=True)[:limit]
+    return {
+        "profiles": len(files),
+        "total_time": round(stats.total_tt, 6),
+        "functions": [
+            {
+                "function": f"{filename}:{line}({func})",
+                "calls": calls,
+                "tottime": round(tottime, 6),
+                "cumtime": round(cumtime, 6),
+            }
+            for (filename, line, func), (_, calls, tottime, cumtime, _) in rows
+        ],
+    }
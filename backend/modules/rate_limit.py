@@ -0,0 +1,112 @@
+import math
+import time
+from collections import OrderedDict
+
+
+class TokenBuckets:
+    """One token bucket per key, refilled lazily when the key is next seen.
+
+    A bucket is just ``[tokens, last_seen]``; nothing runs in the background.
+    At most ``max_keys`` buckets are kept and the least recently used are
+    dropped, which at worst hands an idle client a full bucket again.
+    ``rate`` <= 0 disables the limit.
+    """
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def _tokens(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return self.burst
+        return min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+
+    def wait_time(self, key, now):
+        """Seconds until ``key`` has a token, 0 if it has one now"""
+        if not self.enabled:
+            return 0
+        tokens = self._tokens(key, now)
+        return 0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def take(self, key, now):
+        if not self.enabled:
+            return
+        self._buckets[key] = [self._tokens(key, now) - 1, now]
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class AdmissionController:
+    """Decides whether a DB-bound request may run, before it touches Mongo.
+
+    A request needs a token from its client's bucket and, when it names a
+    salon, from that salon's bucket, and a free slot under
+    ``max_concurrent`` requests in flight. Tokens are only taken when every
+    check passes, so a rejected request costs its client nothing. Rejections
+    return the number of seconds to wait, for the Retry-After header.
+    """
+
+    def __init__(self, client_rate, client_burst, salon_rate, salon_burst,
+                 max_concurrent=0, busy_retry_after=1):
+        self.clients = TokenBuckets(client_rate, client_burst)
+        self.salons = TokenBuckets(salon_rate, salon_burst)
+        self.max_concurrent = max_concurrent
+        self.busy_retry_after = busy_retry_after
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected_client = 0
+        self.rejected_salon = 0
+        self.rejected_busy = 0
+
+    def admit(self, client_key, salon_key=None):
+        """Return 0 and count the request in flight, or the seconds to retry after"""
+        if self.max_concurrent and self.in_flight >= self.max_concurrent:
+            self.rejected_busy += 1
+            return self.busy_retry_after
+
+        now = time.monotonic()
+        wait = self.clients.wait_time(client_key, now)
+        if wait > 0:
+            self.rejected_client += 1
+            return wait
+        if salon_key is not None:
+            wait = self.salons.wait_time(salon_key, now)
+            if wait > 0:
+                self.rejected_salon += 1
+                return wait
+            self.salons.take(salon_key, now)
+        self.clients.take(client_key, now)
+
+        self.in_flight += 1
+        self.admitted += 1
+        return 0
+
+    def release(self):
+        self.in_flight -= 1
+
+    @staticmethod
+    def retry_after_header(seconds):
+        return str(max(1, math.ceil(seconds)))
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrent": self.max_concurrent,
+            "admitted": self.admitted,
+            "rejected_client": self.rejected_client,
+            "rejected_salon": self.rejected_salon,
+            "rejected_busy": self.rejected_busy,
+            "tracked_clients": len(self.clients),
+            "tracked_salons": len(self.salons),
+        }
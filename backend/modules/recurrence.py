@@ -0,0 +1,96 @@
+import heapq
+from datetime import timedelta
+
+from dateutil.rrule import DAILY, MONTHLY, WEEKLY, rrulestr
+
+# A recurring series is stored as one rule document, e.g.
+#   {"salon_id", "service_id", "customer_name", "rrule": "FREQ=WEEKLY;INTERVAL=2",
+#    "dtstart": <naive salon-local datetime>, "duration": 30, "until": <datetime or None>,
+#    "exdates": [<skipped starts>], "status": "active"}
+# Occurrences are never written to appointments; they are expanded on the fly
+# for whatever window a conflict check or listing asks about.
+
+
+def parse_rule(rule, dtstart):
+    """Parse an RRULE string anchored at dtstart; raises ValueError if invalid"""
+    return rrulestr(rule, dtstart=dtstart)
+
+
+# Finer frequencies could expand to millions of occurrences
+ALLOWED_FREQUENCIES = {DAILY: "DAILY", WEEKLY: "WEEKLY", MONTHLY: "MONTHLY"}
+# rule_until walks COUNT rules to their end, so a series is kept finite
+MAX_COUNT = 500
+# Expanding walks a rule from its dtstart, so a series ends at most this long
+# after its first occurrence and is never expanded from further back
+MAX_SERIES_DAYS = 730
+
+
+def validate_rule(rule):
+    """Reject rules a salon booking should never need; raises ValueError"""
+    if rule._freq not in ALLOWED_FREQUENCIES:
+        raise ValueError(f"FREQ must be one of {', '.join(ALLOWED_FREQUENCIES.values())}")
+    if rule._count is not None and not 0 < rule._count <= MAX_COUNT:
+        raise ValueError(f"COUNT must be between 1 and {MAX_COUNT}")
+
+
+def rule_until(rule):
+    """Last possible occurrence start of a parsed rule, or None if unbounded"""
+    if rule._until is not None:
+        return rule._until
+    if rule._count is not None:
+        last = None
+        for last in rule:
+            pass
+        return last
+    return None
+
+
+def series_until(rule, dtstart):
+    """When a new series ends: its own UNTIL/COUNT, but no later than MAX_SERIES_DAYS"""
+    cap = dtstart + timedelta(days=MAX_SERIES_DAYS)
+    until = rule_until(rule)
+    return min(until, cap) if until is not None else cap
+
+
+def iter_occurrences(series, window_start, window_end):
+    """Yield ``(start, end)`` for occurrences overlapping [window_start, window_end)"""
+    duration = timedelta(minutes=series["duration"])
+    exdates = set(series.get("exdates", []))
+    until = series.get("until")
+    rule = parse_rule(series["rrule"], series["dtstart"])
+    # An occurrence starting up to one duration before the window still overlaps it
+    for start in rule.xafter(window_start - duration, inc=False):
+        if start >= window_end or (until is not None and start > until):
+            return
+        if start in exdates:
+            continue
+        end = start + duration
+        if end > window_start:
+            yield start, end
+
+
+def series_window_query(salon_id, window_start, window_end):
+    return {
+        "salon_id": str(salon_id),
+        "status": "active",
+        "dtstart": {"$lt": window_end},
+        "$or": [{"until": None}, {"until": {"$gte": window_start - timedelta(days=1)}}],
+    }
+
+
+async def load_occurrences(db, salon_id, window_start, window_end):
+    """Occurrences of every active series of a salon in the window, merged by start.
+
+    Returns a lazy iterator of ``(start, end, service_id)``; only the rule
+    documents are fetched.
+    """
+    series_docs = await db.appointment_series.find(
+        series_window_query(salon_id, window_start, window_end),
+        {"rrule": 1, "dtstart": 1, "duration": 1, "exdates": 1, "service_id": 1},
+    ).to_list(length=None)
+
+    def tagged(series):
+        for start, end in iter_occurrences(series, window_start, window_end):
+            yield start, end, series["service_id"]
+
+    return heapq.merge(*(tagged(series) for series in series_docs))
@@ -0,0 +1,388 @@
+import asyncio
+import json
+import smtplib
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+
+from bson import ObjectId
+
+from modules.migrations import default_owner
+from modules.timeutil import earliest_local_now, format_local, get_zone, now_local, stored_zone
+
+EPOCH = datetime(1970, 1, 1)
+# ObjectIds are made on each worker's clock; catch-up looks this much further back
+CLOCK_SKEW = timedelta(minutes=2)
+
+# Fields a reminder is rendered from
+REMINDER_PROJECTION = {
+    "customer_name": 1, "customer_email": 1, "salon": 1, "service": 1, "appointment_time": 1, "timezone": 1,
+}
+
+
+def to_minute(dt):
+    return int((dt - EPOCH).total_seconds() // 60)
+
+
+def from_minute(minute):
+    return EPOCH + timedelta(minutes=minute)
+
+
+class TimingWheel:
+    """Hierarchical timing wheel with minute resolution.
+
+    Three levels of slots: 60 one-minute slots, 24 one-hour slots and 64
+    one-day slots; anything further out waits in an overflow map. Adding or
+    removing a timer is O(1), and :meth:`advance` only touches the slots the
+    clock moves past, cascading an hour (or day) slot down a level when the
+    clock reaches it. Each timer is ``key -> (due minute, value)`` in one
+    slot; ``value`` is whatever the caller needs back when it fires.
+    """
+
+    LEVELS = [(1, 60), (60, 24), (1440, 64)]
+
+    def __init__(self, now_minute):
+        self.current = now_minute
+        self.slots = [[{} for _ in range(count)] for _, count in self.LEVELS]
+        self.overflow = {}
+        self.ready = {}
+        self.size = 0
+
+    def _place(self, key, entry):
+        due = entry[0]
+        if due <= self.current:
+            self.ready[key] = entry
+            return
+        for level, (span, count) in enumerate(self.LEVELS):
+            if due // span - self.current // span < count:
+                self.slots[level][(due // span) % count][key] = entry
+                return
+        self.overflow[key] = entry
+
+    def add(self, key, due, value=None):
+        self.remove(key, due)
+        self._place(key, (due, value))
+        self.size += 1
+
+    def remove(self, key, due):
+        """Drop a timer; ``due`` says where it can be, so no per-key index is kept"""
+        containers = [self.ready, self.overflow] + [
+            self.slots[level][(due // span) % count]
+            for level, (span, count) in enumerate(self.LEVELS)
+        ]
+        for container in containers:
+            if container.get(key, (None,))[0] == due:
+                del container[key]
+                self.size -= 1
+                return True
+        return False
+
+    def _cascade(self, level, index):
+        entries = self.slots[level][index]
+        self.slots[level][index] = {}
+        for key, entry in entries.items():
+            self._place(key, entry)
+
+    def advance(self, now_minute):
+        """Move the clock to ``now_minute`` and return ``[(key, due, value)]`` that fell due"""
+        while self.current < now_minute:
+            self.current += 1
+            minute = self.current
+            if minute % 1440 == 0:
+                if self.overflow:
+                    entries, self.overflow = self.overflow, {}
+                    for key, entry in entries.items():
+                        self._place(key, entry)
+                self._cascade(2, (minute // 1440) % 64)
+            if minute % 60 == 0:
+                self._cascade(1, (minute // 60) % 24)
+            slot = self.slots[0][minute % 60]
+            if slot:
+                self.ready.update(slot)
+                self.slots[0][minute % 60] = {}
+        due = [(key, due, value) for key, (due, value) in self.ready.items()]
+        self.ready = {}
+        self.size -= len(due)
+        return due
+
+    def items(self):
+        """Every pending ``(key, due, value)``"""
+        containers = [self.ready, self.overflow] + [slot for level in self.slots for slot in level]
+        for container in containers:
+            for key, (due, value) in container.items():
+                yield key, due, value
+
+    def __len__(self):
+        return self.size
+
+
+class FileSender:
+    """Appends reminders as JSON lines to a file; for local runs and tests"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _write(self, reminders):
+        with open(self.path, "a") as f:
+            for reminder in reminders:
+                f.write(json.dumps(reminder) + "\n")
+
+    async def send(self, reminders):
+        await asyncio.to_thread(self._write, reminders)
+        return len(reminders)
+
+
+class SmtpSender:
+    """Emails reminders over one SMTP connection per batch.
+
+    Appointments booked without an email address are never claimed for it.
+    """
+
+    requires_email = True
+
+    def __init__(self, host, port=25, from_addr="reminders@salonova.local", username=None, password=None,
+                 starttls=False):
+        self.host = host
+        self.port = port
+        self.from_addr = from_addr
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+
+    def _send_all(self, reminders):
+        sent = 0
+        with smtplib.SMTP(self.host, self.port, timeout=30) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            for reminder in reminders:
+                if not reminder.get("customer_email"):
+                    continue
+                message = EmailMessage()
+                message["From"] = self.from_addr
+                message["To"] = reminder["customer_email"]
+                message["Subject"] = f"Reminder: {reminder['service']} at {reminder['salon']}"
+                message.set_content(
+                    f"Hi {reminder['customer_name']},\n\n"
+                    f"This is a reminder of your {reminder['service']} appointment at "
+                    f"{reminder['salon']} on {reminder['appointment_time']}.\n"
+                )
+                smtp.send_message(message)
+                sent += 1
+        return sent
+
+    async def send(self, reminders):
+        return await asyncio.to_thread(self._send_all, reminders)
+
+
+class ReminderScheduler:
+    """Sends each scheduled appointment a reminder ``lead`` before it starts.
+
+    Upcoming appointments are loaded into :class:`TimingWheel` s once at
+    startup and kept current by :meth:`schedule`/:meth:`cancel` from the
+    booking hooks, so no query runs per tick unless something is due.
+    Stored times are salon-local, so there is one wheel per timezone, each
+    running on that zone's clock. Due reminders are claimed in batches with
+    a conditional update (status still scheduled, time unchanged, not yet
+    reminded), so when several workers hold the same timers each reminder
+    still goes out once. Each timer carries its appointment's start minute,
+    which stays the same when a failed send is retried later.
+    """
+
+    def __init__(self, sender, lead=timedelta(hours=2), tick_seconds=30, batch_size=500,
+                 retry_after=timedelta(minutes=5)):
+        self.sender = sender
+        self.lead_minutes = int(lead.total_seconds() // 60)
+        self.tick_seconds = tick_seconds
+        self.batch_size = batch_size
+        self.retry_minutes = int(retry_after.total_seconds() // 60)
+        self.owner = default_owner()
+        self.wheels = {}
+        self.loaded = False
+        self.synced_at = None
+        self.sent = 0
+        self.failed = 0
+        self.last_error = None
+        self._task = None
+
+    def _due(self, appointment_time):
+        return to_minute(appointment_time) - self.lead_minutes
+
+    def _wheel(self, zone):
+        wheel = self.wheels.get(zone.key)
+        if wheel is None:
+            wheel = self.wheels[zone.key] = TimingWheel(to_minute(now_local(zone)))
+        return wheel
+
+    async def load(self, db):
+        self.wheels = {}
+        self.synced_at = datetime.now(timezone.utc)
+        earliest = earliest_local_now()
+        cursor = db.appointments.find(
+            {"status": "scheduled", "appointment_time": {"$gt": earliest}, "reminder_sent_at": {"$exists": False}},
+            {"appointment_time": 1, "timezone": 1},
+            batch_size=5000,
+        )
+        async for doc in cursor:
+            wheel = self._wheel(stored_zone(doc))
+            starts = to_minute(doc["appointment_time"])
+            if starts > wheel.current:
+                # A reminder missed while no worker was running goes out on the next tick
+                wheel.add(doc["_id"], starts - self.lead_minutes, starts)
+        self.loaded = True
+        return sum(len(wheel) for wheel in self.wheels.values())
+
+    async def catch_up(self, db, since=None):
+        """Add appointments booked or rescheduled since ``since`` (default the last sync).
+
+        Picks up bookings other workers made. Timers for appointments that
+        were cancelled or moved meanwhile are left in place; the claim skips
+        them when they fire.
+        """
+        since = (since or self.synced_at) - CLOCK_SKEW
+        self.synced_at = datetime.now(timezone.utc)
+        cursor = db.appointments.find(
+            {
+                "status": "scheduled",
+                "reminder_sent_at": {"$exists": False},
+                "$or": [{"_id": {"$gte": ObjectId.from_datetime(since)}}, {"rescheduled_at": {"$gte": since}}],
+            },
+            {"appointment_time": 1, "timezone": 1},
+        )
+        added = 0
+        async for doc in cursor:
+            self.schedule(doc)
+            added += 1
+        return added
+
+    def export(self):
+        """Every pending timer as ``(zone, appointment_id, due, starts)``"""
+        for zone_key, wheel in self.wheels.items():
+            for key, due, starts in wheel.items():
+                yield zone_key, key, due, starts
+
+    def restore(self, timers, synced_at):
+        """Rebuild the wheels from :meth:`export` output instead of querying appointments"""
+        self.wheels = {}
+        for zone_key, key, due, starts in timers:
+            wheel = self._wheel(get_zone(zone_key))
+            if starts > wheel.current:
+                wheel.add(key, due, starts)
+        self.loaded = True
+        self.synced_at = synced_at
+        return sum(len(wheel) for wheel in self.wheels.values())
+
+    def schedule(self, appointment):
+        """Track a new booking; bookings made inside the lead time get no reminder"""
+        if not self.loaded or "_id" not in appointment:
+            return
+        wheel = self._wheel(stored_zone(appointment))
+        starts = to_minute(appointment["appointment_time"])
+        if starts - self.lead_minutes > wheel.current:
+            wheel.add(appointment["_id"], starts - self.lead_minutes, starts)
+
+    def cancel(self, appointment):
+        # A timer already moved for a retry stays put; its claim finds nothing to send
+        if self.loaded and "_id" in appointment:
+            wheel = self._wheel(stored_zone(appointment))
+            wheel.remove(appointment["_id"], self._due(appointment["appointment_time"]))
+
+    async def _claim(self, db, batch):
+        stamp = datetime.utcnow()
+        expected = []
+        for key, _, starts in batch:
+            starts = from_minute(starts)
+            expected.append({"_id": key, "appointment_time": {"$gte": starts, "$lt": starts + timedelta(minutes=1)}})
+        query = {"$or": expected, "status": "scheduled", "reminder_sent_at": {"$exists": False}}
+        if getattr(self.sender, "requires_email", False):
+            # Left unclaimed rather than marked as reminded
+            query["customer_email"] = {"$nin": [None, ""]}
+        result = await db.appointments.update_many(
+            query,
+            {"$set": {"reminder_sent_at": stamp, "reminder_owner": self.owner}}
+        )
+        if result.modified_count == 0:
+            return []
+        return await db.appointments.find(
+            {"_id": {"$in": [key for key, _, _ in batch]}, "reminder_owner": self.owner, "reminder_sent_at": stamp},
+            REMINDER_PROJECTION,
+        ).to_list(length=None)
+
+    async def _send(self, db, wheel, batch):
+        docs = await self._claim(db, batch)
+        if not docs:
+            return 0
+        reminders = [
+            {
+                "appointment_id": str(doc["_id"]),
+                "customer_name": doc.get("customer_name"),
+                "customer_email": doc.get("customer_email"),
+                "salon": doc.get("salon"),
+                "service": doc.get("service"),
+                "appointment_time": format_local(doc["appointment_time"], stored_zone(doc)),
+            }
+            for doc in docs
+        ]
+        try:
+            return await self.sender.send(reminders)
+        except Exception as e:
+            # Release the claim and try this batch again later
+            self.failed += len(docs)
+            self.last_error = str(e)
+            print(f"Warning: sending {len(docs)} reminders failed: {e}")
+            ids = [doc["_id"] for doc in docs]
+            await db.appointments.update_many(
+                {"_id": {"$in": ids}, "reminder_owner": self.owner},
+                {"$unset": {"reminder_sent_at": "", "reminder_owner": ""}}
+            )
+            starts = {key: start for key, _, start in batch}
+            for key in ids:
+                wheel.add(key, wheel.current + self.retry_minutes, starts[key])
+            return 0
+
+    async def dispatch_due(self, db, now=None):
+        """Send every reminder due by ``now`` (an aware datetime, default the current time)"""
+        sent = 0
+        for zone_key, wheel in list(self.wheels.items()):
+            zone = get_zone(zone_key)
+            local_now = now.astimezone(zone).replace(tzinfo=None) if now else now_local(zone)
+            due = wheel.advance(to_minute(local_now))
+            for i in range(0, len(due), self.batch_size):
+                sent += await self._send(db, wheel, due[i:i + self.batch_size])
+        self.sent += sent
+        return sent
+
+    async def _run(self, db):
+        while True:
+            try:
+                await self.dispatch_due(db)
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Warning: reminder dispatch failed: {e}")
+            await asyncio.sleep(self.tick_seconds)
+
+    async def start(self, db):
+        if self._task is None:
+            if not self.loaded:
+                pending = await self.load(db)
+                print(f"Loaded {pending} pending reminders")
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return {
+            "pending": sum(len(wheel) for wheel in self.wheels.values()),
+            "zones": len(self.wheels),
+            "synced_at": self.synced_at.isoformat() if self.synced_at else None,
+            "sent": self.sent,
+            "failed": self.failed,
+            "last_error": self.last_error,
+        }
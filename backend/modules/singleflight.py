@@ -0,0 +1,58 @@
+import asyncio
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key onto one in-flight computation.
+
+    The first caller for a key runs the coroutine; callers arriving while it
+    is still running await the same future. The key is dropped as soon as the
+    computation finishes, so nothing is served after completion and freshness
+    is the same as calling the coroutine directly.
+    """
+
+    def __init__(self):
+        self._in_flight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        self.calls += 1
+        while True:
+            future = self._in_flight.get(key)
+            if future is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The leader was cancelled (e.g. its client went away), not us:
+                # take over the computation instead of failing every waiter
+                if not future.cancelled():
+                    raise
+                self.coalesced -= 1
+
+        future = asyncio.get_running_loop().create_future()
+        # Waiters may all be gone by the time the leader fails
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._in_flight[key] = future
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._in_flight[key]
+
+    def stats(self):
+        return {
+            "in_flight": len(self._in_flight),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalescing_ratio": round(self.coalesced / self.calls, 4) if self.calls else 0.0,
+        }
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import mmap
+import os
+import struct
+import time
+from datetime import datetime, timezone
+
+import bson
+from bson import ObjectId
+
+from modules.migrations import acquire_lock, default_owner
+
+MAGIC = b"SALONOVA-SNAPSHOT\x01"
+HEADER_LENGTH = struct.Struct("<I")
+# One reminder timer: appointment ObjectId, due minute, start minute, index into the header's zones
+TIMER = struct.Struct("<12siiH")
+VERSION = 2
+LOCK_ID = "snapshot"
+
+
+def write_snapshot(path, header, sections):
+    """Write ``sections`` (name -> bytes) behind a JSON header; the file is replaced atomically"""
+    layout = {}
+    offset = 0
+    for name, data in sections.items():
+        layout[name] = [offset, len(data)]
+        offset += len(data)
+    head = json.dumps({**header, "sections": layout}).encode()
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(HEADER_LENGTH.pack(len(head)))
+        f.write(head)
+        for data in sections.values():
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return len(MAGIC) + HEADER_LENGTH.size + len(head) + offset
+
+
+class Snapshot:
+    """A snapshot file mapped read-only into memory.
+
+    Sections are decoded straight from the mapping, so restoring does not
+    read the whole file into the heap first. Use as a context manager.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} is not a snapshot file")
+        (length,) = HEADER_LENGTH.unpack_from(self._mm, len(MAGIC))
+        start = len(MAGIC) + HEADER_LENGTH.size
+        self.header = json.loads(self._mm[start:start + length])
+        self._data = start + length
+
+    def section(self, name):
+        """A memoryview of one section; release it before closing"""
+        offset, length = self.header["sections"].get(name, (0, 0))
+        return memoryview(self._mm)[self._data + offset:self._data + offset + length]
+
+    def close(self):
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SnapshotManager:
+    """Periodic snapshots of the in-process caches, and warm restore at startup.
+
+    Every ``interval_seconds`` one worker (guarded by a lock document)
+    writes the catalog cache, the salon location grid and the pending
+    reminder timers to ``path``. A starting worker maps the file, fills its
+    caches from it without touching Mongo, and then only catches up on the
+    bookings made since the snapshot. Snapshots older than
+    ``max_age_seconds`` are ignored.
+    """
+
+    def __init__(self, path, interval_seconds=300, max_age_seconds=3600):
+        self.path = path
+        self.interval_seconds = interval_seconds
+        self.max_age_seconds = max_age_seconds
+        self.owner = default_owner()
+        self.restored = None
+        self.last_saved_at = None
+        self.last_size = 0
+        self.last_error = None
+        self._task = None
+
+    async def save(self, db, catalog, locator, reminders=None):
+        salons, services = catalog.export()
+        sections = {
+            "catalog": bson.encode({"salons": salons, "services": services}),
+            "locations": bson.encode({"salons": locator.export()}),
+        }
+        header = {"version": VERSION, "taken_at": datetime.now(timezone.utc).isoformat()}
+        if reminders is not None and reminders.loaded:
+            # Include what other workers booked since this worker last looked
+            await reminders.catch_up(db)
+            zones = {}
+            timers = bytearray()
+            for zone_key, key, due, starts in reminders.export():
+                timers += TIMER.pack(key.binary, due, starts, zones.setdefault(zone_key, len(zones)))
+            sections["reminders"] = bytes(timers)
+            header["zones"] = list(zones)
+            header["reminders_synced_at"] = reminders.synced_at.isoformat()
+
+        size = await asyncio.to_thread(write_snapshot, self.path, header, sections)
+        self.last_saved_at = datetime.now(timezone.utc)
+        self.last_size = size
+        return size
+
+    def restore(self, catalog, locator, reminders=None):
+        """Load the caches from the snapshot; returns its header, or None if there was none to use"""
+        if not os.path.exists(self.path):
+            return None
+        started = time.perf_counter()
+        try:
+            with Snapshot(self.path) as snapshot:
+                header = snapshot.header
+                if header.get("version") != VERSION:
+                    print(f"Ignoring snapshot {self.path}: version {header.get('version')}")
+                    return None
+                taken_at = datetime.fromisoformat(header["taken_at"])
+                age = (datetime.now(timezone.utc) - taken_at).total_seconds()
+                if age > self.max_age_seconds:
+                    print(f"Ignoring snapshot {self.path}: {age:.0f}s old")
+                    return None
+
+                with snapshot.section("catalog") as data:
+                    cached = bson.decode(data)
+                catalog.restore(cached["salons"], cached["services"])
+                with snapshot.section("locations") as data:
+                    locator.restore(bson.decode(data)["salons"])
+
+                timers = 0
+                if reminders is not None and "reminders_synced_at" in header:
+                    zones = header["zones"]
+                    with snapshot.section("reminders") as data:
+                        timers = reminders.restore(
+                            (
+                                (zones[zone], ObjectId(key), due, starts)
+                                for key, due, starts, zone in TIMER.iter_unpack(data)
+                            ),
+                            datetime.fromisoformat(header["reminders_synced_at"]),
+                        )
+        except Exception as e:
+            # A damaged snapshot only costs a normal cold start
+            self.last_error = str(e)
+            print(f"Warning: could not restore snapshot {self.path}: {e}")
+            return None
+
+        self.restored = {
+            "taken_at": header["taken_at"],
+            "salons": len(cached["salons"]),
+            "services": len(cached["services"]),
+            "reminders": timers,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        print(f"Restored snapshot from {header['taken_at']} in {self.restored['seconds']}s")
+        return header
+
+    async def _run(self, db, catalog, locator, reminders):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                # The lock is left to expire so only one worker writes per interval
+                if await acquire_lock(db, self.owner, lock_id=LOCK_ID, ttl_seconds=max(self.interval_seconds - 1, 1)):
+                    await self.save(db, catalog, locator, reminders)
+                elif reminders is not None and reminders.loaded:
+                    await reminders.catch_up(db)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Warning: snapshot failed: {e}")
+
+    def start(self, db, catalog, locator, reminders=None):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(db, catalog, locator, reminders))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "restored": self.restored,
+            "last_saved_at": self.last_saved_at.isoformat() if self.last_saved_at else None,
+            "last_size_bytes": self.last_size,
+            "last_error": self.last_error,
+        }
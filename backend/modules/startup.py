@@ -0,0 +1,41 @@
+import time
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    """Wall-clock timings of a worker's import and startup phases.
+
+    Created before anything heavy is imported. ``mark`` closes the phase
+    running since the previous mark; ``phase`` times one block. ``ready``
+    records how long the worker took to be able to serve.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases = []
+        self.ready_seconds = None
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._last = time.perf_counter()
+            self.phases.append((name, self._last - started))
+
+    def ready(self):
+        self.ready_seconds = time.perf_counter() - self.started
+        print(f"Worker ready in {self.ready_seconds:.3f}s")
+
+    def stats(self):
+        return {
+            "phases": [{"name": name, "seconds": round(seconds, 4)} for name, seconds in self.phases],
+            "ready_seconds": round(self.ready_seconds, 4) if self.ready_seconds is not None else None,
+        }
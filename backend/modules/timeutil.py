@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Appointment times are stored as naive wall-clock times in the salon's own
+# timezone; salons without a ``timezone`` field are in India
+DEFAULT_TIMEZONE = "Asia/Kolkata"
+DISPLAY_FORMAT = "%Y-%m-%d %H:%M"
+
+
+@lru_cache(maxsize=None)
+def get_zone(name=None):
+    return ZoneInfo(name or DEFAULT_TIMEZONE)
+
+
+def salon_zone(salon):
+    return get_zone((salon or {}).get("timezone"))
+
+
+@lru_cache(maxsize=None)
+def _known_zone(name):
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return get_zone()
+
+
+def stored_zone(doc):
+    """Timezone an appointment or series was booked in; older documents only say ``IST``"""
+    name = doc.get("timezone")
+    return _known_zone(name) if name else get_zone()
+
+
+def zone_label(zone=None, at=None):
+    """Short name of ``zone`` at ``at`` (default now), e.g. ``IST``"""
+    return (at or now_local(zone)).replace(tzinfo=zone or get_zone()).tzname()
+
+
+def parse_instant(value):
+    """A client datetime (UTC ISO with ``Z`` suffix, explicit offset, or naive UTC) as an aware datetime"""
+    dt = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
+
+
+def parse_request_time(value, zone=None):
+    """A client datetime as naive wall-clock time in ``zone``"""
+    return parse_instant(value).astimezone(zone or get_zone()).replace(tzinfo=None)
+
+
+def now_local(zone=None):
+    """Current naive wall-clock time in ``zone``"""
+    return datetime.now(zone or get_zone()).replace(tzinfo=None)
+
+
+def earliest_local_now():
+    """The earliest wall-clock time any salon can have right now; no zone is more than 12 hours behind UTC"""
+    return datetime.utcnow() - timedelta(hours=12)
+
+
+def today_local(zone=None):
+    return now_local(zone).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def to_utc(local, zone=None):
+    """A stored naive wall-clock time as an aware UTC datetime"""
+    return local.replace(tzinfo=zone or get_zone()).astimezone(timezone.utc)
+
+
+def format_local(dt, zone=None):
+    """How responses show a stored time, e.g. ``2024-05-01 10:00 IST``"""
+    zone = zone or get_zone()
+    return f"{dt.strftime(DISPLAY_FORMAT)} {dt.replace(tzinfo=zone).tzname()}"
+
+
+def parse_local(value):
+    """Read back a :func:`format_local` string; the zone label is dropped"""
+    return datetime.strptime(value.rsplit(" ", 1)[0], DISPLAY_FORMAT)
+
+
+def clock_minutes(value):
+    """``"09:30"`` -> 570"""
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def minute_of_day(dt):
+    return dt.hour * 60 + dt.minute
+
+
+class BusinessHours:
+    """A salon's opening window as minutes from midnight, and its timezone.
+
+    Built once per cached salon document (see ``Catalog.business_hours``)
+    so request handlers compare integers instead of parsing
+    ``opening_time``/``closing_time`` on every call.
+    """
+
+    __slots__ = ("opening", "closing", "zone")
+
+    def __init__(self, salon):
+        self.opening = clock_minutes(salon["opening_time"])
+        self.closing = clock_minutes(salon["closing_time"])
+        self.zone = salon_zone(salon)
+
+    @property
+    def open_minutes(self):
+        return max(self.closing - self.opening, 0)
+
+    def fits(self, start_minute, duration):
+        """Whether ``duration`` minutes from ``start_minute`` stay inside opening hours"""
+        return self.opening <= start_minute and start_minute + duration <= self.closing
+
+    def contains(self, start, end):
+        start_minute = minute_of_day(start)
+        return self.fits(start_minute, int((end - start).total_seconds() // 60))
+
+    def opening_on(self, day):
+        return datetime(day.year, day.month, day.day, self.opening // 60, self.opening % 60)
+
+    def closing_on(self, day):
+        return datetime(day.year, day.month, day.day, self.closing // 60, self.closing % 60)
+
+    def now(self):
+        return now_local(self.zone)
+
+    def parse(self, value):
+        return parse_request_time(value, self.zone)
+
+    def format(self, dt):
+        return format_local(dt, self.zone)
@@ -0,0 +1,162 @@
+import heapq
+import itertools
+import time
+from datetime import timedelta
+
+from pymongo import ReturnDocument
+
+from modules.timeutil import earliest_local_now
+
+# Fields a queued entry needs to be matched against a freed interval
+ENTRY_PROJECTION = {
+    "requested_at": 1, "earliest": 1, "latest": 1, "duration": 1, "service": 1,
+}
+
+
+def waitlist_day(start):
+    return start.strftime("%Y-%m-%d")
+
+
+class Waitlist:
+    """Per salon-day priority queues of customers waiting for a slot.
+
+    Entries live in the ``waitlist`` collection; each worker keeps a heap per
+    ``(salon_id, day)`` ordered by request time, then by how narrow the
+    customer's window is, loaded from Mongo on first use and reloaded after
+    ``ttl_seconds`` to pick up entries joined on other workers. Queues for
+    days that are over in every timezone are dropped.
+
+    When a booking is cancelled, :meth:`match` pops entries in priority order
+    until one fits the freed interval. Entries that do not fit are pushed
+    back, so a match costs O(log n) per entry inspected and at most
+    ``max_scan`` entries are inspected. The winning entry is claimed with a
+    conditional update, so two workers never offer it twice. An offer does
+    not hold the slot; accepting it re-checks the salon's capacity.
+    """
+
+    def __init__(self, ttl_seconds=60, max_scan=50):
+        self.ttl_seconds = ttl_seconds
+        self.max_scan = max_scan
+        self._queues = {}
+        self._today = None
+        self._seq = itertools.count()
+        self.matches = 0
+        self.misses = 0
+        self.inspected = 0
+
+    def _item(self, entry):
+        window = (entry["latest"] - entry["earliest"]).total_seconds()
+        return (entry["requested_at"], window, next(self._seq), entry)
+
+    def _evict_past_days(self):
+        today = waitlist_day(earliest_local_now())
+        if today == self._today:
+            return
+        self._today = today
+        # Day keys are ISO dates, so they compare as strings
+        for key in [key for key in self._queues if key[1] < today]:
+            del self._queues[key]
+
+    async def _queue(self, db, salon_id, day):
+        self._evict_past_days()
+        key = (str(salon_id), day)
+        queue = self._queues.get(key)
+        if queue is not None and queue[0] > time.monotonic():
+            return queue[1]
+        entries = await db.waitlist.find(
+            {"salon_id": str(salon_id), "day": day, "status": "waiting"},
+            ENTRY_PROJECTION,
+        ).to_list(length=None)
+        heap = [self._item(entry) for entry in entries]
+        heapq.heapify(heap)
+        self._queues[key] = (time.monotonic() + self.ttl_seconds, heap)
+        return heap
+
+    async def join(self, db, entry):
+        """Store a waiting entry and queue it; returns its id"""
+        entry = dict(entry, day=waitlist_day(entry["earliest"]), status="waiting")
+        # Past the last possible start the entry is useless; the TTL index drops it
+        entry["expires_at"] = entry["latest"] + timedelta(minutes=entry["duration"])
+        # Load the queue first; loading it after the insert would already include the entry
+        heap = await self._queue(db, entry["salon_id"], entry["day"])
+        result = await db.waitlist.insert_one(entry)
+        entry["_id"] = result.inserted_id
+        heapq.heappush(heap, self._item(entry))
+        return result.inserted_id
+
+    async def requeue(self, db, entry):
+        """Put an entry whose offer lapsed back in line with its original priority"""
+        heap = await self._queue(db, entry["salon_id"], entry["day"])
+        updated = await db.waitlist.find_one_and_update(
+            {"_id": entry["_id"], "status": "offered"},
+            {"$set": {"status": "waiting"}, "$unset": {
+                "offered_time": "", "offer_expires_at": "", "freed_from": "", "freed_until": "",
+            }},
+            projection=ENTRY_PROJECTION,
+            return_document=ReturnDocument.AFTER,
+        )
+        if updated is not None:
+            heapq.heappush(heap, self._item(updated))
+
+    @staticmethod
+    def _fit(entry, free_start, free_end):
+        start = max(entry["earliest"], free_start)
+        if start > entry["latest"] or start + timedelta(minutes=entry["duration"]) > free_end:
+            return None
+        return start
+
+    async def match(self, db, salon_id, free_start, free_end, now, offer_ttl, has_room):
+        """Offer [free_start, free_end) to the first waiting entry that fits it.
+
+        ``has_room(entry, start, end)`` re-checks the salon's load for the
+        entry's service. Returns the claimed entry, or None.
+        """
+        heap = await self._queue(db, salon_id, waitlist_day(free_start))
+        skipped = []
+        claimed = None
+        try:
+            for _ in range(self.max_scan):
+                if not heap:
+                    break
+                item = heapq.heappop(heap)
+                entry = item[3]
+                self.inspected += 1
+                if entry["latest"] < now:
+                    continue
+                start = self._fit(entry, max(free_start, now), free_end)
+                end = start + timedelta(minutes=entry["duration"]) if start is not None else None
+                if start is None or not await has_room(entry, start, end):
+                    skipped.append(item)
+                    continue
+                claimed = await db.waitlist.find_one_and_update(
+                    {"_id": entry["_id"], "status": "waiting"},
+                    {"$set": {
+                        "status": "offered",
+                        "offered_time": start,
+                        "offer_expires_at": now + offer_ttl,
+                        # Passed on to the next entry if this one declines
+                        "freed_from": free_start,
+                        "freed_until": free_end,
+                    }},
+                    return_document=ReturnDocument.AFTER,
+                )
+                # None means another worker offered or removed it first
+                if claimed is not None:
+                    break
+        finally:
+            for item in skipped:
+                heapq.heappush(heap, item)
+        if claimed is None:
+            self.misses += 1
+        else:
+            self.matches += 1
+        return claimed
+
+    def stats(self):
+        return {
+            "queues": len(self._queues),
+            "queued": sum(len(queue[1]) for queue in self._queues.values()),
+            "matches": self.matches,
+            "misses": self.misses,
+            "inspected": self.inspected,
+        }
@@ -0,0 +1,109 @@
+import asyncio
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, WriteConcernError
+from pymongo.results import InsertOneResult
+
+
+class WriteBatcher:
+    """Group commit for single-document inserts.
+
+    Inserts arriving within ``max_delay_ms`` of each other (or until
+    ``max_batch`` are waiting) go to Mongo as one unordered ``insert_many``,
+    so concurrent bookings share a round trip and a journal flush. Each
+    caller still gets its own outcome: an ``InsertOneResult``, or the
+    ``DuplicateKeyError`` (or other write error) for its document only.
+    ``max_delay_ms=0`` writes every insert on its own.
+    """
+
+    def __init__(self, max_batch=64, max_delay_ms=5, write_concern=None):
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.write_concern = write_concern
+        self._pending = []
+        self._collection = None
+        self._timer = None
+        self._writes = set()
+        self.batches = 0
+        self.documents = 0
+        self.largest_batch = 0
+        self.errors = 0
+
+    def _target(self, collection):
+        if self.write_concern is None:
+            return collection
+        return collection.with_options(write_concern=self.write_concern)
+
+    async def insert_one(self, collection, doc):
+        """Insert ``doc`` as part of the next batch; all callers must use the same collection"""
+        if self.max_delay <= 0 or self.max_batch <= 1:
+            return await self._target(collection).insert_one(doc)
+        # Known up front, so results can be handed out per document
+        doc.setdefault("_id", ObjectId())
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((doc, future))
+        self._collection = collection
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._write(self._collection, batch))
+            # Keep a reference until the write finishes
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
+
+    async def _write(self, collection, batch):
+        self.batches += 1
+        self.documents += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        failed = {}
+        concern_error = None
+        try:
+            await self._target(collection).insert_many([doc for doc, _ in batch], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                if error.get("code") == 11000:
+                    failed[error["index"]] = DuplicateKeyError(error.get("errmsg"), 11000, error)
+                else:
+                    failed[error["index"]] = OperationFailure(error.get("errmsg"), error.get("code"), error)
+            concern_errors = e.details.get("writeConcernErrors", [])
+            if concern_errors:
+                concern_error = WriteConcernError(
+                    concern_errors[0].get("errmsg"), concern_errors[0].get("code"), concern_errors[0]
+                )
+        except Exception as e:
+            # Nothing is known about any document in the batch
+            self.errors += len(batch)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.errors += len(failed)
+        for index, (doc, future) in enumerate(batch):
+            if future.done():
+                continue
+            error = failed.get(index) or concern_error
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(InsertOneResult(doc["_id"], True))
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "documents": self.documents,
+            "average_batch": round(self.documents / self.batches, 2) if self.batches else 0,
+            "largest_batch": self.largest_batch,
+            "errors": self.errors,
+            "max_batch": self.max_batch,
+            "max_delay_ms": self.max_delay * 1000,
+        }
@@ -0,0 +1,22 @@
+from datetime import datetime
+
+from modules.analytics import booking_increments, hour_spans
+
+
+def test_minutes_are_split_over_the_hours_a_booking_covers():
+    spans = list(hour_spans(datetime(2026, 3, 2, 10, 0), datetime(2026, 3, 2, 11, 30)))
+    assert spans == [(datetime(2026, 3, 2, 10), 60), (datetime(2026, 3, 2, 11), 30)]
+
+
+def test_booking_counts_once_in_its_start_hour():
+    increments = booking_increments(
+        "s1", "v1", datetime(2026, 3, 2, 23, 45), datetime(2026, 3, 3, 0, 15), bookings=2, revenue=80
+    )
+    late = increments[("rollups_hourly", "s1:2026-03-02T23")][1]
+    early = increments[("rollups_hourly", "s1:2026-03-03T00")][1]
+    assert late == {"booked_minutes": 30, "bookings": 2, "revenue": 80}
+    assert early == {"booked_minutes": 30, "bookings": 0, "revenue": 0}
+    summary = increments[("salon_analytics", "s1")][1]
+    assert summary["booked_minutes"] == 60
+    assert summary["heatmap.mon.23.booked_minutes"] == 30
+    assert summary["heatmap.tue.00.booked_minutes"] == 30
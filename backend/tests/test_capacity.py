@@ -0,0 +1,52 @@
+from datetime import date
+
+from modules.capacity import LoadProfile, PackageChecker, SlotChecker
+
+
+def minute(clock):
+    hours, minutes = clock.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def checker(held, limit):
+    intervals = [(start, end) for start, end, _ in held]
+    return SlotChecker(date(2026, 1, 5), LoadProfile(intervals, held), limit)
+
+
+def test_max_load_counts_overlapping_bookings():
+    profile = LoadProfile([(minute("10:00"), minute("10:30")), (minute("10:20"), minute("10:40"))])
+    assert profile.max_load(minute("10:00"), minute("10:20")) == 1
+    assert profile.max_load(minute("10:00"), minute("10:30")) == 2
+    assert profile.max_load(minute("10:40"), minute("11:00")) == 0
+
+
+def test_chair_is_lowest_one_free_over_the_booking():
+    x = (minute("10:20"), minute("10:40"), 0)
+    slots = checker([x], limit=3)
+    a_start, a_end = minute("10:00"), minute("10:30")
+    assert slots.fits(a_start, a_end)
+    a = (a_start, a_end, slots.chair(a_start, a_end))
+    assert a[2] == 1
+
+    # C overlaps only A, so chair 0 is free even though the load under C is 1
+    slots = checker([x, a], limit=3)
+    c_start, c_end = minute("10:00"), minute("10:10")
+    assert slots.fits(c_start, c_end)
+    assert slots.chair(c_start, c_end) == 0
+
+
+def test_chair_skips_every_chair_held_in_the_window():
+    held = [(minute("10:00"), minute("11:00"), 0), (minute("10:30"), minute("11:30"), 2)]
+    slots = checker(held, limit=4)
+    assert slots.chair(minute("10:15"), minute("10:45")) == 1
+    assert slots.chair(minute("11:00"), minute("11:15")) == 0
+
+
+def test_package_keeps_one_free_chair_for_all_legs():
+    held = [(minute("10:00"), minute("10:30"), 0), (minute("10:45"), minute("11:15"), 1)]
+    intervals = [(start, end) for start, end, _ in held]
+    legs = [(0, 30, LoadProfile([]), None), (30, 30, LoadProfile([]), None)]
+    package = PackageChecker(date(2026, 1, 5), LoadProfile(intervals, held), 3, legs)
+    assert package.fits_package(minute("10:00"))
+    assert package.chairs(minute("10:00")) == [2, 2]
+    assert package.chairs(minute("11:15")) == [0, 0]
@@ -0,0 +1,49 @@
+import asyncio
+
+from modules.idempotency import IdempotencyCache
+
+
+def test_waiters_rerun_an_uncacheable_result_one_at_a_time():
+    async def scenario():
+        cache = IdempotencyCache()
+        running = 0
+        calls = []
+
+        async def compute():
+            nonlocal running
+            running += 1
+            assert running == 1
+            calls.append(len(calls))
+            await asyncio.sleep(0.01)
+            running -= 1
+            # The first attempt fails transiently; the retry succeeds
+            return {"status": "error" if len(calls) == 1 else "success"}
+
+        results = await asyncio.gather(*[
+            cache.execute("k", "fp", compute, cacheable=lambda r: r["status"] == "success")
+            for _ in range(5)
+        ])
+        assert len(calls) == 2
+        assert results[0] == ({"status": "error"}, False)
+        assert sorted(replayed for _, replayed in results[1:]) == [False, True, True, True]
+        assert cache.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_requests_share_one_result():
+    async def scenario():
+        cache = IdempotencyCache()
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {"status": "success"}
+
+        results = await asyncio.gather(*[cache.execute("k", "fp", compute) for _ in range(5)])
+        assert calls == 1
+        assert [replayed for _, replayed in results] == [False, True, True, True, True]
+
+    asyncio.run(scenario())
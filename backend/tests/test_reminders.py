@@ -0,0 +1,156 @@
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+from modules.reminders import ReminderScheduler, TimingWheel, to_minute
+from modules.timeutil import get_zone
+
+ZONE = get_zone("Asia/Kolkata")
+
+
+def test_wheel_fires_each_timer_once_at_its_minute():
+    rng = random.Random(7)
+    wheel = TimingWheel(0)
+    timers = {i: rng.randrange(1, 200 * 1440) for i in range(2000)}
+    for key, due in timers.items():
+        wheel.add(key, due, key * 10)
+    removed = set(range(0, 2000, 7))
+    for key in removed:
+        assert wheel.remove(key, timers[key])
+    assert len(wheel) == len(timers) - len(removed)
+
+    fired = {}
+    minute = 0
+    while minute < 200 * 1440:
+        minute += rng.randrange(1, 300)
+        for key, due, value in wheel.advance(minute):
+            assert key not in fired
+            assert due <= minute
+            assert value == key * 10
+            fired[key] = minute
+    assert fired.keys() == timers.keys() - removed
+    assert len(wheel) == 0
+
+
+def test_wheel_keeps_value_when_a_timer_is_moved():
+    wheel = TimingWheel(100)
+    wheel.add("a", 110, 230)
+    assert wheel.advance(110) == [("a", 110, 230)]
+    wheel.add("a", 115, 230)
+    assert wheel.advance(114) == []
+    assert list(wheel.items()) == [("a", 115, 230)]
+    assert wheel.advance(115) == [("a", 115, 230)]
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length=None):
+        return self.docs
+
+
+class FakeAppointments:
+    """The slice of a Motor collection the reminder claim uses"""
+
+    def __init__(self, docs):
+        self.docs = {doc["_id"]: doc for doc in docs}
+
+    def _claimable(self, doc, query):
+        if doc["status"] != query["status"] or "reminder_sent_at" in doc:
+            return False
+        if "customer_email" in query and doc.get("customer_email") in query["customer_email"]["$nin"]:
+            return False
+        return any(
+            doc["_id"] == option["_id"]
+            and option["appointment_time"]["$gte"] <= doc["appointment_time"] < option["appointment_time"]["$lt"]
+            for option in query["$or"]
+        )
+
+    async def update_many(self, query, update):
+        if "$or" in query:
+            matched = [doc for doc in self.docs.values() if self._claimable(doc, query)]
+            for doc in matched:
+                doc.update(update["$set"])
+        else:
+            matched = [self.docs[key] for key in query["_id"]["$in"]]
+            for doc in matched:
+                for field in update["$unset"]:
+                    doc.pop(field, None)
+
+        class Result:
+            modified_count = len(matched)
+        return Result()
+
+    def find(self, query, projection=None):
+        return FakeCursor([
+            dict(doc) for key, doc in self.docs.items()
+            if key in query["_id"]["$in"] and doc.get("reminder_sent_at") == query["reminder_sent_at"]
+        ])
+
+
+class FakeDb:
+    def __init__(self, docs):
+        self.appointments = FakeAppointments(docs)
+
+
+class FlakySender:
+    def __init__(self, failures):
+        self.failures = failures
+        self.sent = []
+
+    async def send(self, reminders):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("smtp down")
+        self.sent.extend(reminders)
+        return len(reminders)
+
+
+def test_failed_reminder_is_claimed_again_on_retry():
+    now = datetime(2026, 3, 2, 8, 0, tzinfo=timezone.utc)
+    local_now = now.astimezone(ZONE).replace(tzinfo=None)
+    appointment = {
+        "_id": ObjectId(), "status": "scheduled", "customer_name": "Asha", "customer_email": "asha@example.com",
+        "salon": "Elegant Cuts", "service": "Haircut", "timezone": "Asia/Kolkata",
+        "appointment_time": local_now.replace(second=0, microsecond=0) + timedelta(hours=3),
+    }
+    db = FakeDb([appointment])
+    sender = FlakySender(failures=1)
+    reminders = ReminderScheduler(sender, lead=timedelta(hours=2), retry_after=timedelta(minutes=5))
+    reminders.loaded = True
+    reminders._wheel(ZONE).current = to_minute(local_now)
+    reminders.schedule(appointment)
+
+    due_at = now + timedelta(hours=1)
+    assert asyncio.run(reminders.dispatch_due(db, due_at)) == 0
+    assert reminders.failed == 1
+    assert "reminder_sent_at" not in appointment
+
+    assert asyncio.run(reminders.dispatch_due(db, due_at + timedelta(minutes=4))) == 0
+    assert asyncio.run(reminders.dispatch_due(db, due_at + timedelta(minutes=5))) == 1
+    assert [r["appointment_id"] for r in sender.sent] == [str(appointment["_id"])]
+    assert "reminder_sent_at" in appointment
+
+
+def test_reminders_without_an_email_are_not_claimed_for_smtp():
+    now = datetime(2026, 3, 2, 8, 0, tzinfo=timezone.utc)
+    local_now = now.astimezone(ZONE).replace(tzinfo=None)
+    appointment = {
+        "_id": ObjectId(), "status": "scheduled", "customer_name": "Ravi", "customer_email": None,
+        "salon": "Elegant Cuts", "service": "Haircut", "timezone": "Asia/Kolkata",
+        "appointment_time": local_now.replace(second=0, microsecond=0) + timedelta(hours=3),
+    }
+    db = FakeDb([appointment])
+    sender = FlakySender(failures=0)
+    sender.requires_email = True
+    reminders = ReminderScheduler(sender, lead=timedelta(hours=2))
+    reminders.loaded = True
+    reminders._wheel(ZONE).current = to_minute(local_now)
+    reminders.schedule(appointment)
+
+    assert asyncio.run(reminders.dispatch_due(db, now + timedelta(hours=1))) == 0
+    assert sender.sent == []
+    assert "reminder_sent_at" not in appointment